@@ -1,7 +1,20 @@
 import os
-from flask import Flask
+from datetime import timedelta
+from flask import Flask, request
+from flask.globals import request_ctx
 from werkzeug.middleware.proxy_fix import ProxyFix
 from extensions import db, bcrypt, login_manager, csrf
+from services.assets import init_assets, is_fingerprinted_request, IMMUTABLE_MAX_AGE
+from services.health import ProbeSessionInterface
+from services.user_cache import init_user_cache, get_session_user
+from services.sessions import init_sessions
+from services.rate_limit import init_rate_limits
+from services.statistics_cache import init_statistics_cache
+from services.sla import format_duration
+from services.uploads import init_uploads
+
+# pg_advisory_lock key guarding run_migrations()
+MIGRATION_LOCK_ID = 730481
 
 def migrate_add_topic_color():
     from sqlalchemy import text, inspect
@@ -12,7 +25,6 @@ def migrate_add_topic_color():
             columns = [col['name'] for col in inspector.get_columns('topics')]
             if 'color' not in columns:
                 db.session.execute(text("ALTER TABLE topics ADD COLUMN color VARCHAR(7) DEFAULT '#40916c'"))
-                db.session.execute(text("UPDATE topics SET color = '#40916c' WHERE color IS NULL"))
                 db.session.commit()
                 print('Migration: Added color column to topics table')
     except Exception as e:
@@ -55,17 +67,12 @@ def migrate_add_reply_fields():
             db.session.execute(text("ALTER TABLE requests ADD COLUMN replied_at TIMESTAMP"))
             db.session.commit()
             print('Migration: Added replied_at column to requests')
-        
-        db.session.execute(text("UPDATE requests SET status = 'under_review' WHERE status IN ('new', 'in_progress', 'rejected')"))
-        db.session.commit()
     except Exception as e:
         db.session.rollback()
         print(f'Migration reply fields: {e}')
 
 def migrate_add_reg_number():
     from sqlalchemy import inspect, text
-    from models import Request
-    from datetime import datetime
     try:
         inspector = inspect(db.engine)
         tables = inspector.get_table_names()
@@ -77,19 +84,6 @@ def migrate_add_reg_number():
             db.session.execute(text("ALTER TABLE requests ADD COLUMN reg_number VARCHAR(20) UNIQUE"))
             db.session.commit()
             print('Migration: Added reg_number column to requests')
-        
-        requests_without_reg = Request.query.filter(Request.reg_number.is_(None)).order_by(Request.id).all()
-        for req in requests_without_reg:
-            year = req.created_at.year if req.created_at else datetime.now().year
-            count = Request.query.filter(
-                Request.reg_number.like(f'NAZ-{year}-%'),
-                Request.id < req.id
-            ).count() + 1
-            req.reg_number = f'NAZ-{year}-{count:04d}'
-        
-        if requests_without_reg:
-            db.session.commit()
-            print(f'Migration: Generated reg_numbers for {len(requests_without_reg)} existing requests')
     except Exception as e:
         db.session.rollback()
         print(f'Migration reg_number: {e}')
@@ -111,6 +105,202 @@ def migrate_add_document_number():
         db.session.rollback()
         print(f'Migration document_number: {e}')
 
+def migrate_add_media_fields():
+    from sqlalchemy import inspect, text
+    try:
+        inspector = inspect(db.engine)
+        tables = inspector.get_table_names()
+        if 'requests' not in tables:
+            return
+        columns = [col['name'] for col in inspector.get_columns('requests')]
+        
+        new_columns = {
+            'media_web': 'VARCHAR(255)',
+            'media_poster': 'VARCHAR(255)',
+            'media_duration': 'FLOAT',
+            'media_width': 'INTEGER',
+            'media_height': 'INTEGER'
+        }
+        for name, column_type in new_columns.items():
+            if name not in columns:
+                db.session.execute(text(f"ALTER TABLE requests ADD COLUMN {name} {column_type}"))
+                db.session.commit()
+                print(f'Migration: Added {name} column to requests')
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration media fields: {e}')
+
+def migrate_add_idempotency_key():
+    from sqlalchemy import inspect, text
+    try:
+        inspector = inspect(db.engine)
+        tables = inspector.get_table_names()
+        if 'requests' not in tables:
+            return
+        columns = [col['name'] for col in inspector.get_columns('requests')]
+        
+        if 'idempotency_key' not in columns:
+            db.session.execute(text("ALTER TABLE requests ADD COLUMN idempotency_key VARCHAR(64)"))
+            db.session.commit()
+            print('Migration: Added idempotency_key column to requests')
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration idempotency_key: {e}')
+
+def migrate_idempotency_key_per_user():
+    from sqlalchemy import text
+    try:
+        # Replace the table-wide unique key by one per worker
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("ALTER TABLE requests DROP CONSTRAINT IF EXISTS requests_idempotency_key_key"))
+        db.session.execute(text("DROP INDEX IF EXISTS ix_requests_idempotency_key"))
+        db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_requests_user_idempotency_key ON requests (user_id, idempotency_key)"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration idempotency_key per user: {e}')
+
+def migrate_add_updated_at():
+    from sqlalchemy import inspect, text
+    try:
+        inspector = inspect(db.engine)
+        tables = inspector.get_table_names()
+        if 'requests' not in tables:
+            return
+        columns = [col['name'] for col in inspector.get_columns('requests')]
+        
+        if 'updated_at' not in columns:
+            db.session.execute(text("ALTER TABLE requests ADD COLUMN updated_at TIMESTAMP"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_requests_user_updated ON requests (user_id, updated_at, id)"))
+            db.session.commit()
+            print('Migration: Added updated_at column to requests')
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration updated_at: {e}')
+
+def migrate_add_media_filename_index():
+    from sqlalchemy import text
+    try:
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_requests_media_filename ON requests (media_filename)"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration media_filename index: {e}')
+
+def migrate_add_created_at_index():
+    from sqlalchemy import text
+    try:
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_requests_created_at ON requests (created_at)"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration created_at index: {e}')
+
+def migrate_add_request_media():
+    from models import Request, RequestMedia
+    from services.media import get_media_kind, get_media_path
+    try:
+        legacy = Request.query.filter(Request.media_filename.isnot(None), ~Request.attachments.any()).all()
+        for req in legacy:
+            path = get_media_path(req.media_filename)
+            db.session.add(RequestMedia(
+                request_id=req.id,
+                kind=get_media_kind(req.media_filename),
+                filename=req.media_filename,
+                size=os.path.getsize(path) if os.path.exists(path) else None,
+                width=req.media_width,
+                height=req.media_height,
+                duration=req.media_duration,
+                web=req.media_web,
+                poster=req.media_poster,
+                created_at=req.created_at
+            ))
+        if legacy:
+            db.session.commit()
+            print(f'Migration: Moved attachments of {len(legacy)} requests to request_media')
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration request_media: {e}')
+
+# Data backfills run on start (after the schema is current, under the same lock)
+# until they have succeeded once; run_data_migrations then records them in
+# data_versions, so later starts skip their table scans. Each only touches rows
+# still missing their data and returns True when it got through; one that failed
+# is simply run again on the next start.
+
+def backfill_topic_color():
+    from sqlalchemy import text
+    try:
+        if db.session.execute(text("UPDATE topics SET color = '#40916c' WHERE color IS NULL")).rowcount:
+            print('Migration: Set the default color of topics without one')
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration topic color: {e}')
+
+def backfill_request_status():
+    from sqlalchemy import text
+    try:
+        db.session.execute(text("UPDATE requests SET status = 'under_review' WHERE status IN ('new', 'in_progress', 'rejected')"))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration request status: {e}')
+
+def backfill_updated_at():
+    from sqlalchemy import text
+    try:
+        # The latest of created_at, admin_read_at and replied_at
+        updated = db.session.execute(text("""
+            UPDATE requests SET updated_at = CASE
+                WHEN replied_at > created_at AND (admin_read_at IS NULL OR replied_at > admin_read_at) THEN replied_at
+                WHEN admin_read_at > created_at THEN admin_read_at
+                ELSE created_at
+            END
+            WHERE updated_at IS NULL
+        """)).rowcount
+        db.session.commit()
+        if updated:
+            print(f'Migration: Set updated_at of {updated} requests')
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration updated_at backfill: {e}')
+
+def backfill_reg_numbers():
+    from models import Request
+    from datetime import datetime
+    try:
+        requests_without_reg = Request.query.filter(Request.reg_number.is_(None)).order_by(Request.id).all()
+        for req in requests_without_reg:
+            year = req.created_at.year if req.created_at else datetime.now().year
+            count = Request.query.filter(
+                Request.reg_number.like(f'NAZ-{year}-%'),
+                Request.id < req.id
+            ).count() + 1
+            req.reg_number = f'NAZ-{year}-{count:04d}'
+        
+        if requests_without_reg:
+            db.session.commit()
+            print(f'Migration: Generated reg_numbers for {len(requests_without_reg)} existing requests')
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f'Migration reg_number: {e}')
+
+def run_data_migrations():
+    from models import DataVersion
+    finished = {name for name, in db.session.query(DataVersion.name).filter(DataVersion.name.like('backfill:%'))}
+    for backfill in (backfill_topic_color, backfill_request_status, backfill_updated_at,
+                     migrate_add_request_media, backfill_reg_numbers):
+        name = f'backfill:{backfill.__name__}'
+        if name not in finished and backfill():
+            db.session.add(DataVersion(name=name, version=1))
+            db.session.commit()
+
 def create_default_admin():
     from models import User
     admin = User.query.filter_by(username='admin').first()
@@ -124,12 +314,85 @@ def create_default_admin():
         db.session.commit()
         print('Default admin created: username=admin, password=admin123')
 
+def migrate_uploads_folder():
+    """Move media out of static/uploads, where the static route served it without login."""
+    import shutil
+    from flask import current_app
+    legacy = os.path.join(current_app.root_path, 'static', 'uploads')
+    target = current_app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(legacy) or os.path.realpath(legacy) == os.path.realpath(target):
+        return
+    moved = 0
+    for name in os.listdir(legacy):
+        destination = os.path.join(target, name)
+        # Uploaded names are unique; a file already in place is the same one
+        if not os.path.exists(destination):
+            shutil.move(os.path.join(legacy, name), destination)
+            moved += 1
+    if moved:
+        print(f'Moved {moved} uploaded file(s) to {target}')
+    try:
+        os.rmdir(legacy)
+    except OSError:
+        print(f'{legacy} is not empty; files left there are no longer served')
+
+def schema_is_current():
+    """True when every model table, column and index already exists in the database."""
+    from sqlalchemy import inspect
+    import models
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            return False
+        columns = {col['name'] for col in inspector.get_columns(table.name)}
+        if not columns.issuperset(table.columns.keys()):
+            return False
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        if not indexes.issuperset(index.name for index in table.indexes):
+            return False
+    return True
+
+def run_migrations():
+    """Create and upgrade the schema; workers and instances starting together take turns."""
+    from sqlalchemy import text
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        lock = db.engine.connect()
+        lock.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+    try:
+        # Usual cold start: one reflection pass instead of every migration probe
+        if not schema_is_current():
+            db.create_all()
+            migrate_add_topic_color()
+            migrate_add_user_full_name()
+            migrate_nullable_user_id()
+            migrate_add_reply_fields()
+            migrate_add_media_fields()
+            migrate_add_idempotency_key()
+            migrate_idempotency_key_per_user()
+            migrate_add_updated_at()
+            migrate_add_media_filename_index()
+            migrate_add_created_at_index()
+            migrate_add_reg_number()
+            migrate_add_document_number()
+        run_data_migrations()
+        migrate_uploads_folder()
+        create_default_admin()
+    finally:
+        db.session.remove()
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+            lock.close()
+    # With preload_app the workers are forked afterwards and must not share these connections
+    db.engine.dispose()
+
 def create_app():
     app = Flask(__name__)
+    app.session_interface = ProbeSessionInterface()
     
     app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
     
-    basedir = os.path.abspath(os.path.dirname(__file__))
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
@@ -137,58 +400,182 @@ def create_app():
         'pool_pre_ping': True
     }
     
-    app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'static', 'uploads')
+    # Outside static/: attachments and avatars are only sent by the login-checked routes
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(app.instance_path, 'uploads'))
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'mp4', 'mov', 'avi', 'webm', 'pdf', 'doc', 'docx'}
     
+    # Longest side of uploaded photos; create_request.html resizes in the browser and
+    # the server downscales anything larger that still gets through.
+    app.config['IMAGE_UPLOAD_MAX_DIMENSION'] = int(os.environ.get('IMAGE_UPLOAD_MAX_DIMENSION', 1920))
+    
+    # Files per protocol and the longest side of the JPEG rendition of each photo
+    # shown in galleries and embedded in DOCX protocols.
+    app.config['MAX_ATTACHMENTS'] = int(os.environ.get('MAX_ATTACHMENTS', 10))
+    app.config['IMAGE_RENDITION_MAX_DIMENSION'] = int(os.environ.get('IMAGE_RENDITION_MAX_DIMENSION', 800))
+    
+    # Per-type upload limits, enforced while the body streams in (services/uploads.py);
+    # MAX_CONTENT_LENGTH stays the cap for the whole request.
+    app.config['UPLOAD_SIZE_LIMITS'] = {
+        'image': int(os.environ.get('UPLOAD_MAX_IMAGE_MB', 15)) * 1024 * 1024,
+        'video': int(os.environ.get('UPLOAD_MAX_VIDEO_MB', 50)) * 1024 * 1024,
+        'document': int(os.environ.get('UPLOAD_MAX_DOCUMENT_MB', 20)) * 1024 * 1024
+    }
+    
+    # Hand media transfers off to the front proxy, e.g. MEDIA_ACCEL_REDIRECT=/protected-uploads/
+    # for nginx (internal location aliased to UPLOAD_FOLDER) or USE_X_SENDFILE=1 for Apache/lighttpd.
+    app.config['MEDIA_ACCEL_REDIRECT'] = os.environ.get('MEDIA_ACCEL_REDIRECT')
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+    
+    # Background video transcoding (requires ffmpeg/ffprobe on PATH)
+    app.config['MEDIA_PIPELINE_ENABLED'] = os.environ.get('MEDIA_PIPELINE_ENABLED', '1') == '1'
+    app.config['MEDIA_PIPELINE_WORKERS'] = int(os.environ.get('MEDIA_PIPELINE_WORKERS', 1))
+    app.config['MEDIA_VIDEO_MAX_HEIGHT'] = 720
+    app.config['MEDIA_VIDEO_BITRATE_KBPS'] = 1500
+    app.config['MEDIA_AUDIO_BITRATE_KBPS'] = 96
+    app.config['MEDIA_POSTER_MAX_HEIGHT'] = 480
+    
+    # Bulk protocol export (ZIP of DOCX): render processes per job, and how long the
+    # finished archives stay in EXPORT_FOLDER
+    app.config['EXPORT_FOLDER'] = os.environ.get('EXPORT_FOLDER', os.path.join(app.instance_path, 'exports'))
+    app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', os.cpu_count() or 1))
+    app.config['EXPORT_TTL'] = int(os.environ.get('EXPORT_TTL', 3600))
+    # A job that has not updated its status for this long is reported as failed
+    app.config['EXPORT_STALE_SECONDS'] = 120
+    # PDF exports are kept by content hash and reused until unused for PDF_CACHE_TTL seconds
+    app.config['PDF_CACHE_FOLDER'] = os.environ.get('PDF_CACHE_FOLDER', os.path.join(app.instance_path, 'pdf_cache'))
+    app.config['PDF_CACHE_TTL'] = int(os.environ.get('PDF_CACHE_TTL', 7 * 24 * 3600))
+    
+    # Pages the service worker serves stale-while-revalidate (see static/js/sw.js)
+    app.config['SWR_ENDPOINTS'] = {'user.dashboard', 'user.create_request'}
+    
+    # Live admin updates over /admin/events: 'auto' uses PostgreSQL LISTEN/NOTIFY when
+    # available so all workers see each event, otherwise events stay in-process.
+    app.config['EVENTS_BACKEND'] = os.environ.get('EVENTS_BACKEND', 'auto')
+    app.config['EVENTS_KEEPALIVE_SECONDS'] = 15
+    # Each open stream pins a gthread thread (a greenlet under gevent); past this many per
+    # worker new streams get 503 and retry later, so the rest stay free for requests
+    if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+        default_streams = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200)) // 2
+    else:
+        default_streams = max(int(os.environ.get('GUNICORN_THREADS', 8)) // 2, 1)
+    app.config['EVENTS_MAX_STREAMS'] = int(os.environ.get('EVENTS_MAX_STREAMS', default_streams))
+    app.config['EVENTS_RETRY_SECONDS'] = 30
+    
+    # /readyz: results are shared by all probes for this long; the DB ping gives up after
+    # READINESS_DB_TIMEOUT seconds (e.g. when the connection pool is exhausted)
+    app.config['READINESS_CACHE_SECONDS'] = float(os.environ.get('READINESS_CACHE_SECONDS', 5))
+    app.config['READINESS_DB_TIMEOUT'] = float(os.environ.get('READINESS_DB_TIMEOUT', 2))
+    app.config['READINESS_MAX_MEDIA_BACKLOG'] = int(os.environ.get('READINESS_MAX_MEDIA_BACKLOG', 50))
+    
+    # Password hashing policy (services/passwords.py); stored hashes made with other
+    # parameters are upgraded on the next login. argon2 needs argon2-cffi.
+    app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['ARGON2_TIME_COST'] = int(os.environ.get('ARGON2_TIME_COST', 2))
+    app.config['ARGON2_MEMORY_COST'] = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+    app.config['ARGON2_PARALLELISM'] = int(os.environ.get('ARGON2_PARALLELISM', 1))
+    # Hashes computed at once per process, and how many logins may wait for one
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 32
+    app.config['PASSWORD_HASH_WAIT_SECONDS'] = 10
+    # Longest wait for one hash before the login is answered as busy
+    app.config['PASSWORD_HASH_TIMEOUT_SECONDS'] = 30
+    
+    # current_user snapshots kept in memory; other workers see user edits after the TTL
+    app.config['USER_CACHE_SIZE'] = 1024
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+    
+    # Session storage: 'cookie' (signed cookie), 'database' or 'filesystem'. The server-side
+    # backends keep only a session id in the cookie and let admins revoke a user's sessions.
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'cookie')
+    app.config['SESSION_FILE_DIR'] = os.environ.get('SESSION_FILE_DIR', os.path.join(app.instance_path, 'sessions'))
+    app.config['SESSION_SWEEP_INTERVAL'] = 3600
+    app.config['SESSION_REFRESH_INTERVAL'] = timedelta(hours=1)
+    
+    # Token buckets for logins and new protocols: (capacity, refill per minute).
+    # 'memory' limits each worker separately, 'database' shares the buckets.
+    # Successful logins are refunded, so the login buckets count failed attempts:
+    # login_ip leaves room for a whole shift mistyping behind one NAT address,
+    # login_username (per username and address) stops guessing one password.
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    app.config['RATE_LIMITS'] = {
+        'login_ip': (int(os.environ.get('RATE_LIMIT_LOGIN_IP', 100)), 30),
+        'login_username': (5, 2),
+        'create_ip': (60, 30),
+        'create_user': (20, 10)
+    }
+    
+    # Statistics results, reused until requests, topics or users change (versions are
+    # shared through data_versions). 'memory' keeps results per worker, 'database' shares them.
+    app.config['STATS_CACHE_BACKEND'] = os.environ.get('STATS_CACHE_BACKEND', 'memory')
+    app.config['STATS_CACHE_SIZE'] = 256
+    app.config['STATS_CACHE_TTL'] = int(os.environ.get('STATS_CACHE_TTL', 300))
+    
+    # Days of the statistics filters and chart are those of this timezone (created_at is UTC);
+    # longer ranges are charted by week or month to stay within the point limit
+    app.config['ORG_TIMEZONE'] = os.environ.get('ORG_TIMEZONE', 'Asia/Dushanbe')
+    app.config['HISTOGRAM_MAX_POINTS'] = int(os.environ.get('HISTOGRAM_MAX_POINTS', 60))
+    
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
     db.init_app(app)
+    init_sessions(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    init_rate_limits(app)
+    init_uploads(app)
     csrf.init_app(app)
     
-    from models import User
+    init_user_cache(app)
+    init_statistics_cache(app)
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return get_session_user(int(user_id))
     
     from routes.auth import auth_bp
     from routes.admin import admin_bp
     from routes.user import user_bp
     from routes.main import main_bp
+    from routes.api import api_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(user_bp, url_prefix='/user')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    
+    init_assets(app)
+    app.jinja_env.filters['duration'] = format_duration
     
     @app.after_request
     def add_cache_control(response):
-        if 'text/html' in response.content_type:
+        if is_fingerprinted_request():
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        elif 'text/html' in response.content_type:
             response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '0'
+            # Pages that showed flash messages are not worth keeping in the SW cache
+            if request.endpoint in app.config['SWR_ENDPOINTS'] and response.status_code == 200 \
+                    and not request_ctx.flashes:
+                response.headers['X-Page-Cache'] = 'swr'
         elif 'text/css' in response.content_type or 'application/javascript' in response.content_type:
             response.headers['Cache-Control'] = 'no-cache, must-revalidate'
         return response
     
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    # x_for: the client address behind the proxy, used by the rate limits
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
     
     with app.app_context():
-        db.create_all()
-        migrate_add_topic_color()
-        migrate_add_user_full_name()
-        migrate_nullable_user_id()
-        migrate_add_reply_fields()
-        migrate_add_reg_number()
-        migrate_add_document_number()
-        create_default_admin()
+        run_migrations()
     
     return app
 
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,134 @@
+"""Export document cost: templates/docx rendering, the python-docx builders and PDF.
+
+Generates each document repeatedly from the same data with both Word engines
+of services/statistics_export.py and as an uncached PDF (services/pdf_export.py)
+and reports milliseconds per document. The protocol is measured with
+--pictures gallery images (800px JPEG renditions, like the real ones) and the
+worker report with --rows protocols.
+
+    python benchmarks/docx_rendering.py --pictures 0 4 --rows 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.statistics_export import (  # noqa: E402
+    create_statistics_word_document,
+    create_worker_statistics_word_document,
+    create_protocol_word_document
+)
+from services.pdf_export import (  # noqa: E402
+    create_statistics_pdf,
+    create_worker_statistics_pdf,
+    create_protocol_pdf
+)
+
+ENGINES = ('template', 'python-docx', 'pdf')
+
+
+def make_pictures(folder, count):
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f'picture{i}.jpg')
+        Image.effect_noise((800, 600), 64).convert('RGB').save(path, 'JPEG', quality=80)
+        paths.append(path)
+    return paths
+
+
+def protocol_case(pictures):
+    request_data = {
+        'reg_number': 'NAZ-2026-0001',
+        'document_number': 'DOC-2026-0001',
+        'topic': 'Санҷиши бозор',
+        'username': 'Корманди нозир',
+        'created_at': '19.10.2026 09:30',
+        'status_label': 'Дар тафтиш',
+        'coordinates': '38.5598, 68.7870',
+        'admin_read_at': '19.10.2026 10:00',
+        'comment': 'Шарҳи протокол. ' * 20,
+        'admin_reply': 'Қабул шуд.',
+        'admin_reply_at': '19.10.2026 11:00'
+    }
+    attachments = [
+        {'kind': 'image', 'name': os.path.basename(path), 'picture_path': path, 'info': ''}
+        for path in pictures
+    ]
+    attachments.append({'kind': 'document', 'name': 'санад.pdf', 'picture_path': None, 'info': ''})
+    return lambda engine: (create_protocol_pdf(request_data, attachments) if engine == 'pdf'
+                           else create_protocol_word_document(request_data, attachments, engine=engine))
+
+
+def statistics_case(topics):
+    stats_data = {
+        'total_requests': 1200,
+        'completed_requests': 800,
+        'under_review_requests': 400,
+        'completion_rate': 66.7,
+        'topic_stats': [
+            {'title': f'Мавзӯъ {i}', 'count': 100, 'completed': 60, 'pending': 40, 'percentage': 60.0}
+            for i in range(topics)
+        ],
+        'total_users': 40,
+        'total_admins': 3
+    }
+    date_range = '01.10.2026 - 19.10.2026'
+    return lambda engine: (create_statistics_pdf(stats_data, date_range=date_range) if engine == 'pdf'
+                           else create_statistics_word_document(stats_data, date_range=date_range, engine=engine))
+
+
+def worker_case(rows):
+    worker_data = {'username': 'w1', 'full_name': 'Корманди нозир', 'role': 'user', 'created_at': '01.01.2026'}
+    requests_list = [{
+        'reg_number': f'NAZ-2026-{i:04d}',
+        'topic': 'Санҷиши бозор',
+        'created_at': '19.10.2026 09:30',
+        'status': 'completed' if i % 3 else 'under_review',
+        'status_label': 'Иҷро шуд' if i % 3 else 'Дар тафтиш',
+        'comment': 'Шарҳи протокол ' * 5
+    } for i in range(rows)]
+    return lambda engine: (create_worker_statistics_pdf(worker_data, requests_list) if engine == 'pdf'
+                           else create_worker_statistics_word_document(worker_data, requests_list, engine=engine))
+
+
+def measure(build, engine, duration):
+    """Milliseconds per document and the size of one, after a warm-up build."""
+    size = len(build(engine).getvalue())
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        build(engine)
+        count += 1
+    return (time.perf_counter() - started) * 1000 / count, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pictures', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--rows', type=int, default=50, help='protocols in the worker report')
+    parser.add_argument('--topics', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=2, help='seconds per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        pictures = make_pictures(folder, max(args.pictures))
+        cases = [(f'protocol, {n} picture(s)', protocol_case(pictures[:n])) for n in args.pictures]
+        cases.append((f'statistics, {args.topics} topics', statistics_case(args.topics)))
+        cases.append((f'worker report, {args.rows} rows', worker_case(args.rows)))
+
+        header = ''.join(f'{engine:>16}' for engine in ENGINES)
+        # speedup: python-docx time over template time
+        print(f"{'document':<32}{header}{'speedup':>10}")
+        for name, build in cases:
+            results = [measure(build, engine, args.duration) for engine in ENGINES]
+            cells = ''.join(f'{ms:>8.2f} ms {size // 1024:>3}K' for ms, size in results)
+            print(f'{name:<32}{cells}{results[1][0] / results[0][0]:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
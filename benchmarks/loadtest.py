@@ -0,0 +1,169 @@
+"""Mixed upload/read load test against a running Nazorat server.
+
+Each virtual user logs in as a worker and keeps issuing requests: mostly reads
+(dashboard page, /api/v1/requests) and, with --upload-ratio probability, a new
+protocol with a photo attached. Compare worker classes by starting the server
+with e.g.
+
+    GUNICORN_WORKER_CLASS=sync gunicorn -c gunicorn.conf.py main:app
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py main:app
+
+and running
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --username w1 --password secret
+
+Every upload creates a real protocol, so point it at a test database.
+"""
+import argparse
+import io
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+
+def make_photo(width, height):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, mimetype) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class VirtualUser:
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.login(username, password)
+        self.topics = [t['id'] for t in self.get_json('/api/v1/topics')['items']]
+
+    def open(self, path, data=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers or {})
+        with self.opener.open(req, timeout=self.timeout) as response:
+            return response.status, response.read()
+
+    def get_json(self, path):
+        return json.loads(self.open(path, headers={'Accept': 'application/json'})[1])
+
+    def login(self, username, password):
+        _, body = self.open('/login')
+        token = re.search(rb'name="csrf_token" value="([^"]+)"', body).group(1).decode()
+        data = urllib.parse.urlencode({'csrf_token': token, 'username': username, 'password': password}).encode()
+        self.open('/login', data=data)
+        if b'logout' not in self.open('/user/dashboard')[1]:
+            raise SystemExit(f'Login failed for {username}')
+
+    def read_dashboard(self):
+        return self.open('/user/dashboard')
+
+    def read_api(self):
+        return self.open('/api/v1/requests?limit=50', headers={'Accept': 'application/json'})
+
+    def upload(self, photo):
+        token = self.get_json('/user/csrf-token')['csrf_token']
+        body, content_type = encode_multipart({
+            'csrf_token': token,
+            'topic_id': random.choice(self.topics),
+            'latitude': 38.5598 + random.uniform(-0.05, 0.05),
+            'longitude': 68.7870 + random.uniform(-0.05, 0.05),
+            'comment': 'Load test'
+        }, {'media': ('photo.jpg', photo, 'image/jpeg')})
+        return self.open('/user/create', data=body, headers={
+            'Content-Type': content_type,
+            'Accept': 'application/json',
+            'Idempotency-Key': uuid.uuid4().hex
+        })
+
+
+def run_user(args, photo, deadline, results, lock):
+    user = VirtualUser(args.url, args.username, args.password, args.timeout)
+    while time.monotonic() < deadline:
+        if random.random() < args.upload_ratio:
+            kind, action = 'upload', lambda: user.upload(photo)
+        elif random.random() < 0.5:
+            kind, action = 'dashboard', user.read_dashboard
+        else:
+            kind, action = 'api', user.read_api
+        started = time.monotonic()
+        try:
+            status, _ = action()
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        elapsed = time.monotonic() - started
+        with lock:
+            results.append((kind, status, elapsed))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def report(results, duration):
+    print(f"{'kind':<10} {'count':>6} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind in ('dashboard', 'api', 'upload', 'all'):
+        rows = [r for r in results if kind == 'all' or r[0] == kind]
+        if not rows:
+            continue
+        latencies = [r[2] * 1000 for r in rows]
+        errors = sum(1 for r in rows if not 200 <= r[1] < 400)
+        print(f'{kind:<10} {len(rows):>6} {errors:>6} {len(rows) / duration:>7.1f} '
+              f'{statistics.median(latencies):>8.0f} {percentile(latencies, 0.95):>8.0f} '
+              f'{percentile(latencies, 0.99):>8.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--upload-ratio', type=float, default=0.1)
+    parser.add_argument('--photo-size', default='2400x1800', help='WIDTHxHEIGHT of the uploaded JPEG')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.photo_size.split('x'))
+    photo = make_photo(width, height)
+    print(f'{args.users} users, {args.duration:.0f}s, upload ratio {args.upload_ratio}, '
+          f'photo {len(photo) // 1024} KB')
+
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=run_user, args=(args, photo, deadline, results, lock), daemon=True)
+               for _ in range(args.users)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(results, time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
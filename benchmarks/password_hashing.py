@@ -0,0 +1,73 @@
+"""Login throughput per core for candidate password hashing settings.
+
+A login costs one hash verification, so verifications per second on one
+thread is the number of logins a single core can absorb during a shift-change
+burst. Pick BCRYPT_LOG_ROUNDS (or the argon2 parameters) so that number covers
+the expected burst with PASSWORD_HASH_WORKERS threads per process.
+
+    python benchmarks/password_hashing.py --threads 1 2 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+PASSWORD = 'correct horse battery staple'
+
+
+def bcrypt_policy(rounds):
+    stored = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds))
+    return f'bcrypt rounds={rounds}', lambda: bcrypt.checkpw(PASSWORD.encode(), stored)
+
+
+def argon2_policy(time_cost, memory_cost):
+    from argon2 import PasswordHasher
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=1)
+    stored = hasher.hash(PASSWORD)
+    return f'argon2id t={time_cost} m={memory_cost // 1024}MiB', lambda: hasher.verify(stored, PASSWORD)
+
+
+def measure(verify, threads, duration):
+    """Verifications per second with `threads` threads working for about `duration` seconds."""
+    verify()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify()
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(lambda _: worker(), range(threads)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--duration', type=float, default=3, help='seconds per measurement')
+    args = parser.parse_args()
+
+    policies = [bcrypt_policy(rounds) for rounds in args.rounds]
+    try:
+        policies += [argon2_policy(2, 19456), argon2_policy(3, 65536)]
+    except ImportError:
+        print('argon2-cffi not installed, skipping argon2')
+
+    print(f'{os.cpu_count()} CPU(s)')
+    header = ''.join(f'{f"{t} thread(s)":>14}' for t in args.threads)
+    print(f"{'policy':<28}{'ms/login':>10}{header}")
+    for name, verify in policies:
+        rates = [measure(verify, threads, args.duration) for threads in args.threads]
+        cells = ''.join(f'{rate:>10.1f} /s ' for rate in rates)
+        print(f'{name:<28}{1000 / rates[0]:>10.0f}{cells}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Cold start time of a worker: imports, create_app() and the first /health.
+
+Each run is a fresh interpreter, like a new autoscale instance. Uses
+DATABASE_URL when set, otherwise a temporary SQLite database (the first run
+then also creates the schema and is reported separately).
+
+    python benchmarks/startup.py --runs 5 --budget 1.0
+
+Exits with status 1 when the median total exceeds the budget (seconds).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, %r)
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/health')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+heavy = [name for name in ('docx', 'openpyxl', 'PIL.Image') if name in sys.modules]
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created, 'total': served - started, 'heavy': heavy}))
+""" % ROOT
+
+
+def run_probe(env):
+    output = subprocess.run([sys.executable, '-c', PROBE], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_header():
+    print(f"{'':<12} {'import ms':>8} {'create_app ms':>11} {'first request ms':>14} {'total ms':>9}")
+
+
+def print_row(label, result):
+    print(f"{label:<12} {result['import'] * 1000:>8.0f} {result['create_app'] * 1000:>11.0f} "
+          f"{result['first_request'] * 1000:>14.0f} {result['total'] * 1000:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds, median total')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+        print('DATABASE_URL not set, using', env['DATABASE_URL'])
+        print_header()
+        print_row('empty db', run_probe(env))
+    else:
+        print_header()
+
+    results = [run_probe(env) for _ in range(args.runs)]
+    for i, result in enumerate(results, 1):
+        print_row(f'run {i}', result)
+
+    median = {key: statistics.median(r[key] for r in results)
+              for key in ('import', 'create_app', 'first_request', 'total')}
+    print_row('median', median)
+
+    heavy = sorted({name for r in results for name in r['heavy']})
+    if heavy:
+        print('Loaded at startup but only needed for exports/uploads:', ', '.join(heavy))
+
+    if median['total'] > args.budget:
+        print(f"Over budget: {median['total']:.2f}s > {args.budget:.2f}s")
+        sys.exit(1)
+    print(f"Within budget: {median['total']:.2f}s <= {args.budget:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import os
+import multiprocessing
+from gunicorn.glogging import Logger
+
+# Serving defaults for Nazorat. gthread keeps slow uploads, DOCX/XLSX exports and
+# open /admin/events streams from tying up a whole worker. For gevent:
+#   pip install gevent psycogreen && GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py main:app
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+
+# gthread: requests per worker. Each busy thread can hold a DB connection, so keep
+# workers * threads below the connection limit of the database plan. Open
+# /admin/events streams take at most half of them (EVENTS_MAX_STREAMS).
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# gevent: concurrent connections per worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+# Large uploads on slow mobile links and exports need more than the default 30s
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth from Pillow/openpyxl
+max_requests = 1000
+max_requests_jitter = 100
+
+# Import the app (and run migrations) once in the master, then fork the workers.
+# --reload needs it off (GUNICORN_PRELOAD=0), see the dev workflow in .replit.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+accesslog = '-'
+errorlog = '-'
+
+
+class ProbeFilteringLogger(Logger):
+    """Access log without the load balancer's /livez and /readyz probes."""
+
+    PROBE_PATHS = ('/livez', '/readyz', '/health')
+
+    def access(self, resp, req, environ, request_time):
+        if environ.get('PATH_INFO') in self.PROBE_PATHS and not str(resp.status).startswith('5'):
+            return
+        super().access(resp, req, environ, request_time)
+
+
+logger_class = ProbeFilteringLogger
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the whole worker under gevent unless it is made cooperative
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed; database calls will block gevent workers')
+        else:
+            patch_psycopg()
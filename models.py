@@ -1,6 +1,7 @@
 from datetime import datetime
 from flask_login import UserMixin
-from extensions import db, bcrypt
+from extensions import db
+from services.passwords import hash_password, verify_password
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -16,10 +17,10 @@ class User(UserMixin, db.Model):
     requests = db.relationship('Request', backref='author', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def is_admin(self):
         return self.role == 'admin'
@@ -42,6 +43,12 @@ class Topic(db.Model):
 
 class Request(db.Model):
     __tablename__ = 'requests'
+    __table_args__ = (
+        db.Index('ix_requests_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_requests_created_at', 'created_at'),
+        # Keys come from the client, so they only have to be unique per worker
+        db.Index('ix_requests_user_idempotency_key', 'user_id', 'idempotency_key', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     reg_number = db.Column(db.String(20), unique=True, nullable=True)
@@ -51,12 +58,24 @@ class Request(db.Model):
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     comment = db.Column(db.Text, nullable=True)
-    media_filename = db.Column(db.String(255), nullable=True)
+    # Single attachment of protocols from before request_media; copied there by
+    # migrate_add_request_media and no longer written
+    media_filename = db.Column(db.String(255), nullable=True, index=True)
+    media_web = db.Column(db.String(255), nullable=True)
+    media_poster = db.Column(db.String(255), nullable=True)
+    media_duration = db.Column(db.Float, nullable=True)
+    media_width = db.Column(db.Integer, nullable=True)
+    media_height = db.Column(db.Integer, nullable=True)
     status = db.Column(db.String(20), nullable=False, default='under_review')
     reply = db.Column(db.Text, nullable=True)
     replied_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     admin_read_at = db.Column(db.DateTime, nullable=True)
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    
+    attachments = db.relationship('RequestMedia', backref='request', order_by='RequestMedia.position',
+                                  cascade='all, delete-orphan')
     
     @staticmethod
     def generate_reg_number():
@@ -110,22 +129,134 @@ class Request(db.Model):
         'completed': 'success'
     }
     
-    def get_effective_status(self):
-        """Get the effective status based on admin_read_at and status fields"""
-        if self.status == 'completed':
+    @staticmethod
+    def effective_status(status, admin_read_at):
+        """Effective status from the two columns, also for rows selected without the model"""
+        if status == 'completed':
             return 'completed'
-        elif self.admin_read_at is None:
+        elif admin_read_at is None:
             return 'new'
         else:
             return 'under_review'
     
+    @classmethod
+    def status_label(cls, status, admin_read_at):
+        effective_status = cls.effective_status(status, admin_read_at)
+        return cls.STATUS_LABELS.get(effective_status, effective_status)
+    
+    def get_effective_status(self):
+        """Get the effective status based on admin_read_at and status fields"""
+        return self.effective_status(self.status, self.admin_read_at)
+    
     def get_status_label(self):
-        effective_status = self.get_effective_status()
-        return self.STATUS_LABELS.get(effective_status, effective_status)
+        return self.status_label(self.status, self.admin_read_at)
     
     def get_status_class(self):
         effective_status = self.get_effective_status()
         return self.STATUS_CLASSES.get(effective_status, 'secondary')
     
+    def get_cover_url(self):
+        """Small picture for list views: the first photo or video poster, if any."""
+        for attachment in self.attachments:
+            url = attachment.get_preview_url()
+            if url:
+                return url
+        return None
+    
     def __repr__(self):
         return f'<Request {self.id}>'
+
+class RequestMedia(db.Model):
+    """One attachment of a protocol. Files are content-addressed and may be
+    shared with other protocols (see MediaFile)."""
+    __tablename__ = 'request_media'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    kind = db.Column(db.String(20), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
+    original_name = db.Column(db.String(255), nullable=True)
+    sha256 = db.Column(db.String(64), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    duration = db.Column(db.Float, nullable=True)
+    thumb = db.Column(db.String(255), nullable=True)
+    web = db.Column(db.String(255), nullable=True)
+    poster = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def get_url(self, kind='original'):
+        from flask import url_for
+        return url_for('user.attachment_file', id=self.request_id, media_id=self.id, kind=kind)
+    
+    def get_preview_url(self):
+        """Pre-sized picture (photo rendition or video poster); None while there is none."""
+        if self.kind == 'image' and self.thumb:
+            return self.get_url('thumb')
+        if self.kind == 'video' and self.poster:
+            return self.get_url('poster')
+        return None
+    
+    @staticmethod
+    def duration_label(duration):
+        if not duration:
+            return ''
+        minutes, seconds = divmod(int(round(duration)), 60)
+        return f'{minutes}:{seconds:02d}'
+    
+    @classmethod
+    def info_label(cls, duration, width, height):
+        """Duration and size of a video, e.g. '0:42, 1280×720'."""
+        parts = []
+        if duration:
+            parts.append(f'Давомнокӣ: {cls.duration_label(duration)}')
+        if width and height:
+            parts.append(f'{width}×{height}')
+        return ', '.join(parts)
+    
+    def get_duration_label(self):
+        return self.duration_label(self.duration)
+    
+    def get_info_label(self):
+        return self.info_label(self.duration, self.width, self.height)
+
+class MediaFile(db.Model):
+    """Uploaded file stored under its SHA-256 name, shared by every protocol that attached it."""
+    __tablename__ = 'media_files'
+    
+    filename = db.Column(db.String(255), primary_key=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserSession(db.Model):
+    __tablename__ = 'sessions'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class RateLimit(db.Model):
+    __tablename__ = 'rate_limits'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+class DataVersion(db.Model):
+    """Change counter of a table, bumped after every commit that touches it (see
+    services/statistics_cache.py). Rows named backfill:<function> instead mark data
+    migrations that have finished (see run_data_migrations in app.py)."""
+    __tablename__ = 'data_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class StatisticsCacheEntry(db.Model):
+    __tablename__ = 'statistics_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
@@ -1,18 +1,42 @@
 import os
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app
+import json
+import queue
+from urllib.parse import urlsplit
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, Response, abort, stream_with_context
 from flask_login import login_required, current_user
 from functools import wraps
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from models import User, Topic, Request
 from extensions import db
+from routes.user import wants_json
 from services.statistics_export import (
     create_statistics_word_document,
     create_statistics_excel_document,
     create_worker_statistics_word_document,
     create_worker_statistics_excel_document,
-    create_protocol_word_document
+    create_protocol_word_document,
+    create_statistics_csv,
+    create_worker_statistics_csv
 )
+from services.media import release_media, remove_unreferenced_media, send_media
+from services.export_data import get_worker_data, iter_worker_requests, get_protocol_data
+from services.protocol_export import (
+    start_export,
+    get_job_status,
+    get_job_path,
+    get_export_download_name,
+    EXPORT_FORMATS
+)
+from services.pdf_export import get_pdf, remove_expired_pdfs
+from services.statistics_cache import get_statistics
+from services.histogram import get_histogram
+from services.sla import get_sla
+from services import events
+from services.user_cache import invalidate_user
+from services.sessions import revoke_user_sessions
+from services.passwords import PasswordHashingBusy
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -144,6 +168,34 @@ def delete_topic(id):
     flash('Мавзӯъ бо муваффақият нест карда шуд.', 'success')
     return redirect(url_for('admin.topics'))
 
+def get_redirect_target():
+    """The form's redirect_to when it is a path on this site, otherwise None."""
+    target = request.form.get('redirect_to', '')
+    parts = urlsplit(target)
+    # '//host', '/\\host' and paths with tabs or newlines are taken by browsers as another site
+    if (not target.startswith('/') or target.startswith('//') or parts.scheme or parts.netloc
+            or '\\' in target or any(ord(ch) < 32 for ch in target)):
+        return None
+    return target
+
+def request_action_done(req, message, category, redirect_to=None):
+    """Answer to an action on one protocol: its new state as JSON for the pages
+    that update the row in place, otherwise a flash and a redirect."""
+    if wants_json():
+        return jsonify({
+            'success': True,
+            'request_id': req.id,
+            'status': req.get_effective_status(),
+            'status_label': req.get_status_label(),
+            'status_class': req.get_status_class(),
+            'reply': req.reply or '',
+            'replied_at': req.replied_at.strftime('%d.%m.%Y %H:%M') if req.replied_at else '',
+            'message': message,
+            'category': category
+        })
+    flash(message, category)
+    return redirect(redirect_to or get_redirect_target() or url_for('admin.protocols'))
+
 @admin_bp.route('/requests/<int:id>/status', methods=['POST'])
 @login_required
 @admin_required
@@ -151,16 +203,18 @@ def update_status(id):
     req = Request.query.get_or_404(id)
     new_status = request.form.get('status')
     
-    if new_status in ['under_review', 'completed']:
-        req.status = new_status
-        if new_status == 'completed' and req.admin_read_at is None:
-            req.admin_read_at = datetime.utcnow()
-        db.session.commit()
-        flash('Ҳолати дархост бо муваффақият тағйир дода шуд.', 'success')
-    else:
+    if new_status not in ['under_review', 'completed']:
+        if wants_json():
+            return jsonify({'success': False, 'error': 'Ҳолати нодуруст интихоб шуд.'}), 400
         flash('Ҳолати нодуруст интихоб шуд.', 'danger')
+        return redirect(url_for('admin.protocols'))
     
-    return redirect(url_for('admin.protocols'))
+    req.status = new_status
+    if new_status == 'completed' and req.admin_read_at is None:
+        req.admin_read_at = datetime.utcnow()
+    db.session.commit()
+    events.publish('status-changed', req)
+    return request_action_done(req, 'Ҳолати дархост бо муваффақият тағйир дода шуд.', 'success')
 
 @admin_bp.route('/requests/<int:id>/complete', methods=['POST'])
 @login_required
@@ -171,11 +225,8 @@ def complete_request(id):
     if req.admin_read_at is None:
         req.admin_read_at = datetime.utcnow()
     db.session.commit()
-    flash('Дархост иҷро шуд.', 'success')
-    redirect_to = request.form.get('redirect_to')
-    if redirect_to:
-        return redirect(redirect_to)
-    return redirect(url_for('admin.protocols'))
+    events.publish('status-changed', req)
+    return request_action_done(req, 'Дархост иҷро шуд.', 'success')
 
 @admin_bp.route('/users')
 @login_required
@@ -184,12 +235,22 @@ def users():
     users = User.query.order_by(User.created_at.desc()).all()
     return render_template('admin/users.html', users=users)
 
+@admin_bp.route('/users/<int:id>/avatar')
+@login_required
+@admin_required
+def user_avatar(id):
+    user = User.query.get_or_404(id)
+    if not user.avatar:
+        abort(404)
+    return send_media(user.avatar)
+
 @admin_bp.route('/users/<int:id>/requests')
 @login_required
 @admin_required
 def user_requests(id):
     user = User.query.get_or_404(id)
-    requests_list = Request.query.filter_by(user_id=id).order_by(Request.created_at.desc()).all()
+    requests_list = Request.query.filter_by(user_id=id).options(selectinload(Request.attachments))\
+        .order_by(Request.created_at.desc()).all()
     topics = Topic.query.order_by(Topic.title).all()
     return render_template('admin/user_requests.html', user=user, requests=requests_list, topics=topics)
 
@@ -229,7 +290,11 @@ def create_user():
             role = 'user'
         
         user = User(username=username, full_name=full_name, role=role)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashingBusy:
+            flash('Сервер банд аст. Лутфан пас аз чанд сония дубора кӯшиш кунед.', 'warning')
+            return render_template('admin/user_form.html', user=None), 503
         
         avatar_file = request.files.get('avatar')
         if avatar_file and avatar_file.filename:
@@ -256,6 +321,7 @@ def edit_user(id):
     user = User.query.get_or_404(id)
     
     if request.method == 'POST':
+        old_credentials = (user.username, user.role, user.password_hash)
         username = request.form.get('username', '').strip()
         full_name = request.form.get('full_name', '').strip()
         password = request.form.get('password', '')
@@ -284,7 +350,11 @@ def edit_user(id):
                 flash('Рамзҳо мувофиқат намекунанд.', 'danger')
                 return render_template('admin/user_form.html', user=user)
             
-            user.set_password(password)
+            try:
+                user.set_password(password)
+            except PasswordHashingBusy:
+                flash('Сервер банд аст. Лутфан пас аз чанд сония дубора кӯшиш кунед.', 'warning')
+                return render_template('admin/user_form.html', user=user), 503
         
         if user.id != current_user.id:
             if role not in ['user', 'admin']:
@@ -310,6 +380,9 @@ def edit_user(id):
                 user.avatar = new_filename
         
         db.session.commit()
+        invalidate_user(user.id)
+        if (user.username, user.role, user.password_hash) != old_credentials:
+            revoke_user_sessions(user.id, keep_current=user.id == current_user.id)
         
         return redirect(url_for('admin.users'))
     
@@ -326,16 +399,12 @@ def delete_user(id):
         return redirect(url_for('admin.users'))
     
     delete_option = request.form.get('delete_option', 'none')
+    released = []
     
     if user.requests:
         if delete_option == 'with_requests':
             for req in user.requests:
-                if req.media_filename:
-                    import os
-                    from flask import current_app
-                    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], req.media_filename)
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
+                released += release_media(*[attachment.filename for attachment in req.attachments])
                 db.session.delete(req)
         elif delete_option == 'keep_requests':
             for req in user.requests:
@@ -346,6 +415,9 @@ def delete_user(id):
     
     db.session.delete(user)
     db.session.commit()
+    remove_unreferenced_media(*released)
+    invalidate_user(id)
+    revoke_user_sessions(id)
     
     return redirect(url_for('admin.users'))
 
@@ -374,18 +446,18 @@ def update_reg_number(id):
 def delete_request(id):
     req = Request.query.get_or_404(id)
     
-    if req.media_filename:
-        import os
-        from flask import current_app
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], req.media_filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+    released = release_media(*[attachment.filename for attachment in req.attachments])
     
     db.session.delete(req)
     db.session.commit()
-    flash('Дархост бо муваффақият нест карда шуд.', 'success')
+    remove_unreferenced_media(*released)
+    events.publish('request-deleted', req)
     
-    return redirect(url_for('admin.protocols'))
+    message = 'Дархост бо муваффақият нест карда шуд.'
+    if wants_json():
+        return jsonify({'success': True, 'request_id': id, 'deleted': True, 'message': message})
+    flash(message, 'success')
+    return redirect(get_redirect_target() or url_for('admin.protocols'))
 
 @admin_bp.route('/requests/<int:id>/reply', methods=['POST'])
 @login_required
@@ -400,11 +472,11 @@ def reply_request(id):
     if reply_text:
         req.reply = reply_text
         req.replied_at = datetime.utcnow()
-        flash('Ҷавоб бо муваффақият фиристода шуд.', 'success')
+        message, category = 'Ҷавоб бо муваффақият фиристода шуд.', 'success'
     else:
         req.reply = None
         req.replied_at = None
-        flash('Ҷавоб пок карда шуд.', 'info')
+        message, category = 'Ҷавоб пок карда шуд.', 'info'
     
     if mark_completed:
         req.status = 'completed'
@@ -412,8 +484,9 @@ def reply_request(id):
         req.status = 'under_review'
     
     db.session.commit()
+    events.publish('reply', req)
     
-    return redirect(url_for('user.view_request', id=id))
+    return request_action_done(req, message, category, url_for('user.view_request', id=id))
 
 @admin_bp.route('/map')
 @login_required
@@ -450,95 +523,30 @@ def statistics():
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    query = Request.query
-    
-    if date_from:
-        try:
-            from_date = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Request.created_at >= from_date)
-        except ValueError:
-            pass
-    
-    if date_to:
-        try:
-            to_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Request.created_at < to_date)
-        except ValueError:
-            pass
-    
-    total_requests = query.count()
-    completed_requests = query.filter(Request.status == 'completed').count()
-    under_review_requests = query.filter(Request.status == 'under_review').count()
-    
-    topics = Topic.query.all()
-    topic_stats = []
-    for topic in topics:
-        topic_query = query.filter(Request.topic_id == topic.id)
-        count = topic_query.count()
-        completed = topic_query.filter(Request.status == 'completed').count()
-        percentage = round((count / total_requests * 100), 1) if total_requests > 0 else 0
-        topic_stats.append({
-            'id': topic.id,
-            'title': topic.title,
-            'color': topic.color,
-            'count': count,
-            'completed': completed,
-            'pending': count - completed,
-            'percentage': percentage
-        })
-    
-    topic_stats.sort(key=lambda x: x['count'], reverse=True)
-    
-    daily_stats = []
-    if date_from and date_to:
-        try:
-            start = datetime.strptime(date_from, '%Y-%m-%d')
-            end = datetime.strptime(date_to, '%Y-%m-%d')
-            current = start
-            while current <= end:
-                next_day = current + timedelta(days=1)
-                day_count = Request.query.filter(
-                    Request.created_at >= current,
-                    Request.created_at < next_day
-                ).count()
-                daily_stats.append({
-                    'date': current.strftime('%d.%m'),
-                    'count': day_count
-                })
-                current = next_day
-        except ValueError:
-            pass
-    else:
-        for i in range(29, -1, -1):
-            day = datetime.now() - timedelta(days=i)
-            next_day = day + timedelta(days=1)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = next_day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_count = Request.query.filter(
-                Request.created_at >= day_start,
-                Request.created_at < day_end
-            ).count()
-            daily_stats.append({
-                'date': day.strftime('%d.%m'),
-                'count': day_count
-            })
-    
-    total_users = User.query.filter(User.role == 'user').count()
-    total_admins = User.query.filter(User.role == 'admin').count()
-    
-    completion_rate = round((completed_requests / total_requests * 100), 1) if total_requests > 0 else 0
+    stats_data = get_statistics(date_from, date_to)
+    histogram = get_histogram(date_from, date_to)
+    sla = get_sla(date_from, date_to)
     
     return render_template('admin/statistics.html',
-                         total_requests=total_requests,
-                         completed_requests=completed_requests,
-                         under_review_requests=under_review_requests,
-                         topic_stats=topic_stats,
-                         daily_stats=daily_stats,
-                         total_users=total_users,
-                         total_admins=total_admins,
-                         completion_rate=completion_rate,
+                         histogram=histogram,
+                         sla=sla,
                          date_from=date_from,
-                         date_to=date_to)
+                         date_to=date_to,
+                         **stats_data)
+
+
+def send_pdf(kind, download_name, *args):
+    """Send a PDF export from the cache, rendering it first if its content is new."""
+    remove_expired_pdfs(current_app)
+    path = get_pdf(current_app.config['PDF_CACHE_FOLDER'], kind, *args)
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype='application/pdf')
+
+
+def send_csv(lines, download_name):
+    """Stream CSV lines as a download."""
+    response = Response(stream_with_context(lines), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    return response
 
 
 @admin_bp.route('/statistics/download/<format>')
@@ -548,58 +556,7 @@ def download_statistics(format):
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    query = Request.query
-    
-    if date_from:
-        try:
-            from_date = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Request.created_at >= from_date)
-        except ValueError:
-            pass
-    
-    if date_to:
-        try:
-            to_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Request.created_at < to_date)
-        except ValueError:
-            pass
-    
-    total_requests = query.count()
-    completed_requests = query.filter(Request.status == 'completed').count()
-    under_review_requests = query.filter(Request.status == 'under_review').count()
-    
-    topics = Topic.query.all()
-    topic_stats = []
-    for topic in topics:
-        topic_query = query.filter(Request.topic_id == topic.id)
-        count = topic_query.count()
-        completed = topic_query.filter(Request.status == 'completed').count()
-        percentage = round((count / total_requests * 100), 1) if total_requests > 0 else 0
-        topic_stats.append({
-            'id': topic.id,
-            'title': topic.title,
-            'color': topic.color,
-            'count': count,
-            'completed': completed,
-            'pending': count - completed,
-            'percentage': percentage
-        })
-    
-    topic_stats.sort(key=lambda x: x['count'], reverse=True)
-    
-    total_users = User.query.filter(User.role == 'user').count()
-    total_admins = User.query.filter(User.role == 'admin').count()
-    completion_rate = round((completed_requests / total_requests * 100), 1) if total_requests > 0 else 0
-    
-    stats_data = {
-        'total_requests': total_requests,
-        'completed_requests': completed_requests,
-        'under_review_requests': under_review_requests,
-        'completion_rate': completion_rate,
-        'topic_stats': topic_stats,
-        'total_users': total_users,
-        'total_admins': total_admins
-    }
+    stats_data = get_statistics(date_from, date_to)
     
     date_range = None
     if date_from and date_to:
@@ -616,13 +573,18 @@ def download_statistics(format):
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         )
     elif format == 'excel':
-        buffer = create_statistics_excel_document(stats_data, date_range=date_range)
+        buffer = create_statistics_excel_document(stats_data, date_range=date_range,
+                                                  sla_data=get_sla(date_from, date_to))
         return send_file(
             buffer,
             as_attachment=True,
             download_name=f'omor_{timestamp}.xlsx',
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
+    elif format == 'pdf':
+        return send_pdf('statistics', f'omor_{timestamp}.pdf', stats_data, "Омори дархостҳо", date_range)
+    elif format == 'csv':
+        return send_csv(create_statistics_csv(stats_data), f'omor_{timestamp}.csv')
     else:
         flash('Формати нодуруст интихоб шуд.', 'danger')
         return redirect(url_for('admin.statistics'))
@@ -632,30 +594,19 @@ def download_statistics(format):
 @login_required
 @admin_required
 def download_user_statistics(id, format):
-    user = User.query.get_or_404(id)
+    worker_data = get_worker_data(id)
+    if worker_data is None:
+        abort(404)
     
-    requests_list = Request.query.filter_by(user_id=id).order_by(Request.created_at.desc()).all()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_username = worker_data['username'].replace(' ', '_')
     
-    worker_data = {
-        'username': user.username,
-        'full_name': user.full_name or user.username,
-        'role': user.role,
-        'created_at': user.created_at.strftime('%d.%m.%Y') if user.created_at else ''
-    }
+    if format == 'csv':
+        # Rows go out as they are read instead of being collected first
+        return send_csv(create_worker_statistics_csv(iter_worker_requests(id)),
+                        f'omor_{safe_username}_{timestamp}.csv')
     
-    requests_data = []
-    for req in requests_list:
-        requests_data.append({
-            'reg_number': req.reg_number or f'#{req.id}',
-            'topic': req.topic.title if req.topic else '',
-            'created_at': req.created_at.strftime('%d.%m.%Y %H:%M') if req.created_at else '',
-            'status': req.status,
-            'status_label': req.get_status_label(),
-            'comment': req.comment or ''
-        })
-    
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    safe_username = user.username.replace(' ', '_')
+    requests_data = list(iter_worker_requests(id))
     
     if format == 'word':
         buffer = create_worker_statistics_word_document(worker_data, requests_data)
@@ -673,6 +624,8 @@ def download_user_statistics(id, format):
             download_name=f'omor_{safe_username}_{timestamp}.xlsx',
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
+    elif format == 'pdf':
+        return send_pdf('worker_statistics', f'omor_{safe_username}_{timestamp}.pdf', worker_data, requests_data)
     else:
         flash('Формати нодуруст интихоб шуд.', 'danger')
         return redirect(url_for('admin.user_requests', id=id))
@@ -682,35 +635,18 @@ def download_user_statistics(id, format):
 @login_required
 @admin_required
 def download_protocol(id):
-    req = Request.query.get_or_404(id)
-    
-    coordinates = ''
-    if req.latitude and req.longitude:
-        coordinates = f"{req.latitude}, {req.longitude}"
-    
-    request_data = {
-        'reg_number': req.reg_number or f'#{req.id}',
-        'document_number': req.document_number or '',
-        'topic': req.topic.title if req.topic else '',
-        'username': req.author.full_name or req.author.username if req.author else 'Нест шуд',
-        'created_at': req.created_at.strftime('%d.%m.%Y %H:%M') if req.created_at else '',
-        'status_label': req.get_status_label(),
-        'coordinates': coordinates if coordinates else 'Нест',
-        'admin_read_at': req.admin_read_at.strftime('%d.%m.%Y %H:%M') if req.admin_read_at else 'Нахонда',
-        'comment': req.comment or '',
-        'admin_reply': req.reply or '',
-        'admin_reply_at': req.replied_at.strftime('%d.%m.%Y %H:%M') if req.replied_at else ''
-    }
-    
-    media_path = None
-    if req.media_filename:
-        media_path = os.path.join(current_app.root_path, 'static', 'uploads', req.media_filename)
-    
-    buffer = create_protocol_word_document(request_data, media_path)
+    protocol = get_protocol_data(id)
+    if protocol is None:
+        abort(404)
+    row, request_data, attachments = protocol
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    safe_reg = (req.reg_number or f'protocol_{req.id}').replace('/', '-').replace(' ', '_')
+    safe_reg = (row.reg_number or f'protocol_{row.id}').replace('/', '-').replace(' ', '_')
     
+    if request.args.get('format') == 'pdf':
+        return send_pdf('protocol', f'{safe_reg}_{timestamp}.pdf', request_data, attachments)
+    
+    buffer = create_protocol_word_document(request_data, attachments)
     return send_file(
         buffer,
         as_attachment=True,
@@ -747,16 +683,8 @@ def admin_home():
     return render_template('admin/home.html', worker_cards=worker_cards)
 
 
-@admin_bp.route('/protocols')
-@login_required
-@admin_required
-def protocols():
-    topic_filter = request.args.get('topic', type=int)
-    status_filter = request.args.get('status', type=str)
-    search_query = request.args.get('q', '').strip()
-    
-    query = Request.query.order_by(Request.created_at.desc())
-    
+def filter_protocols(query, topic_filter, status_filter, search_query):
+    """Apply the filters of the protocols page; shared with the bulk export."""
     if search_query:
         search_term = f'%{search_query}%'
         query = query.outerjoin(User, Request.user_id == User.id).outerjoin(Topic, Request.topic_id == Topic.id).filter(
@@ -781,6 +709,21 @@ def protocols():
         elif status_filter == 'completed':
             query = query.filter(Request.status == 'completed')
     
+    return query
+
+
+@admin_bp.route('/protocols')
+@login_required
+@admin_required
+def protocols():
+    topic_filter = request.args.get('topic', type=int)
+    status_filter = request.args.get('status', type=str)
+    search_query = request.args.get('q', '').strip()
+    
+    # All attachments of the page come in one extra SELECT ... WHERE request_id IN (...)
+    query = Request.query.options(selectinload(Request.attachments)).order_by(Request.created_at.desc())
+    query = filter_protocols(query, topic_filter, status_filter, search_query)
+    
     requests_list = query.all()
     topics = Topic.query.order_by(Topic.title).all()
     statuses = Request.STATUS_LABELS
@@ -794,6 +737,61 @@ def protocols():
                          search_query=search_query)
 
 
+@admin_bp.route('/protocols/export', methods=['POST'])
+@login_required
+@admin_required
+def export_protocols():
+    query = db.session.query(Request.id).order_by(Request.created_at.desc())
+    query = filter_protocols(
+        query,
+        request.form.get('topic', type=int),
+        request.form.get('status', type=str),
+        request.form.get('q', '').strip()
+    )
+    request_ids = [row.id for row in query]
+    if not request_ids:
+        return jsonify({'success': False, 'error': 'Барои содирот протокол нест.'}), 400
+    
+    export_format = request.form.get('format', 'docx')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Формати нодуруст интихоб шуд.'}), 400
+    
+    job_id = start_export(request_ids, export_format)
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'total': len(request_ids),
+        'status_url': url_for('admin.export_status', job_id=job_id),
+        'download_url': url_for('admin.export_download', job_id=job_id)
+    })
+
+
+@admin_bp.route('/protocols/export/<job_id>')
+@login_required
+@admin_required
+def export_status(job_id):
+    status = get_job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Содирот ёфт нашуд.'}), 404
+    return jsonify(status)
+
+
+@admin_bp.route('/protocols/export/<job_id>/download')
+@login_required
+@admin_required
+def export_download(job_id):
+    status = get_job_status(job_id)
+    if status is None or status['status'] != 'done':
+        flash('Содирот ёфт нашуд ё ҳанӯз тайёр нест.', 'danger')
+        return redirect(url_for('admin.protocols'))
+    return send_file(
+        get_job_path(job_id, 'zip'),
+        as_attachment=True,
+        download_name=get_export_download_name(),
+        mimetype='application/zip'
+    )
+
+
 @admin_bp.route('/requests/<int:id>/mark-read', methods=['POST'])
 @login_required
 @admin_required
@@ -802,4 +800,40 @@ def mark_request_read(id):
     if req.admin_read_at is None:
         req.admin_read_at = datetime.utcnow()
         db.session.commit()
+        events.publish('request-read', req)
     return jsonify({'success': True})
+
+
+@admin_bp.route('/events')
+@login_required
+@admin_required
+def event_stream():
+    """Server-Sent Events feed that keeps the admin pages up to date."""
+    subscription = events.subscribe()
+    if subscription is None:
+        # Every open stream pins a thread of this worker; send the browser elsewhere for now
+        retry = current_app.config['EVENTS_RETRY_SECONDS']
+        response = Response(f'retry: {retry * 1000}\n\n', status=503, mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(retry)
+        return response
+    keepalive = current_app.config['EVENTS_KEEPALIVE_SECONDS']
+    # The stream can stay open for hours; don't hold a pooled connection meanwhile
+    db.session.remove()
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            events.unsubscribe(subscription)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
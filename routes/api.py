@@ -0,0 +1,173 @@
+import base64
+import hashlib
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from models import Topic, Request
+from extensions import db
+
+api_bp = Blueprint('api', __name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Rows committed shortly after a sync started can carry an earlier updated_at,
+# so the next delta overlaps the previous one by this window.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+@api_bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Воридшавӣ лозим аст.'}), 401
+
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def format_datetime(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def parse_datetime(value):
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1]
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def encode_cursor(req):
+    raw = f'{req.updated_at.isoformat()}|{req.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    updated_at, request_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(updated_at), int(request_id)
+
+
+def json_response(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def serialize_attachment(attachment):
+    return {
+        'id': attachment.id,
+        'kind': attachment.kind,
+        'name': attachment.original_name,
+        'size': attachment.size,
+        'url': attachment.get_url(),
+        'thumb_url': attachment.get_url('thumb') if attachment.thumb else None,
+        'web_url': attachment.get_url('web') if attachment.web else None,
+        'poster_url': attachment.get_url('poster') if attachment.poster else None,
+        'duration': attachment.duration,
+        'width': attachment.width,
+        'height': attachment.height
+    }
+
+
+def serialize_request(req):
+    attachments = [serialize_attachment(attachment) for attachment in req.attachments]
+    return {
+        'id': req.id,
+        'reg_number': req.reg_number,
+        'document_number': req.document_number,
+        'topic_id': req.topic_id,
+        'latitude': req.latitude,
+        'longitude': req.longitude,
+        'comment': req.comment,
+        'status': req.get_effective_status(),
+        'status_label': req.get_status_label(),
+        'reply': req.reply,
+        'replied_at': format_datetime(req.replied_at),
+        'admin_read_at': format_datetime(req.admin_read_at),
+        'created_at': format_datetime(req.created_at),
+        'updated_at': format_datetime(req.updated_at),
+        # `media` is the first attachment, as sent before protocols could have several
+        'media': attachments[0] if attachments else None,
+        'attachments': attachments
+    }
+
+
+@api_bp.route('/topics')
+def topics():
+    topics = Topic.query.order_by(Topic.title).all()
+    payload = {'items': [{'id': t.id, 'title': t.title, 'color': t.color} for t in topics]}
+    etag = hashlib.sha1(repr(payload['items']).encode('utf-8')).hexdigest()
+    return json_response(payload, etag)
+
+
+@api_bp.route('/requests')
+def request_list():
+    """Own requests ordered by (updated_at, id) for delta sync.
+
+    Query args: updated_since (ISO time, usually the previous sync_token),
+    cursor (next_cursor of the previous page) and limit. A client whose
+    local row count differs from `total` should drop its copy and resync.
+    """
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    updated_since = request.args.get('updated_since', '').strip()
+    cursor = request.args.get('cursor', '').strip()
+
+    base_query = Request.query.filter(Request.user_id == current_user.id)
+    total, last_updated = db.session.query(
+        func.count(Request.id), func.max(Request.updated_at)
+    ).filter(Request.user_id == current_user.id).one()
+
+    # Any change to the user's requests moves max(updated_at) or the count,
+    # so unchanged pages are answered with 304 before loading rows.
+    etag = hashlib.sha1(
+        f'{current_user.id}|{total}|{last_updated}|{updated_since}|{cursor}|{limit}'.encode()
+    ).hexdigest()
+    if etag in request.if_none_match:
+        return json_response({}, etag)
+
+    sync_token = format_datetime(datetime.utcnow() - SYNC_OVERLAP)
+
+    query = base_query
+    if updated_since:
+        try:
+            query = query.filter(Request.updated_at >= parse_datetime(updated_since))
+        except ValueError:
+            return api_error('updated_since нодуруст аст.')
+    if cursor:
+        try:
+            cursor_updated, cursor_id = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return api_error('cursor нодуруст аст.')
+        query = query.filter(db.or_(
+            Request.updated_at > cursor_updated,
+            db.and_(Request.updated_at == cursor_updated, Request.id > cursor_id)
+        ))
+
+    rows = query.options(selectinload(Request.attachments))\
+        .order_by(Request.updated_at, Request.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    payload = {
+        'items': [serialize_request(req) for req in rows],
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None,
+        'sync_token': sync_token,
+        'total': total
+    }
+    return json_response(payload, etag)
+
+
+@api_bp.route('/requests/<int:id>')
+def request_detail(id):
+    req = Request.query.filter_by(id=id, user_id=current_user.id).first()
+    if req is None:
+        return api_error('Протокол ёфт нашуд.', 404)
+    etag = f'{req.id}-{req.updated_at.isoformat() if req.updated_at else ""}'
+    return json_response(serialize_request(req), etag)
@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
 from models import User
 from extensions import db
+from services.passwords import needs_rehash, PasswordHashingBusy
+from services.rate_limit import refund_rate_limits
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -30,7 +32,20 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHashingBusy:
+            flash('Сервер банд аст. Лутфан пас аз чанд сония дубора кӯшиш кунед.', 'warning')
+            return render_template('auth/login.html'), 503
+        
+        if valid:
+            refund_rate_limits()
+            if needs_rehash(user.password_hash):
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except PasswordHashingBusy:
+                    pass
             login_user(user)
             
             next_page = request.args.get('next')
@@ -1,13 +1,16 @@
-from flask import Blueprint, redirect, url_for, send_from_directory, current_app, request
+from flask import Blueprint, redirect, url_for, send_from_directory, current_app, request, jsonify
 from flask_login import current_user
+from services.assets import get_shell_manifest
+from services.health import get_readiness
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
+    # Replit's deployment check only probes '/'; everything else should use /livez and /readyz
     user_agent = request.headers.get('User-Agent', '').lower()
     if 'healthcheck' in user_agent or 'replit' in user_agent or request.args.get('health') == '1':
-        return 'OK', 200
+        return livez()
     
     if current_user.is_authenticated:
         if current_user.is_admin():
@@ -15,14 +18,31 @@ def index():
         return redirect(url_for('user.dashboard'))
     return redirect(url_for('auth.login'))
 
+@main_bp.route('/livez')
 @main_bp.route('/health')
-def health_check():
-    return 'OK', 200
+def livez():
+    """The process is up and serving; no dependencies are checked."""
+    return 'OK', 200, {'Content-Type': 'text/plain', 'Cache-Control': 'no-store'}
+
+@main_bp.route('/readyz')
+def readyz():
+    """Database, upload folder and media queue checks; 503 takes the worker out of rotation."""
+    readiness = get_readiness()
+    response = jsonify(readiness)
+    response.status_code = 200 if readiness['ready'] else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @main_bp.route('/manifest.json')
 def manifest():
     return send_from_directory('static', 'manifest.json')
 
+@main_bp.route('/asset-manifest.json')
+def asset_manifest():
+    response = jsonify(get_shell_manifest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @main_bp.route('/sw.js')
 def service_worker():
     response = send_from_directory('static/js', 'sw.js')
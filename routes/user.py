@@ -1,10 +1,14 @@
-import os
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort, jsonify
+from flask_wtf.csrf import generate_csrf
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from sqlalchemy.exc import IntegrityError
-from models import Topic, Request
+from sqlalchemy.orm import selectinload
+from models import Topic, Request, RequestMedia
 from extensions import db
+from services.media import send_media, create_attachment, acquire_media, publish_upload, discard_uploads, remove_unreferenced_media
+from services.media_pipeline import process_attachments
+from services import events
 import uuid
 
 user_bp = Blueprint('user', __name__)
@@ -20,10 +24,49 @@ def get_file_extension(filename):
         return filename.rsplit('.', 1)[1].lower()
     return ''
 
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def get_idempotency_key():
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key', '')
+    key = key.strip()
+    return key[:64] if key else None
+
+def find_submitted_request(idempotency_key):
+    if not idempotency_key:
+        return None
+    return Request.query.filter_by(idempotency_key=idempotency_key, user_id=current_user.id).first()
+
+def create_request_error(message, topics, status=400):
+    if wants_json():
+        return jsonify({'success': False, 'error': message}), status
+    flash(message, 'danger')
+    return render_template('user/create_request.html', topics=topics), status
+
+def create_request_done(req, duplicate=False):
+    if not duplicate:
+        flash('Дархости шумо бо муваффақият фиристода шуд!', 'success')
+    if wants_json():
+        return jsonify({
+            'success': True,
+            'id': req.id,
+            'reg_number': req.reg_number,
+            'duplicate': duplicate,
+            'redirect': url_for('user.dashboard')
+        })
+    return redirect(url_for('user.dashboard'))
+
+def store_attachments(attachments):
+    # The reference comes first: from then on the files cannot be cleaned up
+    for attachment in attachments:
+        acquire_media(attachment.filename)
+        publish_upload(attachment)
+
 @user_bp.route('/dashboard')
 @login_required
 def dashboard():
     requests = Request.query.filter_by(user_id=current_user.id)\
+                           .options(selectinload(Request.attachments))\
                            .order_by(Request.created_at.desc()).all()
     return render_template('user/dashboard.html', requests=requests)
 
@@ -33,36 +76,37 @@ def create_request():
     topics = Topic.query.order_by(Topic.title).all()
     
     if not topics:
+        if request.method == 'POST' and wants_json():
+            return jsonify({'success': False, 'error': 'Ҳоло мавзӯъҳо нестанд.'}), 400
         flash('Ҳоло мавзӯъҳо нестанд. Лутфан баъдтар кӯшиш кунед.', 'warning')
         return redirect(url_for('user.dashboard'))
     
     if request.method == 'POST':
+        # Offline outbox replays (static/js/outbox.js) resend the same key
+        idempotency_key = get_idempotency_key()
+        existing = find_submitted_request(idempotency_key)
+        if existing:
+            return create_request_done(existing, duplicate=True)
+        
         topic_id = request.form.get('topic_id', type=int)
         latitude = request.form.get('latitude', type=float)
         longitude = request.form.get('longitude', type=float)
         comment = request.form.get('comment', '').strip()
         
         if not topic_id:
-            flash('Мавзӯъро интихоб кунед.', 'danger')
-            return render_template('user/create_request.html', topics=topics)
+            return create_request_error('Мавзӯъро интихоб кунед.', topics)
         
         topic = Topic.query.get(topic_id)
         if not topic:
-            flash('Мавзӯъи интихобшуда ёфт нашуд.', 'danger')
-            return render_template('user/create_request.html', topics=topics)
+            return create_request_error('Мавзӯъи интихобшуда ёфт нашуд.', topics)
         
-        media_filename = None
-        if 'media' in request.files:
-            file = request.files['media']
-            if file and file.filename and allowed_file(file.filename):
-                ext = get_file_extension(file.filename)
-                unique_filename = f"{uuid.uuid4().hex}.{ext}"
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(file_path)
-                media_filename = unique_filename
-            elif file and file.filename and not allowed_file(file.filename):
-                flash('Формати файл иҷозат дода нашудааст. Танҳо расм, видео ва ҳуҷҷатҳо (PDF, DOC) иҷозат аст.', 'danger')
-                return render_template('user/create_request.html', topics=topics)
+        files = [file for file in request.files.getlist('media') if file and file.filename]
+        max_attachments = current_app.config['MAX_ATTACHMENTS']
+        if len(files) > max_attachments:
+            return create_request_error(f'Ҳадди аксар {max_attachments} файл замима кардан мумкин аст.', topics)
+        if not all(allowed_file(file.filename) for file in files):
+            return create_request_error('Формати файл иҷозат дода нашудааст. Танҳо расм, видео ва ҳуҷҷатҳо (PDF, DOC) иҷозат аст.', topics)
+        attachments = [create_attachment(file, position) for position, file in enumerate(files)]
         
         new_request = Request(
             user_id=current_user.id,
@@ -70,31 +114,54 @@ def create_request():
             latitude=latitude,
             longitude=longitude,
             comment=comment,
-            media_filename=media_filename,
-            status='under_review'
+            attachments=attachments,
+            status='under_review',
+            idempotency_key=idempotency_key
         )
         
         max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                new_request.reg_number = Request.generate_reg_number()
-                new_request.document_number = Request.generate_document_number()
-                db.session.add(new_request)
-                db.session.commit()
-                break
-            except IntegrityError:
-                db.session.rollback()
-                if attempt == max_retries - 1:
-                    new_request.reg_number = f'NAZ-{uuid.uuid4().hex[:8].upper()}'
-                    new_request.document_number = f'DOC-{uuid.uuid4().hex[:8].upper()}'
+        try:
+            for attempt in range(max_retries):
+                try:
+                    if attempt < max_retries - 1:
+                        new_request.reg_number = Request.generate_reg_number()
+                        new_request.document_number = Request.generate_document_number()
+                    else:
+                        new_request.reg_number = f'NAZ-{uuid.uuid4().hex[:8].upper()}'
+                        new_request.document_number = f'DOC-{uuid.uuid4().hex[:8].upper()}'
+                    store_attachments(attachments)
                     db.session.add(new_request)
                     db.session.commit()
+                    break
+                except IntegrityError:
+                    db.session.rollback()
+                    existing = find_submitted_request(idempotency_key)
+                    if existing:
+                        remove_unreferenced_media(*[attachment.filename for attachment in attachments])
+                        return create_request_done(existing, duplicate=True)
+                    # Another worker's key: a new registration number won't help
+                    if idempotency_key and Request.query.filter_by(idempotency_key=idempotency_key).first():
+                        remove_unreferenced_media(*[attachment.filename for attachment in attachments])
+                        return create_request_error('Калиди дархост аллакай истифода шудааст. Лутфан дархостро аз нав фиристед.', topics, 409)
+            else:
+                remove_unreferenced_media(*[attachment.filename for attachment in attachments])
+                return create_request_error('Дархост нигоҳ дошта нашуд. Лутфан дубора кӯшиш кунед.', topics, 503)
+        finally:
+            discard_uploads(attachments)
         
-        flash('Дархости шумо бо муваффақият фиристода шуд!', 'success')
-        return redirect(url_for('user.dashboard'))
+        process_attachments(new_request)
+        db.session.commit()
+        events.publish('request-created', new_request)
+        
+        return create_request_done(new_request)
     
     return render_template('user/create_request.html', topics=topics)
 
+@user_bp.route('/csrf-token')
+@login_required
+def csrf_token():
+    return jsonify({'csrf_token': generate_csrf()})
+
 @user_bp.route('/request/<int:id>')
 @login_required
 def view_request(id):
@@ -105,3 +172,31 @@ def view_request(id):
         return redirect(url_for('user.dashboard'))
     
     return render_template('user/view_request.html', request=req)
+
+@user_bp.route('/request/<int:id>/attachments/<int:media_id>', defaults={'kind': 'original'})
+@user_bp.route('/request/<int:id>/attachments/<int:media_id>/<kind>')
+@login_required
+def attachment_file(id, media_id, kind):
+    attachment = RequestMedia.query.filter_by(id=media_id, request_id=id).first_or_404()
+    
+    if attachment.request.user_id != current_user.id and not current_user.is_admin():
+        abort(403)
+    
+    filename = {
+        'original': attachment.filename,
+        'thumb': attachment.thumb,
+        'web': attachment.web,
+        'poster': attachment.poster
+    }.get(kind)
+    if not filename:
+        abort(404)
+    
+    return send_media(filename)
+
+@user_bp.route('/request/<int:id>/media', defaults={'kind': 'original'})
+@user_bp.route('/request/<int:id>/media/<kind>')
+@login_required
+def request_media(id, kind):
+    """First attachment; kept for links and offline caches made before request_media."""
+    attachment = RequestMedia.query.filter_by(request_id=id).order_by(RequestMedia.position).first_or_404()
+    return attachment_file(id, attachment.id, kind)
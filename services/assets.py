@@ -0,0 +1,69 @@
+import os
+import hashlib
+from flask import current_app, url_for, request
+
+ASSET_DIRS = ('css', 'js', 'icons', 'images')
+
+# Files the service worker precaches as the app shell
+APP_SHELL_ASSETS = (
+    'css/style.css',
+    'js/outbox.js',
+    'js/app.js',
+    'icons/favicon.svg',
+    'icons/camera-logo.png',
+    'icons/icon-192.png',
+)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def build_asset_manifest(static_folder):
+    """Content hashes of the static assets, computed once at startup."""
+    hashes = {}
+    for directory in ASSET_DIRS:
+        root = os.path.join(static_folder, directory)
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                if filename == 'js/sw.js':
+                    continue
+                with open(path, 'rb') as f:
+                    hashes[filename] = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    version = hashlib.sha256(
+        ''.join(f'{name}:{digest}' for name, digest in sorted(hashes.items())).encode()
+    ).hexdigest()[:12]
+    return {'version': version, 'hashes': hashes}
+
+
+def init_assets(app):
+    app.extensions['asset_manifest'] = build_asset_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['asset_version'] = app.extensions['asset_manifest']['version']
+
+
+def asset_url(filename):
+    """Fingerprinted URL for a static file, e.g. /static/css/style.css?v=3f2a9c1b0d4e."""
+    digest = current_app.extensions['asset_manifest']['hashes'].get(filename)
+    if digest:
+        return url_for('static', filename=filename, v=digest)
+    return url_for('static', filename=filename)
+
+
+def is_fingerprinted_request():
+    if request.endpoint != 'static':
+        return False
+    filename = (request.view_args or {}).get('filename')
+    digest = current_app.extensions['asset_manifest']['hashes'].get(filename)
+    return digest is not None and request.args.get('v') == digest
+
+
+def get_shell_manifest():
+    """Versioned manifest consumed by the service worker at install time."""
+    manifest = current_app.extensions['asset_manifest']
+    return {
+        'version': manifest['version'],
+        'precache': [asset_url(filename) for filename in APP_SHELL_ASSETS] + ['/manifest.json'],
+        'assets': {filename: asset_url(filename) for filename in manifest['hashes']}
+    }
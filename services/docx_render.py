@@ -0,0 +1,226 @@
+import os
+import re
+import zipfile
+import threading
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+# Fills the .docx layouts in templates/docx instead of building documents with
+# python-docx. A template is compiled once per process into literal XML chunks
+# and placeholders, so producing a document is a string join plus a ZIP write.
+#
+# Template syntax (typed as plain text in Word or LibreOffice):
+#   {{name}}                 value of `name`
+#   {{#name}} ... {{/name}}  paragraphs kept only when `name` is truthy; the
+#                            marker paragraphs themselves are dropped
+#   {{rows.field}}           repeats the table row (or, outside a table, the
+#                            paragraph) once per item of the list `rows`
+# A Picture value puts an inline image in place of its placeholder.
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'docx')
+
+DOCUMENT = 'word/document.xml'
+RELS = 'word/_rels/document.xml.rels'
+CONTENT_TYPES = '[Content_Types].xml'
+
+EMU_PER_INCH = 914400
+
+_P_OPEN = r'<w:p(?:\s[^>]*)?(?<!/)>'
+_IN_P = r'(?:(?!</w:p>).)*?'
+_SECTION_OPEN = re.compile(_P_OPEN + _IN_P + r'\{\{#(\w+)\}\}' + _IN_P + r'</w:p>', re.S)
+_SECTION_CLOSE = r'{open}{inside}\{{\{{/{name}\}}\}}{inside}</w:p>'
+_PLACEHOLDER = re.compile(r'\{\{(\w+)(?:\.(\w+))?\}\}')
+_PARAGRAPH = re.compile(_P_OPEN + r'.*?</w:p>', re.S)
+_ROW = re.compile(r'<w:tr(?:\s[^>]*)?>.*?</w:tr>', re.S)
+# Word may split a placeholder typed in one go over several runs
+_SPLIT_PLACEHOLDER = re.compile(r'\{(?:<[^>]+>)*\{(?:[^{}<]|<[^>]+>)*?\}(?:<[^>]+>)*\}')
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+class Picture:
+    """An image for a placeholder; `width` in inches, the height follows the aspect ratio."""
+
+    def __init__(self, path, width):
+        self.path = path
+        self.width = width
+
+
+class DocxTemplate:
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as source:
+            xml = source.read(DOCUMENT).decode('utf-8')
+            self.rels = source.read(RELS).decode('utf-8')
+            self.content_types = source.read(CONTENT_TYPES).decode('utf-8')
+            # Every other part is copied unchanged into each document: compress it once here
+            base = BytesIO()
+            with zipfile.ZipFile(base, 'w', zipfile.ZIP_DEFLATED) as target:
+                for info in source.infolist():
+                    if info.filename not in (DOCUMENT, RELS, CONTENT_TYPES):
+                        target.writestr(info.filename, source.read(info))
+        self.base = base.getvalue()
+        xml = _SPLIT_PLACEHOLDER.sub(lambda m: re.sub(r'<[^>]+>', '', m.group(0)), xml)
+        xml = xml.replace('<w:t>', '<w:t xml:space="preserve">')
+        self.nodes = _compile(xml)
+
+    def render(self, context):
+        pictures = []
+        xml = ''.join(_render(self.nodes, context, pictures))
+        rels = self.rels
+        content_types = self.content_types
+        if pictures:
+            rels = rels.replace('</Relationships>', ''.join(
+                f'<Relationship Id="rIdPicture{i}" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+                f'Target="media/picture{i}.{ext}"/>'
+                for i, (ext, _) in enumerate(pictures, start=1)
+            ) + '</Relationships>')
+            for ext in {ext for ext, _ in pictures}:
+                if f'Extension="{ext}"' not in content_types:
+                    content_types = content_types.replace(
+                        '<Default ', f'<Default Extension="{ext}" ContentType="image/{ext}"/><Default ', 1
+                    )
+
+        buffer = BytesIO(self.base)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as target:
+            target.writestr(CONTENT_TYPES, content_types)
+            target.writestr(RELS, rels)
+            target.writestr(DOCUMENT, xml)
+            # JPEG/PNG data is already compressed
+            for i, (ext, data) in enumerate(pictures, start=1):
+                target.writestr(f'word/media/picture{i}.{ext}', data, zipfile.ZIP_STORED)
+        buffer.seek(0)
+        return buffer
+
+
+def _compile(xml):
+    """Split template XML into literal strings, fields, sections and repeated blocks."""
+    nodes = []
+    pos = 0
+    while True:
+        opening = _SECTION_OPEN.search(xml, pos)
+        if opening is None:
+            nodes.extend(_compile_repeats(xml[pos:]))
+            return nodes
+        name = opening.group(1)
+        closing = re.compile(_SECTION_CLOSE.format(open=_P_OPEN, inside=_IN_P, name=name), re.S)
+        end = closing.search(xml, opening.end())
+        if end is None:
+            raise ValueError(f'Template section {{{{#{name}}}}} is not closed')
+        nodes.extend(_compile_repeats(xml[pos:opening.start()]))
+        nodes.append(('section', name, _compile(xml[opening.end():end.start()])))
+        pos = end.end()
+
+
+def _compile_repeats(xml):
+    nodes = []
+    pos = 0
+    while True:
+        field = next((m for m in _PLACEHOLDER.finditer(xml, pos) if m.group(2)), None)
+        if field is None:
+            nodes.extend(_compile_fields(xml[pos:]))
+            return nodes
+        block = _enclosing(_ROW, xml, field.start()) or _enclosing(_PARAGRAPH, xml, field.start())
+        nodes.extend(_compile_fields(xml[pos:block.start()]))
+        nodes.append(('repeat', field.group(1), _compile_fields(block.group(0))))
+        pos = block.end()
+
+
+def _enclosing(pattern, xml, index):
+    for match in pattern.finditer(xml):
+        if match.start() > index:
+            return None
+        if match.end() > index:
+            return match
+    return None
+
+
+def _compile_fields(xml):
+    nodes = []
+    pos = 0
+    for match in _PLACEHOLDER.finditer(xml):
+        nodes.append(xml[pos:match.start()])
+        nodes.append(('field', match.group(1), match.group(2)))
+        pos = match.end()
+    nodes.append(xml[pos:])
+    return [node for node in nodes if node != '']
+
+
+def _render(nodes, context, pictures, item=None):
+    for node in nodes:
+        if isinstance(node, str):
+            yield node
+        elif node[0] == 'field':
+            value = item.get(node[2]) if node[2] and item is not None else context.get(node[1])
+            yield _format(value, pictures)
+        elif node[0] == 'section':
+            if context.get(node[1]):
+                yield from _render(node[2], context, pictures, item)
+        else:
+            for row in context.get(node[1]) or ():
+                yield from _render(node[2], context, pictures, row)
+
+
+def _format(value, pictures):
+    if value is None:
+        return ''
+    if isinstance(value, Picture):
+        return _format_picture(value, pictures)
+    text = escape(str(value))
+    return text.replace('\n', '</w:t><w:br/><w:t xml:space="preserve">')
+
+
+def _format_picture(picture, pictures):
+    from PIL import Image
+    try:
+        # Only the header is read for the size
+        with Image.open(picture.path) as image:
+            width, height = image.size
+            ext = 'png' if image.format == 'PNG' else 'jpeg'
+        with open(picture.path, 'rb') as f:
+            data = f.read()
+    except Exception as e:
+        return escape(f'Расмро илова кардан имконнопазир: {str(e)}')
+
+    pictures.append((ext, data))
+    number = len(pictures)
+    # Drawing ids must be unique in the document; leave room for the template's own
+    drawing_id = 1000 + number
+    cx = int(picture.width * EMU_PER_INCH)
+    cy = int(cx * height / width)
+    name = escape(os.path.basename(picture.path), {'"': '&quot;'})
+    return (
+        '</w:t></w:r><w:r><w:drawing>'
+        f'<wp:inline distT="0" distB="0" distL="0" distR="0"><wp:extent cx="{cx}" cy="{cy}"/>'
+        f'<wp:docPr id="{drawing_id}" name="Picture {number}"/>'
+        '<wp:cNvGraphicFramePr><a:graphicFrameLocks xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+        '<a:graphic xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main">'
+        '<a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        '<pic:pic xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        f'<pic:nvPicPr><pic:cNvPr id="{drawing_id}" name="{name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="rIdPicture{number}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+        '</pic:pic></a:graphicData></a:graphic></wp:inline>'
+        '</w:drawing></w:r><w:r><w:t xml:space="preserve">'
+    )
+
+
+def get_template(name):
+    """Compiled template, reloaded only when its file changes."""
+    path = os.path.join(TEMPLATE_FOLDER, name)
+    mtime = os.path.getmtime(path)
+    with _templates_lock:
+        cached = _templates.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    template = DocxTemplate(path)
+    with _templates_lock:
+        _templates[name] = (mtime, template)
+    return template
+
+
+def render_docx(name, context):
+    """Fill templates/docx/<name> from `context`; returns a BytesIO positioned at 0."""
+    return get_template(name).render(context)
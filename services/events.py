@@ -0,0 +1,129 @@
+# Live events for the admin pages (request created/read/status changed/replied/deleted).
+# On PostgreSQL events go through NOTIFY so every gunicorn worker sees them and a
+# listener thread per process relays them to its subscribers; with SQLite they are
+# dispatched in-process only. Each open /admin/events stream holds a connection,
+# so it needs an async-capable worker class (gevent or gthread), and a worker takes
+# at most EVENTS_MAX_STREAMS of them.
+import json
+import queue
+import select
+import threading
+import time
+from sqlalchemy import func, text
+from flask import current_app
+
+CHANNEL = 'nazorat_events'
+QUEUE_SIZE = 100
+
+_subscribers = set()
+_lock = threading.Lock()
+_listener = None
+
+
+def use_notify(app):
+    backend = app.config.get('EVENTS_BACKEND', 'auto')
+    if backend == 'auto':
+        from extensions import db
+        return db.engine.dialect.name == 'postgresql'
+    return backend == 'postgres'
+
+
+def subscribe():
+    """Queue of the events to come, or None when this process has no room for another stream."""
+    app = current_app._get_current_object()
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        if len(_subscribers) >= app.config['EVENTS_MAX_STREAMS']:
+            return None
+        _subscribers.add(q)
+    if use_notify(app):
+        _ensure_listener(app)
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.discard(q)
+
+
+def dispatch(event):
+    with _lock:
+        subscribers = list(_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            # A stalled client only loses events; the page recovers on reload
+            pass
+
+
+def publish(event_type, req):
+    """Announce a change to one request; call after the change is committed."""
+    from extensions import db
+    from models import Request
+
+    event = {'type': event_type, 'request_id': req.id, 'user_id': req.user_id}
+    if event_type != 'request-deleted':
+        event.update({
+            'reg_number': req.reg_number,
+            'status': req.get_effective_status(),
+            'status_label': req.get_status_label(),
+            'status_class': req.get_status_class()
+        })
+    if req.user_id is not None:
+        # Absolute counters, so clients never drift when they miss an event
+        event['worker_total'], event['worker_new'] = db.session.query(
+            func.count(Request.id),
+            func.count(Request.id).filter(Request.admin_read_at.is_(None), Request.status != 'completed')
+        ).filter(Request.user_id == req.user_id).one()
+
+    try:
+        if use_notify(current_app):
+            with db.engine.begin() as conn:
+                conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                             {'channel': CHANNEL, 'payload': json.dumps(event)})
+        else:
+            dispatch(event)
+    except Exception as e:
+        print(f'Event publish {event_type}: {e}')
+
+
+def _ensure_listener(app):
+    global _listener
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, args=(app,), name='events-listener', daemon=True)
+            _listener.start()
+
+
+def _listen(app):
+    from extensions import db
+
+    while True:
+        raw = None
+        try:
+            with app.app_context():
+                raw = db.engine.raw_connection()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        dispatch(json.loads(notify.payload))
+                    except ValueError:
+                        pass
+        except Exception as e:
+            print(f'Events listener: {e}')
+            time.sleep(5)
+        finally:
+            if raw is not None:
+                try:
+                    raw.invalidate()
+                except Exception:
+                    pass
@@ -0,0 +1,208 @@
+from datetime import timedelta
+from sqlalchemy import func
+
+# Data behind the statistics page and every download (DOCX, XLSX, CSV, PDF,
+# the protocol ZIP). Only the columns a document shows are selected, with the
+# topic and author joined in the same query, and each row becomes a plain dict
+# once here; no model instances are loaded, so there are no per-row lazy loads
+# and nothing piles up in the session's identity map. Row iterators fetch
+# BATCH_SIZE rows at a time.
+
+BATCH_SIZE = 500
+# Protocols are read with their attachments, a batch of ids per query pair
+PROTOCOL_BATCH_SIZE = 50
+DATETIME_FORMAT = '%d.%m.%Y %H:%M'
+
+
+def format_datetime(value, default=''):
+    return value.strftime(DATETIME_FORMAT) if value else default
+
+
+def get_date_filters(date_from, date_to):
+    """Conditions on Request.created_at for the YYYY-MM-DD filter values, as days in
+    ORG_TIMEZONE; invalid values are ignored."""
+    from models import Request
+    from services.histogram import parse_date, to_utc
+    filters = []
+    start, end = parse_date(date_from), parse_date(date_to)
+    if start:
+        filters.append(Request.created_at >= to_utc(start))
+    if end:
+        filters.append(Request.created_at < to_utc(end + timedelta(days=1)))
+    return filters
+
+
+def get_statistics_data(date_from='', date_to=''):
+    """Totals, per-topic counts and user counts for the statistics page and its downloads."""
+    from extensions import db
+    from models import User, Topic, Request
+    counts = db.session.query(Request.topic_id, Request.status, func.count(Request.id)).filter(
+        *get_date_filters(date_from, date_to)
+    ).group_by(Request.topic_id, Request.status).all()
+
+    total_requests = sum(count for _, _, count in counts)
+    completed_requests = sum(count for _, status, count in counts if status == 'completed')
+    under_review_requests = sum(count for _, status, count in counts if status == 'under_review')
+
+    per_topic = {}
+    for topic_id, status, count in counts:
+        topic_counts = per_topic.setdefault(topic_id, [0, 0])
+        topic_counts[0] += count
+        if status == 'completed':
+            topic_counts[1] += count
+
+    topic_stats = []
+    for topic_id, title, color in db.session.query(Topic.id, Topic.title, Topic.color).order_by(Topic.id):
+        count, completed = per_topic.get(topic_id, (0, 0))
+        topic_stats.append({
+            'id': topic_id,
+            'title': title,
+            'color': color,
+            'count': count,
+            'completed': completed,
+            'pending': count - completed,
+            'percentage': round((count / total_requests * 100), 1) if total_requests > 0 else 0
+        })
+    topic_stats.sort(key=lambda x: x['count'], reverse=True)
+
+    roles = dict(db.session.query(User.role, func.count(User.id)).group_by(User.role).all())
+
+    return {
+        'total_requests': total_requests,
+        'completed_requests': completed_requests,
+        'under_review_requests': under_review_requests,
+        'completion_rate': round((completed_requests / total_requests * 100), 1) if total_requests > 0 else 0,
+        'topic_stats': topic_stats,
+        'total_users': roles.get('user', 0),
+        'total_admins': roles.get('admin', 0)
+    }
+
+
+def get_worker_data(user_id):
+    """Header fields of a worker report; None if there is no such user."""
+    from extensions import db
+    from models import User
+    row = db.session.query(User.username, User.full_name, User.role, User.created_at).filter(
+        User.id == user_id
+    ).first()
+    if row is None:
+        return None
+    return {
+        'username': row.username,
+        'full_name': row.full_name or row.username,
+        'role': row.role,
+        'created_at': row.created_at.strftime('%d.%m.%Y') if row.created_at else ''
+    }
+
+
+def iter_worker_requests(user_id):
+    """Protocols of one worker, newest first, as rows of the worker report."""
+    from extensions import db
+    from models import Topic, Request
+    query = db.session.query(
+        Request.id, Request.reg_number, Topic.title.label('topic'), Request.created_at,
+        Request.status, Request.admin_read_at, Request.comment
+    ).outerjoin(Topic, Topic.id == Request.topic_id).filter(
+        Request.user_id == user_id
+    ).order_by(Request.created_at.desc(), Request.id.desc())
+
+    for row in query.yield_per(BATCH_SIZE):
+        yield {
+            'reg_number': row.reg_number or f'#{row.id}',
+            'topic': row.topic or '',
+            'created_at': format_datetime(row.created_at),
+            'status': row.status,
+            'status_label': Request.status_label(row.status, row.admin_read_at),
+            'comment': row.comment or ''
+        }
+
+
+def iter_protocol_data(request_ids):
+    """(row, request_data, attachments) per protocol, in the order of `request_ids`.
+
+    `row` has the id and reg_number for file names; request_data and
+    attachments are what create_protocol_word_document() takes. Missing ids
+    are skipped.
+    """
+    from extensions import db
+    from models import User, Topic, Request
+    for start in range(0, len(request_ids), PROTOCOL_BATCH_SIZE):
+        batch_ids = request_ids[start:start + PROTOCOL_BATCH_SIZE]
+        rows = db.session.query(
+            Request.id, Request.reg_number, Request.document_number, Topic.title.label('topic'),
+            User.username, User.full_name, Request.created_at, Request.status, Request.latitude,
+            Request.longitude, Request.admin_read_at, Request.comment, Request.reply, Request.replied_at
+        ).outerjoin(Topic, Topic.id == Request.topic_id).outerjoin(User, User.id == Request.user_id).filter(
+            Request.id.in_(batch_ids)
+        ).all()
+        attachments = _get_protocol_attachments(batch_ids)
+        order = {id: i for i, id in enumerate(batch_ids)}
+        for row in sorted(rows, key=lambda r: order[r.id]):
+            yield row, _get_request_data(row), attachments.get(row.id, [])
+
+
+def get_protocol_data(request_id):
+    """(row, request_data, attachments) of one protocol; None if it does not exist."""
+    return next(iter_protocol_data([request_id]), None)
+
+
+def _get_request_data(row):
+    from models import Request
+    coordinates = ''
+    if row.latitude and row.longitude:
+        coordinates = f"{row.latitude}, {row.longitude}"
+    if row.username:
+        username = row.full_name or row.username
+    else:
+        username = 'Нест шуд'
+
+    return {
+        'reg_number': row.reg_number or f'#{row.id}',
+        'document_number': row.document_number or '',
+        'topic': row.topic or '',
+        'username': username,
+        'created_at': format_datetime(row.created_at),
+        'status_label': Request.status_label(row.status, row.admin_read_at),
+        'coordinates': coordinates if coordinates else 'Нест',
+        'admin_read_at': format_datetime(row.admin_read_at, 'Нахонда'),
+        'comment': row.comment or '',
+        'admin_reply': row.reply or '',
+        'admin_reply_at': format_datetime(row.replied_at)
+    }
+
+
+def _get_protocol_attachments(request_ids):
+    """Attachment dicts of the given protocols, by request id."""
+    from extensions import db
+    from models import RequestMedia
+    from services.media import get_media_path, ensure_image_rendition
+
+    columns = (RequestMedia.id, RequestMedia.request_id, RequestMedia.kind, RequestMedia.filename,
+               RequestMedia.original_name, RequestMedia.thumb, RequestMedia.poster,
+               RequestMedia.duration, RequestMedia.width, RequestMedia.height)
+    rows = db.session.query(*columns).filter(
+        RequestMedia.request_id.in_(request_ids)
+    ).order_by(RequestMedia.request_id, RequestMedia.position).all()
+
+    # Photos attached before request_media get their rendition on first export;
+    # only these are loaded as models, to store it
+    legacy_ids = [row.id for row in rows if row.kind == 'image' and not row.thumb]
+    if legacy_ids:
+        for attachment in RequestMedia.query.filter(RequestMedia.id.in_(legacy_ids)):
+            ensure_image_rendition(attachment)
+        db.session.commit()
+        rows = db.session.query(*columns).filter(
+            RequestMedia.request_id.in_(request_ids)
+        ).order_by(RequestMedia.request_id, RequestMedia.position).all()
+
+    attachments = {}
+    for row in rows:
+        picture = row.thumb if row.kind == 'image' else row.poster
+        attachments.setdefault(row.request_id, []).append({
+            'kind': row.kind,
+            'name': row.original_name or row.filename,
+            'picture_path': get_media_path(picture) if picture else None,
+            'info': RequestMedia.info_label(row.duration, row.width, row.height) if row.kind == 'video' else ''
+        })
+    return attachments
+
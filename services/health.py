@@ -0,0 +1,88 @@
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app, request
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy import text
+
+PROBE_PATHS = frozenset({'/livez', '/readyz', '/health'})
+
+_lock = threading.Lock()
+_cached = None
+_cached_at = 0.0
+_db_ping = None
+
+# A single thread for the DB ping: a hung database can block at most one thread,
+# and the cached failure answers the probes meanwhile.
+_ping_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='readyz')
+
+
+class ProbeSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, except probes never load or write one."""
+
+    def open_session(self, app, request):
+        if request.path in PROBE_PATHS:
+            return self.null_session_class()
+        return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if request.path in PROBE_PATHS:
+            return
+        super().save_session(app, session, response)
+
+
+def _ping_database(app):
+    from extensions import db
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+
+def check_database(app):
+    global _db_ping
+    started = time.monotonic()
+    # Reuse a ping that is still running instead of queueing another one
+    if _db_ping is None or _db_ping.done():
+        _db_ping = _ping_executor.submit(_ping_database, app)
+    try:
+        _db_ping.result(timeout=app.config['READINESS_DB_TIMEOUT'])
+    except TimeoutError:
+        return {'ok': False, 'error': 'timeout'}
+    except Exception as e:
+        return {'ok': False, 'error': type(e).__name__}
+    return {'ok': True, 'ms': round((time.monotonic() - started) * 1000, 1)}
+
+
+def check_uploads(app):
+    try:
+        with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], prefix='.readyz-'):
+            pass
+    except OSError as e:
+        return {'ok': False, 'error': e.strerror or type(e).__name__}
+    return {'ok': True}
+
+
+def check_media_queue(app):
+    from services.media_pipeline import get_queue_status
+    status = get_queue_status()
+    status['ok'] = not status['broken'] and status['pending'] <= app.config['READINESS_MAX_MEDIA_BACKLOG']
+    return status
+
+
+def get_readiness():
+    """Result of the readiness checks, recomputed at most every READINESS_CACHE_SECONDS."""
+    global _cached, _cached_at
+    app = current_app._get_current_object()
+    with _lock:
+        if _cached is not None and time.monotonic() - _cached_at < app.config['READINESS_CACHE_SECONDS']:
+            return _cached
+        checks = {
+            'database': check_database(app),
+            'uploads': check_uploads(app),
+            'media_queue': check_media_queue(app)
+        }
+        _cached = {'ready': all(check['ok'] for check in checks.values()), 'checks': checks}
+        _cached_at = time.monotonic()
+        return _cached
@@ -0,0 +1,151 @@
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from flask import current_app
+from sqlalchemy import func, cast, Date
+
+# Protocols per day, week or month for the statistics chart. created_at is
+# stored as naive UTC; days are those of ORG_TIMEZONE. The counts come from one
+# grouped query:
+#   PostgreSQL  grouped by the local date (timezone() in SQL)
+#   SQLite      grouped by the date shifted by the zone's UTC offset when that
+#               offset is the same over the whole range, otherwise by UTC hour
+#               and folded into local days here
+# Ranges with more than HISTOGRAM_MAX_POINTS days are shown by week, then by
+# month (several months per point if needed), so the chart stays readable.
+
+DEFAULT_DAYS = 30
+
+
+def get_org_timezone():
+    return ZoneInfo(current_app.config['ORG_TIMEZONE'])
+
+
+def get_local_today():
+    return datetime.now(get_org_timezone()).date()
+
+
+def to_utc(day, tz=None):
+    """Naive UTC datetime of the start of `day` in `tz` (the organisation's timezone by default)."""
+    start = datetime.combine(day, time.min, tzinfo=tz or get_org_timezone())
+    return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_date(value):
+    """A YYYY-MM-DD filter value as a date; None when empty or invalid."""
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+    # Years far out would overflow the UTC conversion
+    return day if day is None or 1900 <= day.year <= 2999 else None
+
+
+def get_range(date_from, date_to):
+    """First and last local day shown: the filter dates, or the last DEFAULT_DAYS days."""
+    end = parse_date(date_to) or get_local_today()
+    start = parse_date(date_from) or end - timedelta(days=DEFAULT_DAYS - 1)
+    return start, end
+
+
+def get_granularity(start, end, max_points):
+    """('day' | 'week' | 'month', units per point) keeping the chart within max_points."""
+    days = (end - start).days + 1
+    if days <= max_points:
+        return 'day', 1
+    monday = start - timedelta(days=start.weekday())
+    if ((end - monday).days // 7) + 1 <= max_points:
+        return 'week', 1
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    return 'month', -(-months // max_points)
+
+
+def get_histogram(date_from='', date_to=''):
+    """Chart points [{'date', 'title', 'count'}] for the statistics page."""
+    from services.statistics_cache import get_cached
+    start, end = get_range(date_from, date_to)
+    if start > end:
+        return []
+    return get_cached('histogram', _compute_histogram, start.isoformat(), end.isoformat(),
+                      current_app.config['ORG_TIMEZONE'], current_app.config['HISTOGRAM_MAX_POINTS'])
+
+
+def get_buckets(start, end, max_points):
+    """Chart points of the range as (first day, last day, label, title), at most max_points of them."""
+    unit, step = get_granularity(start, end, max_points)
+    buckets = []
+    day = start
+    while day <= end:
+        key = _bucket_start(day, start, unit, step)
+        if not buckets or buckets[-1][0] != key:
+            buckets.append([key, day, day])
+        buckets[-1][2] = day
+        day += timedelta(days=1)
+    # Points are labelled by the days they cover inside the range
+    return [(first, last, _label(first, unit), _title(first, last, unit)) for _, first, last in buckets]
+
+
+def _compute_histogram(start, end, tz_name, max_points):
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    buckets = get_buckets(start, end, max_points)
+    counts = dict(_count_per_day(start, end, ZoneInfo(tz_name)))
+
+    points = []
+    for first, last, label, title in buckets:
+        count = 0
+        day = first
+        while day <= last:
+            count += counts.get(day, 0)
+            day += timedelta(days=1)
+        points.append({'date': label, 'title': title, 'count': count})
+    return points
+
+
+def _bucket_start(day, start, unit, step):
+    if unit == 'day':
+        return day
+    if unit == 'week':
+        return day - timedelta(days=day.weekday())
+    months = (day.year - start.year) * 12 + day.month - start.month
+    return months - months % step
+
+
+def _label(day, unit):
+    return day.strftime('%m.%Y') if unit == 'month' else day.strftime('%d.%m')
+
+
+def _title(first, last, unit):
+    if unit == 'day':
+        return f"Санаи {first.strftime('%d.%m.%Y')}"
+    if unit == 'month' and (first.year, first.month) == (last.year, last.month):
+        return f"Моҳи {first.strftime('%m.%Y')}"
+    return f"{first.strftime('%d.%m.%Y')} – {last.strftime('%d.%m.%Y')}"
+
+
+def _count_per_day(start, end, tz):
+    """(local date, count) pairs from one grouped query."""
+    from extensions import db
+    from models import Request
+
+    window = (Request.created_at >= to_utc(start, tz), Request.created_at < to_utc(end + timedelta(days=1), tz))
+
+    if db.engine.dialect.name == 'postgresql':
+        local_day = cast(func.timezone(tz.key, func.timezone('UTC', Request.created_at)), Date)
+        return db.session.query(local_day, func.count(Request.id)).filter(*window).group_by(local_day).all()
+
+    offsets = {tz.utcoffset(datetime.combine(start + timedelta(days=i), time.min))
+               for i in range((end - start).days + 2)}
+    if len(offsets) == 1:
+        minutes = int(offsets.pop().total_seconds() // 60)
+        local_day = func.date(Request.created_at, f'{minutes:+d} minutes')
+        rows = db.session.query(local_day, func.count(Request.id)).filter(*window).group_by(local_day).all()
+        return [(date.fromisoformat(day), count) for day, count in rows]
+
+    # The offset changes inside the range (daylight saving time)
+    hour = func.strftime('%Y-%m-%d %H:00:00', Request.created_at)
+    counts = {}
+    for value, count in db.session.query(hour, func.count(Request.id)).filter(*window).group_by(hour):
+        utc_hour = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+        day = utc_hour.astimezone(tz).date()
+        counts[day] = counts.get(day, 0) + count
+    return counts.items()
+
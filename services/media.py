@@ -0,0 +1,295 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import mimetypes
+from flask import current_app, request, send_file, abort
+
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+IMAGE_RESIZE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{32}(?:[0-9a-f]{32})?(?:_[a-z]+)?\.[a-z0-9]+$')
+
+
+def get_media_path(filename):
+    """Absolute path of an uploaded media file inside UPLOAD_FOLDER."""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+
+
+def remove_media_files(*filenames):
+    for filename in filenames:
+        if not filename:
+            continue
+        path = get_media_path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def file_sha256(file):
+    """SHA-256 of an uploaded FileStorage; services/uploads.py computes it while streaming."""
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+        sha256.update(chunk)
+    file.stream.seek(0)
+    return sha256.hexdigest()
+
+
+def path_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def prepare_upload(file, ext):
+    """Write an upload to a temporary file of its own, downscaled if it is a large
+    photo, and return (temporary path, content-addressed name of those bytes)."""
+    digest = file_sha256(file)
+    upload_path = get_media_path(f'.upload-{uuid.uuid4().hex}.{ext}')
+    file.save(upload_path)
+    if downscale_image(upload_path, current_app.config['IMAGE_UPLOAD_MAX_DIMENSION']):
+        digest = path_sha256(upload_path)
+    return upload_path, f'{digest}.{ext}'
+
+
+def publish_upload(attachment):
+    """Put a prepared upload in place under its name; call after acquire_media().
+
+    With the reference taken, remove_unreferenced_media() cannot unlink the file
+    any more, so a missing file (never stored, or just removed) is written here.
+    """
+    path = get_media_path(attachment.filename)
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+        try:
+            os.link(attachment.upload_path, tmp_path)
+        except OSError:
+            shutil.copyfile(attachment.upload_path, tmp_path)
+        os.replace(tmp_path, path)
+    if attachment.kind == 'image' and not (attachment.thumb and os.path.exists(get_media_path(attachment.thumb))):
+        attachment.thumb = None
+        ensure_image_rendition(attachment)
+
+
+def discard_uploads(attachments):
+    """Remove the temporary files of prepared uploads."""
+    for attachment in attachments:
+        upload_path = getattr(attachment, 'upload_path', None)
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+
+def get_media_kind(filename):
+    """'image', 'video' or 'document', from the file extension."""
+    from services.uploads import UPLOAD_CATEGORIES
+    ext = filename.rsplit('.', 1)[-1].lower()
+    for kind, extensions in UPLOAD_CATEGORIES.items():
+        if ext in extensions:
+            return kind
+    return 'document'
+
+
+def create_attachment(file, position=0):
+    """Describe one uploaded file as an unsaved RequestMedia.
+
+    The bytes wait in attachment.upload_path; the caller takes the reference with
+    acquire_media(), then publish_upload(), and finally discard_uploads().
+    """
+    from models import RequestMedia
+    upload_path, filename = prepare_upload(file, file.filename.rsplit('.', 1)[-1].lower())
+    attachment = RequestMedia(
+        position=position,
+        kind=get_media_kind(filename),
+        filename=filename,
+        original_name=file.filename[:255],
+        sha256=filename.rsplit('.', 1)[0],
+        size=os.path.getsize(upload_path)
+    )
+    attachment.upload_path = upload_path
+    return attachment
+
+
+def get_image_rendition_name(filename):
+    """Name of the pre-sized JPEG of an uploaded photo."""
+    return f"{filename.rsplit('.', 1)[0]}_thumb.jpg"
+
+
+def ensure_image_rendition(attachment):
+    """Fill in the photo's dimensions and its pre-sized JPEG (used by galleries
+    and the DOCX export), writing the JPEG once per stored file."""
+    if attachment.thumb:
+        return True
+    max_dimension = current_app.config['IMAGE_RENDITION_MAX_DIMENSION']
+    name = get_image_rendition_name(attachment.filename)
+    rendition_path = get_media_path(name)
+    tmp_path = f'{rendition_path}.{uuid.uuid4().hex}.part'
+
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(get_media_path(attachment.filename)) as img:
+            width, height = img.size
+            # EXIF orientation 5-8 means the photo is shown rotated by 90°
+            if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            if not os.path.exists(rendition_path):
+                img.draft('RGB', (max_dimension, max_dimension))
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                img.save(tmp_path, format='JPEG', quality=80, optimize=True)
+                os.replace(tmp_path, rendition_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f'Image rendition {attachment.filename}: {e}')
+        return False
+    attachment.width, attachment.height, attachment.thumb = width, height, name
+    return True
+
+
+def acquire_media(filename):
+    """Add one reference to a stored file in the current transaction."""
+    from sqlalchemy import update
+    from sqlalchemy.exc import IntegrityError
+    from extensions import db
+    from models import MediaFile
+    table = MediaFile.__table__
+    increment = update(table).where(table.c.filename == filename).values(ref_count=table.c.ref_count + 1)
+    if db.session.execute(increment).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(filename=filename, ref_count=1))
+    except IntegrityError:
+        # Someone stored the same content at the same moment
+        db.session.execute(increment)
+
+
+def release_media(*filenames):
+    """Drop one reference per filename in the current transaction.
+
+    Returns the files that are no longer referenced; pass them to
+    remove_unreferenced_media() after the commit.
+    """
+    from sqlalchemy import update, select
+    from extensions import db
+    from models import MediaFile
+    table = MediaFile.__table__
+    released = []
+    for filename in filenames:
+        if not filename:
+            continue
+        db.session.execute(
+            update(table).where(table.c.filename == filename).values(ref_count=table.c.ref_count - 1)
+        )
+        ref_count = db.session.execute(select(table.c.ref_count).where(table.c.filename == filename)).scalar()
+        if ref_count is not None and ref_count > 0:
+            continue
+        db.session.execute(table.delete().where(table.c.filename == filename))
+        released.append(filename)
+    return released
+
+
+def remove_unreferenced_media(*filenames):
+    """Unlink files (and their renditions) that no protocol references.
+
+    Each file is removed while holding a media_files row of its own (ref_count 0):
+    an upload of the same content taking its reference meanwhile waits for that
+    row, then finds the file missing and writes it again in publish_upload().
+    Call after the commit that released the files.
+    """
+    from sqlalchemy.exc import IntegrityError
+    from extensions import db
+    from models import MediaFile
+    from services.media_pipeline import get_rendition_names
+    table = MediaFile.__table__
+    for filename in filenames:
+        if not filename:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(filename=filename, ref_count=0))
+                remove_media_files(filename, get_image_rendition_name(filename), *get_rendition_names(filename))
+                conn.execute(table.delete().where(table.c.filename == filename))
+        except IntegrityError:
+            # Referenced (again), or another worker is removing it
+            continue
+
+
+def downscale_image(path, max_dimension, quality=85):
+    """Shrink a photo in place if it exceeds max_dimension.
+
+    Server-side counterpart of the resize in create_request.html for clients
+    that upload the raw camera file. Returns True when the file was rewritten.
+    """
+    image_format = IMAGE_RESIZE_FORMATS.get(path.rsplit('.', 1)[-1].lower())
+    if not image_format or not max_dimension:
+        return False
+
+    from PIL import Image, ImageOps
+    tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        with Image.open(path) as img:
+            if max(img.size) <= max_dimension:
+                return False
+            img.draft('RGB', (max_dimension, max_dimension))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(tmp_path, format=image_format, quality=quality, optimize=True)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f'Image downscale {os.path.basename(path)}: {e}')
+        return False
+
+
+def is_content_addressed(filename):
+    """Uploaded media is written once under a random/hash name and never rewritten."""
+    return bool(CONTENT_ADDRESSED_NAME.match(filename))
+
+
+def send_media(filename):
+    """Send an uploaded file with Range, strong ETag and cache support.
+
+    When MEDIA_ACCEL_REDIRECT is set the transfer is handed off to the front
+    proxy (nginx X-Accel-Redirect); USE_X_SENDFILE is honoured by send_file.
+    """
+    path = get_media_path(filename)
+    if not os.path.isfile(path):
+        abort(404)
+
+    immutable = is_content_addressed(filename)
+    etag = filename.rsplit('.', 1)[0] if immutable else True
+
+    accel_prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        if immutable:
+            response.set_etag(etag)
+            response.make_conditional(request)
+    else:
+        response = send_file(path, conditional=True, etag=etag)
+
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = MEDIA_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
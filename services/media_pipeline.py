@@ -0,0 +1,234 @@
+import os
+import json
+import shutil
+import uuid
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm'}
+
+_executor = None
+_executor_broken = False
+_executor_lock = threading.Lock()
+_pending = 0
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+
+def get_rendition_names(filename):
+    """Names of the derived files for an uploaded video: (web mp4, poster jpg)."""
+    stem = filename.rsplit('.', 1)[0]
+    return f'{stem}_web.mp4', f'{stem}_poster.jpg'
+
+
+def probe_video(path, timeout=60):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height:format=duration', '-of', 'json', path],
+        capture_output=True, check=True, timeout=timeout
+    )
+    info = json.loads(result.stdout or b'{}')
+    stream = (info.get('streams') or [{}])[0]
+    duration = info.get('format', {}).get('duration')
+    return {
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'duration': float(duration) if duration else None
+    }
+
+
+def process_video(upload_folder, filename, max_height=720, video_kbps=1500, audio_kbps=96,
+                  poster_height=480, timeout=900):
+    """Probe, transcode to bounded-bitrate H.264/AAC MP4 and extract a poster frame.
+
+    Runs in a worker process; touches only the filesystem and returns the
+    metadata to be recorded on the Request.
+    """
+    src = os.path.join(upload_folder, filename)
+    web_name, poster_name = get_rendition_names(filename)
+    web_path = os.path.join(upload_folder, web_name)
+    poster_path = os.path.join(upload_folder, poster_name)
+    # Two uploads of the same content may be processed at once: each job writes its own
+    # temporary files and os.replace() puts the finished (identical) result in place
+    job = uuid.uuid4().hex
+    web_tmp = f'{web_path}.{job}.part'
+    poster_tmp = f'{poster_path}.{job}.part'
+
+    try:
+        info = _render_video(src, web_path, web_tmp, poster_path, poster_tmp, max_height,
+                             video_kbps, audio_kbps, poster_height, timeout)
+    finally:
+        for path in (web_tmp, poster_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+    info['web'] = web_name
+    info['poster'] = poster_name
+    return info
+
+
+def _render_video(src, web_path, web_tmp, poster_path, poster_tmp, max_height, video_kbps,
+                  audio_kbps, poster_height, timeout):
+    info = probe_video(src)
+
+    subprocess.run(
+        ['ffmpeg', '-y', '-v', 'error', '-i', src,
+         '-vf', f"scale=-2:'min({max_height},ih)'",
+         '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+         '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k',
+         '-c:a', 'aac', '-b:a', f'{audio_kbps}k',
+         '-movflags', '+faststart', '-f', 'mp4', web_tmp],
+        capture_output=True, check=True, timeout=timeout
+    )
+    os.replace(web_tmp, web_path)
+
+    seek = min(1.0, info['duration'] / 2) if info['duration'] else 0
+    subprocess.run(
+        ['ffmpeg', '-y', '-v', 'error', '-ss', f'{seek:.2f}', '-i', src,
+         '-frames:v', '1', '-vf', f"scale=-2:'min({poster_height},ih)'", '-q:v', '3',
+         '-f', 'image2', '-update', '1', poster_tmp],
+        capture_output=True, check=True, timeout=120
+    )
+    os.replace(poster_tmp, poster_path)
+    return info
+
+
+def get_executor(max_workers):
+    global _executor, _executor_broken
+    with _executor_lock:
+        # A crashed child (e.g. OOM kill) breaks the pool for good; start a new one
+        if _executor is None or _executor_broken:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn: the worker processes must not inherit DB connections or locks
+            _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_broken = False
+    return _executor
+
+
+def _mark_broken(executor):
+    global _executor_broken
+    with _executor_lock:
+        if executor is _executor:
+            _executor_broken = True
+
+
+def _check_pool(executor, future):
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _mark_broken(executor)
+
+
+def schedule_video_processing(filename):
+    """Queue an uploaded video for transcoding off the request path."""
+    app = current_app._get_current_object()
+    ext = filename.rsplit('.', 1)[-1].lower()
+    if ext not in VIDEO_EXTENSIONS or not app.config.get('MEDIA_PIPELINE_ENABLED'):
+        return False
+    if not ffmpeg_available():
+        print('Media pipeline: ffmpeg not found, skipping transcoding')
+        return False
+
+    args = (
+        app.config['UPLOAD_FOLDER'],
+        filename,
+        app.config['MEDIA_VIDEO_MAX_HEIGHT'],
+        app.config['MEDIA_VIDEO_BITRATE_KBPS'],
+        app.config['MEDIA_AUDIO_BITRATE_KBPS'],
+        app.config['MEDIA_POSTER_MAX_HEIGHT']
+    )
+    executor = get_executor(app.config['MEDIA_PIPELINE_WORKERS'])
+    try:
+        future = executor.submit(process_video, *args)
+    except BrokenProcessPool:
+        _mark_broken(executor)
+        executor = get_executor(app.config['MEDIA_PIPELINE_WORKERS'])
+        future = executor.submit(process_video, *args)
+    _track_job(1)
+    future.add_done_callback(lambda f: _check_pool(executor, f))
+    future.add_done_callback(lambda f: _track_job(-1))
+    future.add_done_callback(lambda f: _record_video_result(app, filename, f))
+    return True
+
+
+def reuse_video_renditions(attachment):
+    """Copy the renditions of an identical, already processed upload to `attachment`."""
+    from models import RequestMedia
+    if attachment.kind != 'video':
+        return False
+    done = RequestMedia.query.filter(
+        RequestMedia.filename == attachment.filename,
+        RequestMedia.web.isnot(None),
+        RequestMedia.id != attachment.id
+    ).first()
+    if done is None:
+        return False
+    attachment.web = done.web
+    attachment.poster = done.poster
+    attachment.duration = done.duration
+    attachment.width = done.width
+    attachment.height = done.height
+    return True
+
+
+def process_attachments(req):
+    """Reuse or schedule the renditions of a new protocol's videos; the caller commits."""
+    for attachment in req.attachments:
+        if attachment.kind == 'video' and not reuse_video_renditions(attachment):
+            schedule_video_processing(attachment.filename)
+
+
+def _track_job(delta):
+    global _pending
+    with _executor_lock:
+        _pending += delta
+
+
+def get_queue_status():
+    """Transcoding backlog of this process, for the readiness probe."""
+    with _executor_lock:
+        return {
+            'pending': _pending,
+            'broken': _executor_broken
+        }
+
+
+def _record_video_result(app, filename, future):
+    from datetime import datetime
+    from extensions import db
+    from models import Request, RequestMedia
+    from services.media import remove_unreferenced_media
+
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f'Media pipeline {filename}: {e}')
+        return
+
+    with app.app_context():
+        try:
+            # Every attachment sharing this content-addressed upload gets the renditions
+            updated = RequestMedia.query.filter_by(filename=filename).update({
+                'web': result['web'],
+                'poster': result['poster'],
+                'duration': result['duration'],
+                'width': result['width'],
+                'height': result['height']
+            }, synchronize_session=False)
+            # Lets API clients syncing by updated_at pick up the renditions
+            request_ids = db.session.query(RequestMedia.request_id).filter_by(filename=filename)
+            Request.query.filter(Request.id.in_(request_ids.scalar_subquery())).update(
+                {'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+            if not updated:
+                remove_unreferenced_media(filename)
+        except Exception as e:
+            db.session.rollback()
+            print(f'Media pipeline {filename}: {e}')
@@ -0,0 +1,117 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app, has_request_context
+from extensions import bcrypt
+
+# Hashing policy (see create_app): PASSWORD_HASH_ALGORITHM is 'bcrypt' (cost
+# BCRYPT_LOG_ROUNDS) or 'argon2' (ARGON2_TIME_COST, ARGON2_MEMORY_COST,
+# ARGON2_PARALLELISM; needs argon2-cffi). Stored hashes made with other
+# parameters still verify and are upgraded on the next successful login.
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def _forget_pool():
+    # A worker forked from a process that already hashed (create_default_admin()
+    # under preload_app) inherits the pool object but none of its threads
+    global _executor, _executor_lock, _slots
+    _executor = None
+    _executor_lock = threading.Lock()
+    _slots = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool)
+
+
+class PasswordHashingBusy(Exception):
+    """Too many hash computations are already waiting; the caller should retry later."""
+
+
+def get_algorithm(app):
+    algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+    if algorithm == 'argon2' and get_argon2_hasher(app) is None:
+        print('Password hashing: argon2-cffi is not installed, using bcrypt')
+        app.config['PASSWORD_HASH_ALGORITHM'] = algorithm = 'bcrypt'
+    return algorithm
+
+
+def get_argon2_hasher(app):
+    try:
+        from argon2 import PasswordHasher
+    except ImportError:
+        return None
+    return PasswordHasher(
+        time_cost=app.config['ARGON2_TIME_COST'],
+        memory_cost=app.config['ARGON2_MEMORY_COST'],
+        parallelism=app.config['ARGON2_PARALLELISM']
+    )
+
+
+def _hash(app, password):
+    if get_algorithm(app) == 'argon2':
+        return get_argon2_hasher(app).hash(password)
+    return bcrypt.generate_password_hash(password, rounds=app.config['BCRYPT_LOG_ROUNDS']).decode('utf-8')
+
+
+def _verify(app, password_hash, password):
+    if password_hash.startswith('$argon2'):
+        hasher = get_argon2_hasher(app)
+        if hasher is None:
+            return False
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    try:
+        return bcrypt.check_password_hash(password_hash, password)
+    except ValueError:
+        return False
+
+
+def needs_rehash(password_hash):
+    """True when the stored hash doesn't match the current algorithm or cost."""
+    app = current_app._get_current_object()
+    if get_algorithm(app) == 'argon2':
+        return not password_hash.startswith('$argon2') or get_argon2_hasher(app).check_needs_rehash(password_hash)
+    # $2b$12$... : bcrypt prefix and log rounds
+    parts = password_hash.split('$')
+    return len(parts) < 4 or not parts[1].startswith('2') or parts[2] != '%02d' % app.config['BCRYPT_LOG_ROUNDS']
+
+
+def _run(fn, *args):
+    """Run a hash computation in the bounded pool and wait for it.
+
+    bcrypt and argon2 release the GIL, so the waiting request thread costs
+    nothing while at most PASSWORD_HASH_WORKERS hashes use the CPU at once.
+    Outside a request (startup, CLI) the hash is computed in the calling thread.
+    """
+    global _executor, _slots
+    app = current_app._get_current_object()
+    if not has_request_context():
+        return fn(app, *args)
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                           thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+    if not _slots.acquire(timeout=app.config['PASSWORD_HASH_WAIT_SECONDS']):
+        raise PasswordHashingBusy()
+    try:
+        return _executor.submit(fn, app, *args).result(timeout=app.config['PASSWORD_HASH_TIMEOUT_SECONDS'])
+    except FutureTimeoutError:
+        raise PasswordHashingBusy()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return _run(_hash, password)
+
+
+def verify_password(password_hash, password):
+    return _run(_verify, password_hash, password)
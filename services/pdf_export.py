@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from io import BytesIO
+
+# PDF versions of the protocol and statistics documents, drawn with fpdf2 (pure
+# Python, imported lazily like python-docx). Text uses the DejaVu Sans fonts in
+# services/fonts, cut down to Latin, Cyrillic and punctuation so that loading
+# them costs milliseconds per document:
+#   pyftsubset DejaVuSans.ttf --unicodes="U+0020-007E,U+00A0-024F,U+0300-036F,
+#     U+0400-052F,U+2000-206F,U+20A0-20BF,U+2100-214F,U+2190-21FF,U+2212,U+25A0-25FF"
+#     --layout-features='' --no-hinting --drop-tables+=FFTM,GSUB,GPOS,GDEF
+#
+# Rendered files are cached under a hash of their content (see get_cached_pdf),
+# so an unchanged protocol is drawn once however often it is downloaded. A cached
+# file may be served for weeks, so unlike the Word exports the PDFs print no
+# generation time.
+
+FONT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+FONT_FILES = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+    'I': 'DejaVuSans-Oblique.ttf'
+}
+# Part of every cache key: bump it when the layout below changes
+LAYOUT_VERSION = 2
+
+PAGE_MARGIN = 20
+GALLERY_GAP = 10
+
+_last_sweep = 0
+_sweep_lock = threading.Lock()
+
+
+def _new_document():
+    from fpdf import FPDF
+    pdf = FPDF(format='A4')
+    pdf.set_margins(PAGE_MARGIN, PAGE_MARGIN, PAGE_MARGIN)
+    pdf.set_auto_page_break(True, margin=PAGE_MARGIN)
+    pdf.set_creator('Nazorat')
+    _font(pdf, 'B')
+    _font(pdf, '')
+    pdf.add_page()
+    return pdf
+
+
+def _font(pdf, style='', size=11):
+    # Fonts are added on first use; the oblique one is rarely needed
+    if f'dejavu{style}' not in pdf.fonts:
+        pdf.add_font('DejaVu', style, os.path.join(FONT_FOLDER, FONT_FILES[style]))
+    pdf.set_font('DejaVu', style, size)
+
+
+def _line(pdf, text, style='', size=11, align='L', height=7):
+    _font(pdf, style, size)
+    pdf.multi_cell(0, height, text, align=align, new_x='LMARGIN', new_y='NEXT')
+
+
+def _heading(pdf, text, size=14):
+    pdf.ln(4)
+    _line(pdf, text, 'B', size, height=9)
+    pdf.ln(1)
+
+
+def _table(pdf, rows, col_widths, headings=None, bold_labels=False):
+    from fpdf.fonts import FontFace
+    _font(pdf, '', 10)
+    bold = FontFace(emphasis='BOLD')
+    with pdf.table(col_widths=col_widths, first_row_as_headings=headings is not None,
+                   text_align='LEFT', line_height=6) as table:
+        if headings is not None:
+            row = table.row()
+            for heading in headings:
+                row.cell(heading)
+        for values in rows:
+            row = table.row()
+            for i, value in enumerate(values):
+                row.cell(str(value), style=bold if bold_labels and i == 0 else None)
+    pdf.ln(2)
+
+
+def _output(pdf):
+    buffer = BytesIO(pdf.output())
+    buffer.seek(0)
+    return buffer
+
+
+def _picture_size(path, width, max_height):
+    """Rendered (width, height) in mm of a picture `width` mm wide, scaled down to fit `max_height`."""
+    from PIL import Image
+    with Image.open(path) as image:
+        pixels_width, pixels_height = image.size
+    height = width * pixels_height / pixels_width
+    if height > max_height:
+        width, height = width * max_height / height, max_height
+    return width, height
+
+
+def _gallery(pdf, pictures):
+    if len(pictures) == 1:
+        columns, width = 1, 130
+    else:
+        columns, width = 2, (pdf.epw - GALLERY_GAP) / 2
+    max_height = pdf.eph - 20
+
+    for start in range(0, len(pictures), columns):
+        row = []
+        for attachment in pictures[start:start + columns]:
+            try:
+                size = _picture_size(attachment['picture_path'], width, max_height)
+            except Exception as e:
+                size = None
+                attachment = dict(attachment, error=str(e))
+            row.append((attachment, size))
+
+        caption_height = 5 if any(a['kind'] == 'video' or a.get('error') for a, _ in row) else 0
+        row_height = max(size[1] if size else 0 for _, size in row) + caption_height
+        if pdf.get_y() + row_height > pdf.page_break_trigger:
+            pdf.add_page()
+        top = pdf.get_y()
+        for column, (attachment, size) in enumerate(row):
+            left = pdf.l_margin + column * (width + GALLERY_GAP) if columns == 2 else (pdf.w - width) / 2
+            caption = ''
+            if size:
+                pdf.image(attachment['picture_path'], x=left + (width - size[0]) / 2, y=top, w=size[0], h=size[1])
+                if attachment['kind'] == 'video':
+                    info = f" ({attachment['info']})" if attachment['info'] else ''
+                    caption = f"Видео: {attachment['name']}{info}"
+            else:
+                caption = f"Расмро илова кардан имконнопазир: {attachment['error']}"
+            if caption:
+                _font(pdf, '', 8)
+                pdf.set_xy(left, top + (size[1] if size else 0) + 1)
+                pdf.multi_cell(width, 4, caption, align='C')
+        pdf.set_xy(pdf.l_margin, top + row_height + 4)
+
+
+def create_protocol_pdf(request_data, attachments=()):
+    """PDF counterpart of create_protocol_word_document()."""
+    pictures = [a for a in attachments if a['picture_path'] and os.path.exists(a['picture_path'])]
+    files = [a for a in attachments if a not in pictures]
+
+    pdf = _new_document()
+    _line(pdf, "ПРОТОКОЛ", 'B', 22, align='C', height=12)
+    _line(pdf, f"№ {request_data.get('reg_number', 'Н/Д')}", 'B', 14, align='C')
+    if request_data.get('document_number'):
+        _line(pdf, f"Рақами ҳуҷҷат: {request_data.get('document_number')}", size=11, align='C')
+    pdf.ln(6)
+
+    _table(pdf, [
+        ("Мавзӯъ", request_data.get('topic', '')),
+        ("Корбар", request_data.get('username', '')),
+        ("Санаи сохтан", request_data.get('created_at', '')),
+        ("Ҳолат", request_data.get('status_label', '')),
+        ("Координатҳо", request_data.get('coordinates', 'Нест')),
+        ("Санаи хондан", request_data.get('admin_read_at', 'Нахонда')),
+    ], col_widths=(1, 2), bold_labels=True)
+
+    _heading(pdf, "Шарҳ")
+    _line(pdf, request_data.get('comment') or "Шарҳ нест", height=6)
+
+    if pictures:
+        _heading(pdf, "Расмҳо" if len(pictures) > 1 else "Расм")
+        _gallery(pdf, pictures)
+
+    if files:
+        _heading(pdf, "Файлҳои замима")
+        for attachment in files:
+            _line(pdf, f"•  Номи файл: {attachment['name']}", height=6)
+
+    if request_data.get('admin_reply'):
+        _heading(pdf, "Ҷавоби админ")
+        _line(pdf, request_data.get('admin_reply'), height=6)
+        if request_data.get('admin_reply_at'):
+            _line(pdf, f"Санаи ҷавоб: {request_data.get('admin_reply_at')}", 'I', 10, height=6)
+    return _output(pdf)
+
+
+def create_statistics_pdf(stats_data, title="Омори дархостҳо", date_range=None):
+    """PDF counterpart of create_statistics_word_document()."""
+    pdf = _new_document()
+    _line(pdf, title, 'B', 20, align='C', height=11)
+    if date_range:
+        _line(pdf, f"Давра: {date_range}", align='C')
+
+    _heading(pdf, "Омори умумӣ")
+    _table(pdf, [
+        ("Ҳамаи дархостҳо", stats_data.get('total_requests', 0)),
+        ("Иҷро шуд", stats_data.get('completed_requests', 0)),
+        ("Дар тафтиш", stats_data.get('under_review_requests', 0)),
+        ("Фоизи иҷро", f"{stats_data.get('completion_rate', 0)}%"),
+    ], col_widths=(2, 1))
+
+    topic_stats = stats_data.get('topic_stats', [])
+    if topic_stats:
+        _heading(pdf, "Омор аз рӯи мавзӯъҳо")
+        _table(pdf, [
+            (topic.get('title', ''), topic.get('count', 0), topic.get('completed', 0),
+             topic.get('pending', 0), f"{topic.get('percentage', 0)}%")
+            for topic in topic_stats
+        ], col_widths=(4, 1.5, 1.5, 1.5, 1.5), headings=["Мавзӯъ", "Ҳамагӣ", "Иҷро шуд", "Дар тафтиш", "Фоиз"])
+
+    if 'total_users' in stats_data:
+        _heading(pdf, "Омори корбарон")
+        _table(pdf, [
+            ("Корбарон", stats_data.get('total_users', 0)),
+            ("Администраторҳо", stats_data.get('total_admins', 0)),
+        ], col_widths=(2, 1))
+    return _output(pdf)
+
+
+def create_worker_statistics_pdf(worker_data, requests_list):
+    """PDF counterpart of create_worker_statistics_word_document()."""
+    total_requests = len(requests_list)
+    completed = sum(1 for r in requests_list if r.get('status') == 'completed')
+    completion_rate = round((completed / total_requests * 100), 1) if total_requests > 0 else 0
+
+    pdf = _new_document()
+    name = worker_data.get('full_name', worker_data.get('username', 'Номаълум'))
+    _line(pdf, f"Омори корбар: {name}", 'B', 20, align='C', height=11)
+
+    _heading(pdf, "Маълумоти корбар")
+    _table(pdf, [
+        ("Номи корбар", worker_data.get('username', '')),
+        ("Номи пурра", worker_data.get('full_name', '')),
+        ("Нақш", "Администратор" if worker_data.get('role') == 'admin' else "Корбар"),
+        ("Санаи бақайдгирӣ", worker_data.get('created_at', '')),
+    ], col_widths=(1, 2))
+
+    _heading(pdf, "Омори дархостҳо")
+    _table(pdf, [
+        ("Ҳамаи дархостҳо", total_requests),
+        ("Иҷро шуд", completed),
+        ("Дар тафтиш", total_requests - completed),
+        ("Фоизи иҷро", f"{completion_rate}%"),
+    ], col_widths=(2, 1))
+
+    if requests_list:
+        _heading(pdf, "Рӯйхати дархостҳо")
+        rows = []
+        for req in requests_list[:50]:
+            comment = req.get('comment', '')
+            rows.append((req.get('reg_number', ''), req.get('topic', ''), req.get('created_at', ''),
+                         req.get('status_label', ''), comment[:50] + '...' if len(comment) > 50 else comment))
+        _table(pdf, rows, col_widths=(2.2, 2, 2, 1.6, 3),
+               headings=["Рақами қайд", "Мавзӯъ", "Сана", "Ҳолат", "Шарҳ"])
+        if len(requests_list) > 50:
+            _line(pdf, f"... ва боз {len(requests_list) - 50} дархости дигар")
+    return _output(pdf)
+
+
+def get_pdf_key(kind, *content):
+    """Content address of a document: its inputs and the layout version, hashed."""
+    payload = json.dumps([LAYOUT_VERSION, kind, content], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_pdf(cache_folder, key, render):
+    """Path of the PDF stored under `key`, calling render() to create it when missing."""
+    path = os.path.join(cache_folder, f'{key}.pdf')
+    if os.path.exists(path):
+        # Recently used documents outlive PDF_CACHE_TTL
+        os.utime(path)
+        return path
+    os.makedirs(cache_folder, exist_ok=True)
+    buffer = render()
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp_path, path)
+    return path
+
+
+RENDERERS = {
+    'protocol': create_protocol_pdf,
+    'statistics': create_statistics_pdf,
+    'worker_statistics': create_worker_statistics_pdf
+}
+
+
+def get_pdf(cache_folder, kind, *args):
+    """Cached PDF of a `kind` document rendered from `args`.
+
+    Protocol picture paths name content-addressed renditions, so they stand in
+    for the image data in the key.
+    """
+    key = get_pdf_key(kind, *args)
+    return get_cached_pdf(cache_folder, key, lambda: RENDERERS[kind](*args))
+
+
+def remove_expired_pdfs(app):
+    """Delete cached PDFs unused for PDF_CACHE_TTL seconds; runs at most once an hour per process."""
+    global _last_sweep
+    with _sweep_lock:
+        if _last_sweep and time.monotonic() - _last_sweep < 3600:
+            return
+        _last_sweep = time.monotonic()
+    folder = app.config['PDF_CACHE_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - app.config['PDF_CACHE_TTL']
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import socket
+import zipfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime
+from flask import current_app
+
+# Bulk export of protocols as a ZIP of DOCX files. A job runs in a thread of
+# the web process and renders the documents in a process pool; at most
+# EXPORT_WORKERS * 2 documents are in flight, so memory does not grow with the
+# number of protocols. Progress lives in EXPORT_FOLDER/<job>.json, readable by
+# every worker process. The job thread dies with its process when gunicorn
+# recycles the worker, so the status also carries the pid and a heartbeat; a job
+# whose process is gone or that stopped reporting counts as failed.
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+EXPORT_FORMATS = ('docx', 'pdf')
+
+# One export at a time per process; further jobs wait in 'queued'
+_job_slots = threading.BoundedSemaphore(1)
+
+# Seconds between status writes of a job that makes no visible progress
+HEARTBEAT_SECONDS = 10
+
+
+def get_protocol_filename(row, export_format):
+    safe_reg = (row.reg_number or f'protocol_{row.id}').replace('/', '-').replace(' ', '_')
+    return f'{safe_reg}.{export_format}'
+
+
+def render_protocol(request_data, attachments, path, export_format, pdf_cache_folder):
+    """Write one protocol to `path` and return the file to archive; runs in a worker process."""
+    if export_format == 'pdf':
+        # Shared with single downloads; a cached PDF goes into the ZIP as is
+        from services.pdf_export import get_pdf
+        return get_pdf(pdf_cache_folder, 'protocol', request_data, attachments)
+    from services.statistics_export import create_protocol_word_document
+    buffer = create_protocol_word_document(request_data, attachments)
+    with open(path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    return path
+
+
+def get_job_path(job_id, ext):
+    return os.path.join(current_app.config['EXPORT_FOLDER'], f'{job_id}.{ext}')
+
+
+def write_status(app, job_id, **status):
+    path = os.path.join(app.config['EXPORT_FOLDER'], f'{job_id}.json')
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    status.update(host=socket.gethostname(), pid=os.getpid(), updated_at=time.time())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def read_status(app, job_id):
+    try:
+        with open(os.path.join(app.config['EXPORT_FOLDER'], f'{job_id}.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_job_alive(app, status):
+    """True while a queued or running job is still being worked on by its process."""
+    if not status or status.get('status') not in ('queued', 'running'):
+        return False
+    if time.time() - status.get('updated_at', 0) > app.config['EXPORT_STALE_SECONDS']:
+        return False
+    if status.get('host') == socket.gethostname():
+        try:
+            os.kill(status['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+    return True
+
+
+def get_job_status(job_id):
+    if not JOB_ID.match(job_id):
+        return None
+    app = current_app._get_current_object()
+    status = read_status(app, job_id)
+    if status and status['status'] in ('queued', 'running') and not is_job_alive(app, status):
+        status.update(status='failed', error='Содирот қатъ шуд. Лутфан дубора кӯшиш кунед.')
+    return status
+
+
+def start_export(request_ids, export_format='docx'):
+    """Queue an export of the given protocols and return the job id."""
+    from services.pdf_export import remove_expired_pdfs
+    app = current_app._get_current_object()
+    os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+    remove_expired_exports(app)
+    remove_expired_pdfs(app)
+    job_id = uuid.uuid4().hex
+    write_status(app, job_id, status='queued', total=len(request_ids), done=0)
+    threading.Thread(target=run_export, args=(app, job_id, request_ids, export_format),
+                     name=f'export-{job_id[:8]}', daemon=True).start()
+    return job_id
+
+
+def run_export(app, job_id, request_ids, export_format):
+    total = len(request_ids)
+    while not _job_slots.acquire(timeout=HEARTBEAT_SECONDS):
+        write_status(app, job_id, status='queued', total=total, done=0)
+    try:
+        zip_path = os.path.join(app.config['EXPORT_FOLDER'], f'{job_id}.zip')
+        work_dir = os.path.join(app.config['EXPORT_FOLDER'], job_id)
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            write_status(app, job_id, status='running', total=total, done=0)
+            with app.app_context():
+                _export(app, job_id, request_ids, export_format, zip_path + '.part', work_dir)
+            os.replace(zip_path + '.part', zip_path)
+            write_status(app, job_id, status='done', total=total, done=total)
+        except Exception as e:
+            print(f'Protocol export {job_id}: {e}')
+            write_status(app, job_id, status='failed', total=total, done=0, error=str(e))
+            if os.path.exists(zip_path + '.part'):
+                os.remove(zip_path + '.part')
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        _job_slots.release()
+
+
+def _export(app, job_id, request_ids, export_format, zip_path, work_dir):
+    from services.export_data import iter_protocol_data
+
+    total = len(request_ids)
+    window = app.config['EXPORT_WORKERS'] * 2
+    names = set()
+    pending = deque()
+    done = 0
+    reported = time.monotonic()
+
+    def write_oldest():
+        # Documents go into the ZIP in protocol order; DOCX and PDF are already compressed, so they are stored as is
+        future, arcname = pending.popleft()
+        while not wait([future], timeout=HEARTBEAT_SECONDS).done:
+            write_status(app, job_id, status='running', total=total, done=done)
+        path = future.result()
+        archive.write(path, arcname)
+        if os.path.dirname(path) == work_dir:
+            os.remove(path)
+
+    # spawn: the worker processes must not inherit DB connections or locks
+    with ProcessPoolExecutor(max_workers=app.config['EXPORT_WORKERS'],
+                             mp_context=multiprocessing.get_context('spawn')) as pool, \
+            zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        try:
+            for row, request_data, attachments in iter_protocol_data(request_ids):
+                arcname = get_protocol_filename(row, export_format)
+                if arcname in names:
+                    arcname = arcname.replace(f'.{export_format}', f'_{row.id}.{export_format}')
+                names.add(arcname)
+                path = os.path.join(work_dir, f'{row.id}.{export_format}')
+                pending.append((pool.submit(render_protocol, request_data, attachments, path, export_format,
+                                            app.config['PDF_CACHE_FOLDER']), arcname))
+                if len(pending) >= window:
+                    write_oldest()
+                    done += 1
+                if time.monotonic() - reported > 0.5:
+                    write_status(app, job_id, status='running', total=total, done=done)
+                    reported = time.monotonic()
+            while pending:
+                write_oldest()
+                done += 1
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+
+def remove_expired_exports(app):
+    """Delete finished exports older than EXPORT_TTL seconds and whatever dead jobs left behind."""
+    folder = app.config['EXPORT_FOLDER']
+    cutoff = time.time() - app.config['EXPORT_TTL']
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        job_id = name.split('.', 1)[0]
+        if JOB_ID.match(job_id) and is_job_alive(app, read_status(app, job_id)):
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif name.endswith('.part') or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def get_export_download_name():
+    return f"protocols_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
@@ -0,0 +1,170 @@
+import time
+import random
+import threading
+from flask import current_app, request, jsonify, render_template, flash, g
+from flask_login import current_user
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+
+# Token buckets: each rule in RATE_LIMITS is (capacity, refill per minute). A
+# request spends one token from every bucket it belongs to; an empty bucket
+# answers 429 before CSRF validation, form parsing or password hashing. A
+# successful login gets its tokens back (refund_rate_limits()), so only failed
+# attempts drain the login buckets.
+
+
+class MemoryBucketStore:
+    """Buckets of this worker process only."""
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def refund(self, key, capacity):
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated_at = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + 1), updated_at)
+
+    def _prune(self, now):
+        # Buckets idle for an hour are full again at any sensible rate
+        for key in [k for k, (_, updated_at) in self._buckets.items() if now - updated_at > 3600]:
+            del self._buckets[key]
+
+
+class DatabaseBucketStore:
+    """Buckets in the `rate_limits` table, shared by all workers and instances."""
+
+    @property
+    def table(self):
+        from models import RateLimit
+        return RateLimit.__table__
+
+    def consume(self, key, capacity, rate):
+        from extensions import db
+        table = self.table
+        now = time.time()
+        try:
+            with db.engine.begin() as conn:
+                row = conn.execute(table.select().where(table.c.key == key).with_for_update()).first()
+                tokens = capacity if row is None else min(capacity, row.tokens + (now - row.updated_at) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                if row is None:
+                    conn.execute(table.insert().values(key=key, tokens=tokens, updated_at=now))
+                else:
+                    conn.execute(table.update().where(table.c.key == key).values(tokens=tokens, updated_at=now))
+                if random.random() < 0.001:
+                    conn.execute(table.delete().where(table.c.updated_at < now - 86400))
+        except IntegrityError:
+            # Another worker created the bucket at the same moment
+            return True, 0
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def refund(self, key, capacity):
+        from extensions import db
+        table = self.table
+        tokens = case((table.c.tokens + 1 > capacity, capacity), else_=table.c.tokens + 1)
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.key == key).values(tokens=tokens))
+
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def login_username():
+    # A login form is a few hundred bytes; larger bodies are not parsed here
+    if request.content_length is None or request.content_length > 4096:
+        return None
+    username = request.form.get('username', '').strip().lower()
+    # Per address too: failed attempts from elsewhere cannot lock the account out
+    return f'{username}@{client_ip()}' if username else None
+
+
+def current_user_key():
+    return str(current_user.id) if current_user.is_authenticated else None
+
+
+# endpoint -> buckets, only for POST requests
+RULES = {
+    'auth.login': (('login_ip', client_ip), ('login_username', login_username)),
+    'user.create_request': (('create_ip', client_ip), ('create_user', current_user_key)),
+}
+
+
+def init_rate_limits(app):
+    """Register the check; must run before CSRFProtect, which parses the form."""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return
+    backend = app.config['RATE_LIMIT_BACKEND']
+    if backend == 'database':
+        app.extensions['rate_limit_store'] = DatabaseBucketStore()
+    elif backend == 'memory':
+        app.extensions['rate_limit_store'] = MemoryBucketStore()
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+    app.before_request(check_rate_limits)
+
+
+def check_rate_limits():
+    if request.method != 'POST' or request.endpoint not in RULES:
+        return None
+    store = current_app.extensions['rate_limit_store']
+    g.rate_limit_charges = []
+    for name, key_func in RULES[request.endpoint]:
+        key = key_func()
+        if key is None:
+            continue
+        capacity, per_minute = current_app.config['RATE_LIMITS'][name]
+        allowed, retry_after = store.consume(f'{name}:{key}', capacity, per_minute / 60)
+        if not allowed:
+            return rate_limited(retry_after)
+        g.rate_limit_charges.append((f'{name}:{key}', capacity))
+    return None
+
+
+def refund_rate_limits():
+    """Give back the tokens this request spent; called after a successful login."""
+    store = current_app.extensions.get('rate_limit_store')
+    for key, capacity in g.pop('rate_limit_charges', ()):
+        try:
+            store.refund(key, capacity)
+        except Exception as e:
+            print(f'Rate limit refund: {e}')
+
+
+def render_refused_form():
+    """The page of the limited form (see RULES), shown again with the flashed message."""
+    if request.endpoint == 'user.create_request':
+        from models import Topic
+        return render_template('user/create_request.html', topics=Topic.query.order_by(Topic.title).all())
+    return render_template('auth/login.html')
+
+
+def rate_limited(retry_after):
+    message = 'Кӯшишҳо аз ҳад зиёд. Лутфан пас аз чанд дақиқа дубора кӯшиш кунед.'
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'error': message})
+    else:
+        flash(message, 'warning')
+        response = current_app.make_response(render_refused_form())
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
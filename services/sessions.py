@@ -0,0 +1,266 @@
+import os
+import re
+import json
+import time
+import secrets
+import threading
+from datetime import datetime
+from flask import g, request, current_app
+from flask.sessions import SessionInterface, SecureCookieSession, session_json_serializer
+from services.health import PROBE_PATHS
+
+# Optional server-side sessions (SESSION_BACKEND=database or filesystem). The
+# cookie only carries a random session id; the data (Flask-Login state, CSRF
+# token, flash messages) stays on the server, so sessions can be revoked.
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict tracked like Flask's cookie session, stored under `sid`."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        # The user the stored session belonged to; a change means login or logout
+        self.loaded_user_id = self.get('_user_id')
+
+
+class DatabaseSessionStore:
+    """Sessions in the `sessions` table, written outside the request's db.session."""
+
+    @property
+    def table(self):
+        from models import UserSession
+        return UserSession.__table__
+
+    def load(self, sid):
+        from extensions import db
+        table = self.table
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                table.select().where(table.c.id == sid, table.c.expires_at > datetime.utcnow())
+            ).first()
+        return (row.data, row.expires_at) if row else None
+
+    def save(self, sid, data, user_id, expires_at):
+        from extensions import db
+        table = self.table
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                table.update().where(table.c.id == sid).values(data=data, user_id=user_id, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                conn.execute(table.insert().values(id=sid, data=data, user_id=user_id, expires_at=expires_at))
+
+    def delete(self, sid):
+        from extensions import db
+        table = self.table
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.id == sid))
+
+    def delete_user(self, user_id, keep_sid=None):
+        from extensions import db
+        table = self.table
+        query = table.delete().where(table.c.user_id == user_id)
+        if keep_sid:
+            query = query.where(table.c.id != keep_sid)
+        with db.engine.begin() as conn:
+            return conn.execute(query).rowcount
+
+    def sweep(self):
+        from extensions import db
+        table = self.table
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(table.c.expires_at <= datetime.utcnow())).rowcount
+
+
+class FileSessionStore:
+    """One JSON file per session in SESSION_FILE_DIR (single-instance deployments)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sid):
+        return os.path.join(self.directory, f'{sid}.json')
+
+    def read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, sid):
+        record = self.read(self.path(sid))
+        if record is None or record['expires_at'] <= time.time():
+            return None
+        return record['data'], datetime.utcfromtimestamp(record['expires_at'])
+
+    def save(self, sid, data, user_id, expires_at):
+        path = self.path(sid)
+        record = {'data': data, 'user_id': user_id,
+                  'expires_at': (expires_at - datetime(1970, 1, 1)).total_seconds()}
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self.path(sid))
+        except FileNotFoundError:
+            pass
+
+    def _remove_where(self, predicate):
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            record = self.read(os.path.join(self.directory, name))
+            if record is not None and predicate(name[:-5], record):
+                self.delete(name[:-5])
+                removed += 1
+        return removed
+
+    def delete_user(self, user_id, keep_sid=None):
+        return self._remove_where(lambda sid, record: record['user_id'] == user_id and sid != keep_sid)
+
+    def sweep(self):
+        now = time.time()
+        return self._remove_where(lambda sid, record: record['expires_at'] <= now)
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def is_sessionless(self, app, request):
+        return request.path in PROBE_PATHS or request.path.startswith(app.static_url_path + '/')
+
+    def new_session(self):
+        return ServerSession(sid=self.generate_sid(), new=True)
+
+    def generate_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        if self.is_sessionless(app, request):
+            return self.null_session_class()
+        started = time.perf_counter()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        session = None
+        if sid and SESSION_ID.match(sid):
+            stored = self.store.load(sid)
+            if stored is not None:
+                data, expires_at = stored
+                session = ServerSession(self.serializer.loads(data), sid=sid)
+                session.expires_at = expires_at
+        # Reported in the Server-Timing header by save_session
+        g.session_load_ms = (time.perf_counter() - started) * 1000
+        return session or self.new_session()
+
+    def save_session(self, app, session, response):
+        if self.is_sessionless(app, request):
+            return
+        if 'session_load_ms' in g:
+            response.headers.add('Server-Timing', f'session;dur={g.session_load_ms:.1f}')
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.new and session.get('_user_id') != session.loaded_user_id:
+            # New id on login and logout, so an id planted or seen before is worthless
+            self.store.delete(session.sid)
+            session.sid = self.generate_sid()
+            session.new = True
+
+        lifetime = app.permanent_session_lifetime
+        expires_at = datetime.utcnow() + lifetime
+        # Unchanged sessions are only written again to push the expiry forward
+        stale = getattr(session, 'expires_at', None) is None or \
+            session.expires_at - datetime.utcnow() < lifetime - app.config['SESSION_REFRESH_INTERVAL']
+        if session.modified or session.new or stale:
+            user_id = session.get('_user_id')
+            self.store.save(session.sid, self.serializer.dumps(dict(session)),
+                            int(user_id) if user_id else None, expires_at)
+            start_sweeper(app)
+
+        if session.new or session.modified or (session.permanent and stale):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+            response.vary.add('Cookie')
+
+
+def init_sessions(app):
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'database':
+        store = DatabaseSessionStore()
+    elif backend == 'filesystem':
+        store = FileSessionStore(app.config['SESSION_FILE_DIR'])
+    elif backend == 'cookie':
+        return
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
+    app.session_interface = ServerSessionInterface(store)
+
+
+def get_session_store():
+    interface = current_app.session_interface
+    return interface.store if isinstance(interface, ServerSessionInterface) else None
+
+
+def revoke_user_sessions(user_id, keep_current=False):
+    """Log a user out everywhere; with cookie sessions there is nothing to revoke."""
+    from flask import session
+    store = get_session_store()
+    if store is None:
+        return 0
+    return store.delete_user(user_id, keep_sid=getattr(session, 'sid', None) if keep_current else None)
+
+
+def start_sweeper(app):
+    """Delete expired sessions every SESSION_SWEEP_INTERVAL seconds (started in each worker)."""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None:
+            return
+        _sweeper = threading.Thread(target=_sweep_forever, args=(app,), name='session-sweeper', daemon=True)
+        _sweeper.start()
+
+
+def _sweep_forever(app):
+    store = app.session_interface.store
+    while True:
+        time.sleep(app.config['SESSION_SWEEP_INTERVAL'])
+        try:
+            with app.app_context():
+                removed = store.sweep()
+            if removed:
+                print(f'Sessions: removed {removed} expired')
+        except Exception as e:
+            print(f'Session sweep: {e}')
@@ -0,0 +1,205 @@
+import math
+from bisect import bisect_right
+from datetime import date, timedelta
+from zoneinfo import ZoneInfo
+from flask import current_app
+from sqlalchemy import func
+
+# Response times of protocols created in the statistics range: time to read
+# (created_at → admin_read_at) and time to reply (created_at → replied_at),
+# as p50/p90/p99 overall, per topic, per worker and per chart point.
+#
+# On PostgreSQL every grouping is one aggregate query with percentile_cont(),
+# reading only the rows of the range through ix_requests_created_at. Elsewhere
+# the rows are streamed once and each group keeps a LatencySketch, so memory
+# does not grow with the number of protocols. Results go through the statistics
+# cache like the other numbers of the page.
+
+PERCENTILES = (0.5, 0.9, 0.99)
+STREAM_BATCH_SIZE = 5000
+
+
+class LatencySketch:
+    """Durations counted in logarithmic buckets 2% wide: percentiles to about 1%
+    with memory bounded by the spread of the values, not their number."""
+
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def add(self, seconds):
+        # Everything under a second shares bucket 0
+        index = int(math.log(seconds, self.GROWTH)) if seconds > 1 else 0
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def percentile(self, q):
+        rank = q * (self.total - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return 0.0 if index == 0 else self.GROWTH ** (index + 0.5)
+        return None
+
+
+def format_duration(seconds):
+    """'45 дақ', '3 соат 20 дақ', '2 рӯз 4 соат'; used as the `duration` template filter."""
+    if seconds is None:
+        return '—'
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return '< 1 дақ'
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f'{days} рӯз {hours} соат' if hours else f'{days} рӯз'
+    if hours:
+        return f'{hours} соат {minutes} дақ' if minutes else f'{hours} соат'
+    return f'{minutes} дақ'
+
+
+def get_sla(date_from='', date_to=''):
+    """Response time percentiles for the statistics page and its XLSX download."""
+    from services.histogram import get_range
+    from services.statistics_cache import get_cached
+    start, end = get_range(date_from, date_to)
+    if start > end:
+        return None
+    return get_cached('sla', _compute_sla, start.isoformat(), end.isoformat(),
+                      current_app.config['ORG_TIMEZONE'], current_app.config['HISTOGRAM_MAX_POINTS'])
+
+
+def _compute_sla(start, end, tz_name, max_points):
+    from extensions import db
+    from services.histogram import get_buckets, to_utc
+
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    tz = ZoneInfo(tz_name)
+    buckets = get_buckets(start, end, max_points)
+    # UTC start of every chart point, then the end of the range
+    bounds = [to_utc(first, tz) for first, _, _, _ in buckets] + [to_utc(end + timedelta(days=1), tz)]
+
+    if db.engine.dialect.name == 'postgresql':
+        groups = _aggregate_in_sql(bounds)
+    else:
+        groups = _aggregate_streaming(bounds)
+
+    return {
+        'period': f"{start.strftime('%d.%m.%Y')} – {end.strftime('%d.%m.%Y')}",
+        'overall': groups['overall'].get(None) or _empty(),
+        'topics': _named_topics(groups['topic']),
+        'workers': _named_workers(groups['worker']),
+        'timeline': [
+            dict(groups['bucket'].get(i + 1) or _empty(), date=label, title=title)
+            for i, (_, _, label, title) in enumerate(buckets)
+        ]
+    }
+
+
+def _empty():
+    return {'read': _metric(0, None), 'reply': _metric(0, None)}
+
+
+def _metric(count, values):
+    values = values or (None,) * len(PERCENTILES)
+    return {'count': count, 'p50': values[0], 'p90': values[1], 'p99': values[2]}
+
+
+def _aggregate_in_sql(bounds):
+    """{grouping: {key: {'read': ..., 'reply': ...}}} from percentile_cont() queries."""
+    from sqlalchemy import Float, case, cast
+    from sqlalchemy.dialects.postgresql import ARRAY, array
+    from extensions import db
+    from models import Request
+
+    def seconds(column):
+        # NULL while not read / not replied, so count() and percentile_cont() skip
+        # the row; GREATEST() alone ignores the NULL and would return 0
+        elapsed = cast(func.extract('epoch', column - Request.created_at), Float)
+        return case((column.isnot(None), func.greatest(elapsed, 0)), else_=None)
+
+    def percentiles(value):
+        fractions = cast(array(PERCENTILES), ARRAY(Float))
+        return func.percentile_cont(fractions, type_=ARRAY(Float)).within_group(value)
+
+    read, reply = seconds(Request.admin_read_at), seconds(Request.replied_at)
+    keys = {
+        'overall': None,
+        'topic': Request.topic_id,
+        'worker': Request.user_id,
+        # 1 for the first chart point; rows are all inside the range
+        'bucket': func.width_bucket(Request.created_at, array(bounds[:-1]))
+    }
+    groups = {}
+    for name, key in keys.items():
+        columns = [func.count(read), percentiles(read), func.count(reply), percentiles(reply)]
+        query = db.session.query(*([key] if key is not None else []), *columns).filter(
+            Request.created_at >= bounds[0], Request.created_at < bounds[-1]
+        )
+        if key is not None:
+            query = query.group_by(key)
+        groups[name] = {}
+        for row in query:
+            group_key = row[0] if key is not None else None
+            read_count, read_values, reply_count, reply_values = row[-4:]
+            groups[name][group_key] = {'read': _metric(read_count, read_values),
+                                       'reply': _metric(reply_count, reply_values)}
+    return groups
+
+
+def _aggregate_streaming(bounds):
+    """Same result as _aggregate_in_sql(), from one pass over the rows of the range."""
+    from extensions import db
+    from models import Request
+
+    sketches = {'overall': {}, 'topic': {}, 'worker': {}, 'bucket': {}}
+    query = db.session.query(
+        Request.topic_id, Request.user_id, Request.created_at, Request.admin_read_at, Request.replied_at
+    ).filter(Request.created_at >= bounds[0], Request.created_at < bounds[-1])
+
+    for topic_id, user_id, created_at, read_at, replied_at in query.yield_per(STREAM_BATCH_SIZE):
+        groups = []
+        for name, key in (('overall', None), ('topic', topic_id), ('worker', user_id),
+                          ('bucket', bisect_right(bounds, created_at))):
+            group = sketches[name].get(key)
+            if group is None:
+                group = sketches[name][key] = {'read': LatencySketch(), 'reply': LatencySketch()}
+            groups.append(group)
+        for metric, done_at in (('read', read_at), ('reply', replied_at)):
+            if done_at is not None:
+                seconds = max((done_at - created_at).total_seconds(), 0)
+                for group in groups:
+                    group[metric].add(seconds)
+
+    return {
+        name: {
+            key: {metric: _metric(sketch.total, [sketch.percentile(q) for q in PERCENTILES] if sketch.total else None)
+                  for metric, sketch in group.items()}
+            for key, group in groups.items()
+        }
+        for name, groups in sketches.items()
+    }
+
+
+def _named_topics(groups):
+    from extensions import db
+    from models import Topic
+    topics = db.session.query(Topic.id, Topic.title, Topic.color).filter(Topic.id.in_(list(groups))).all()
+    rows = [dict(groups[id], title=title, color=color) for id, title, color in topics]
+    rows.sort(key=lambda r: r['read']['count'], reverse=True)
+    return rows
+
+
+def _named_workers(groups):
+    from extensions import db
+    from models import User
+    ids = [id for id in groups if id is not None]
+    users = db.session.query(User.id, User.username, User.full_name).filter(User.id.in_(ids)).all()
+    rows = [dict(groups[id], name=full_name or username) for id, username, full_name in users]
+    if None in groups:
+        rows.append(dict(groups[None], name='Нест шуд'))
+    rows.sort(key=lambda r: r['read']['count'], reverse=True)
+    return rows
@@ -0,0 +1,175 @@
+import json
+import time
+import random
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# Results of the statistics queries, keyed by their arguments (the date filters)
+# and the current versions of the tables they read. Every commit that adds,
+# changes or deletes a request, topic or user bumps that table's version once
+# the commit is done, so a result computed from older data is never served again.
+#
+# The versions always live in the shared `data_versions` table (one primary-key
+# read per lookup), so a commit in any worker or instance invalidates every cache.
+# STATS_CACHE_BACKEND 'memory': results are kept in this process's LRU only.
+# 'database': results are also stored in `statistics_cache`, shared by all
+# workers and instances, with the per-process LRU in front.
+
+TRACKED_TABLES = ('requests', 'topics', 'users')
+
+
+class ResultCache:
+    """LRU of results by key; entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def set(self, key, result):
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class DatabaseStatisticsStore:
+    """Table versions in `data_versions` and results in `statistics_cache`."""
+
+    def get_versions(self):
+        from extensions import db
+        from models import DataVersion
+        versions = dict(db.session.query(DataVersion.name, DataVersion.version)
+                        .filter(DataVersion.name.in_(TRACKED_TABLES)).all())
+        return [versions.get(name, 0) for name in TRACKED_TABLES]
+
+    def bump(self, tables):
+        from extensions import db
+        from models import DataVersion
+        table = DataVersion.__table__
+        increment = table.update().values(version=table.c.version + 1)
+        # Connections of their own: the committed session cannot run statements here
+        for name in tables:
+            try:
+                with db.engine.begin() as conn:
+                    if not conn.execute(increment.where(table.c.name == name)).rowcount:
+                        conn.execute(table.insert().values(name=name, version=1))
+            except IntegrityError:
+                # Another worker created the row at the same moment
+                with db.engine.begin() as conn:
+                    conn.execute(increment.where(table.c.name == name))
+
+    def get(self, key, ttl):
+        from extensions import db
+        from models import StatisticsCacheEntry
+        payload = db.session.query(StatisticsCacheEntry.payload).filter(
+            StatisticsCacheEntry.key == key,
+            StatisticsCacheEntry.created_at > time.time() - ttl
+        ).scalar()
+        return json.loads(payload) if payload is not None else None
+
+    def set(self, key, result, ttl):
+        from extensions import db
+        from models import StatisticsCacheEntry
+        table = StatisticsCacheEntry.__table__
+        now = time.time()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(key=key, payload=json.dumps(result), created_at=now))
+                if random.random() < 0.01:
+                    conn.execute(table.delete().where(table.c.created_at < now - ttl))
+        except IntegrityError:
+            # Another worker stored the same result first
+            pass
+
+
+class MemoryStatisticsStore(DatabaseStatisticsStore):
+    """Shared table versions; results stay in this worker's LRU only."""
+
+    def get(self, key, ttl):
+        return None
+
+    def set(self, key, result, ttl):
+        pass
+
+
+def init_statistics_cache(app):
+    backend = app.config['STATS_CACHE_BACKEND']
+    if backend == 'database':
+        store = DatabaseStatisticsStore()
+    elif backend == 'memory':
+        store = MemoryStatisticsStore()
+    else:
+        raise ValueError(f'Unknown STATS_CACHE_BACKEND: {backend}')
+    app.extensions['statistics_store'] = store
+    app.extensions['statistics_cache'] = ResultCache(app.config['STATS_CACHE_SIZE'], app.config['STATS_CACHE_TTL'])
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_tables(session, flush_context):
+    changed = session.info.setdefault('changed_tables', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        name = getattr(obj, '__tablename__', None)
+        if name in TRACKED_TABLES:
+            changed.add(name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions(session):
+    changed = session.info.pop('changed_tables', None)
+    if not changed or not has_app_context() or 'statistics_store' not in current_app.extensions:
+        return
+    try:
+        current_app.extensions['statistics_store'].bump(changed)
+    except Exception as e:
+        print(f'Statistics cache version bump: {e}')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+
+def get_cached(name, compute, *args):
+    """compute(*args), served from the cache while the tables it reads are unchanged.
+
+    The result is shared between requests and must not be modified.
+    """
+    cache = current_app.extensions['statistics_cache']
+    store = current_app.extensions['statistics_store']
+    raw_key = json.dumps([name, args, store.get_versions()])
+    key = hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        result = store.get(key, cache.ttl)
+        if result is None:
+            result = compute(*args)
+            store.set(key, result, cache.ttl)
+        cache.set(key, result)
+    return result
+
+
+def get_statistics(date_from='', date_to=''):
+    """Cached get_statistics_data() for the statistics page and its downloads."""
+    from services.export_data import get_statistics_data
+    return get_cached('statistics', get_statistics_data, date_from, date_to)
@@ -1,16 +1,41 @@
+import itertools
 from io import BytesIO
 from datetime import datetime
-from docx import Document
-from docx.shared import Inches, Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.table import WD_TABLE_ALIGNMENT
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from openpyxl.utils import get_column_letter
 
+# python-docx and openpyxl (with lxml) are imported inside the functions: they
+# are only needed for downloads and would otherwise slow every worker start.
+#
+# The Word documents are filled from the layouts in templates/docx by default
+# (services/docx_render.py); engine='python-docx' builds them in code instead,
+# as before, which benchmarks/docx_rendering.py uses for comparison.
 
-def create_statistics_word_document(stats_data, title="Омори дархостҳо", date_range=None):
+
+def create_statistics_word_document(stats_data, title="Омори дархостҳо", date_range=None, engine='template'):
     """Create a Word document with statistics data."""
+    if engine == 'template':
+        from services.docx_render import render_docx
+        return render_docx('statistics.docx', {
+            'title': title,
+            'date_range': date_range,
+            'generated_at': datetime.now().strftime('%d.%m.%Y %H:%M'),
+            'total_requests': stats_data.get('total_requests', 0),
+            'completed_requests': stats_data.get('completed_requests', 0),
+            'under_review_requests': stats_data.get('under_review_requests', 0),
+            'completion_rate': stats_data.get('completion_rate', 0),
+            'topics': [{
+                'title': topic.get('title', ''),
+                'count': topic.get('count', 0),
+                'completed': topic.get('completed', 0),
+                'pending': topic.get('pending', 0),
+                'percentage': topic.get('percentage', 0)
+            } for topic in stats_data.get('topic_stats', [])],
+            'show_users': 'total_users' in stats_data,
+            'total_users': stats_data.get('total_users', 0),
+            'total_admins': stats_data.get('total_admins', 0)
+        })
+    
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
     doc = Document()
     
     heading = doc.add_heading(title, 0)
@@ -81,8 +106,39 @@ def create_statistics_word_document(stats_data, title="Омори дархост
     return buffer
 
 
-def create_worker_statistics_word_document(worker_data, requests_list):
+def create_worker_statistics_word_document(worker_data, requests_list, engine='template'):
     """Create a Word document with worker-specific statistics."""
+    if engine == 'template':
+        from services.docx_render import render_docx
+        total_requests = len(requests_list)
+        completed = sum(1 for r in requests_list if r.get('status') == 'completed')
+        rows = []
+        for req in requests_list[:50]:
+            comment = req.get('comment', '')
+            rows.append({
+                'reg_number': req.get('reg_number', ''),
+                'topic': req.get('topic', ''),
+                'created_at': req.get('created_at', ''),
+                'status_label': req.get('status_label', ''),
+                'comment': comment[:50] + '...' if len(comment) > 50 else comment
+            })
+        return render_docx('worker_statistics.docx', {
+            'name': worker_data.get('full_name', worker_data.get('username', 'Номаълум')),
+            'generated_at': datetime.now().strftime('%d.%m.%Y %H:%M'),
+            'username': worker_data.get('username', ''),
+            'full_name': worker_data.get('full_name', ''),
+            'role_label': "Администратор" if worker_data.get('role') == 'admin' else "Корбар",
+            'created_at': worker_data.get('created_at', ''),
+            'total_requests': total_requests,
+            'completed': completed,
+            'under_review': total_requests - completed,
+            'completion_rate': round((completed / total_requests * 100), 1) if total_requests > 0 else 0,
+            'requests': rows,
+            'more_requests': max(total_requests - 50, 0)
+        })
+    
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
     doc = Document()
     
     heading = doc.add_heading(f"Омори корбар: {worker_data.get('full_name', worker_data.get('username', 'Номаълум'))}", 0)
@@ -162,8 +218,11 @@ def create_worker_statistics_word_document(worker_data, requests_list):
     return buffer
 
 
-def create_statistics_excel_document(stats_data, title="Омори дархостҳо", date_range=None):
-    """Create an Excel document with statistics data."""
+def create_statistics_excel_document(stats_data, title="Омори дархостҳо", date_range=None, sla_data=None):
+    """Create an Excel document with statistics data; `sla_data` from services/sla.py adds a response time sheet."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from openpyxl.utils import get_column_letter
     wb = Workbook()
     ws = wb.active
     ws.title = "Омор"
@@ -241,14 +300,79 @@ def create_statistics_excel_document(stats_data, title="Омори дархос
     for col in range(1, 6):
         ws.column_dimensions[get_column_letter(col)].width = 20
     
+    if sla_data:
+        _add_sla_sheet(wb, sla_data)
+    
     buffer = BytesIO()
     wb.save(buffer)
     buffer.seek(0)
     return buffer
 
 
+def _add_sla_sheet(wb, sla_data):
+    """Response time percentiles in hours: overall, per topic, per worker and over time."""
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from openpyxl.utils import get_column_letter
+    ws = wb.create_sheet("Вақти вокуниш")
+    
+    bold_font = Font(bold=True)
+    center_align = Alignment(horizontal='center')
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    header_fill = PatternFill(start_color="0891b2", end_color="0891b2", fill_type="solid")
+    header_font_white = Font(bold=True, color="FFFFFF")
+    
+    ws.merge_cells('A1:I1')
+    ws['A1'] = f"Вақти вокуниш (соат): {sla_data['period']}"
+    ws['A1'].font = Font(bold=True, size=14)
+    ws['A1'].alignment = center_align
+    
+    headers = ["", "Хонда шуд", "Хондан p50", "Хондан p90", "Хондан p99",
+               "Ҷавоб дода шуд", "Ҷавоб p50", "Ҷавоб p90", "Ҷавоб p99"]
+    sections = [
+        ("УМУМӢ", [("Ҳамаи протоколҳо", sla_data['overall'])]),
+        ("АЗ РӮИ МАВЗӮЪҲО", [(t['title'], t) for t in sla_data['topics']]),
+        ("АЗ РӮИ КОРМАНДОН", [(w['name'], w) for w in sla_data['workers']]),
+        ("АЗ РӮИ ВАҚТ", [(p['title'], p) for p in sla_data['timeline']]),
+    ]
+    
+    row = 3
+    for section_title, items in sections:
+        ws[f'A{row}'] = section_title
+        ws[f'A{row}'].font = bold_font
+        row += 1
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=row, column=col, value=header)
+            cell.font = header_font_white
+            cell.fill = header_fill
+            cell.alignment = center_align
+            cell.border = thin_border
+        row += 1
+        for name, item in items:
+            values = [name]
+            for metric in ('read', 'reply'):
+                values.append(item[metric]['count'])
+                values.extend(None if item[metric][p] is None else round(item[metric][p] / 3600, 2)
+                              for p in ('p50', 'p90', 'p99'))
+            for col, value in enumerate(values, 1):
+                ws.cell(row=row, column=col, value=value).border = thin_border
+            row += 1
+        row += 1
+    
+    ws.column_dimensions['A'].width = 32
+    for col in range(2, 10):
+        ws.column_dimensions[get_column_letter(col)].width = 14
+
+
 def create_worker_statistics_excel_document(worker_data, requests_list):
     """Create an Excel document with worker-specific statistics."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from openpyxl.utils import get_column_letter
     wb = Workbook()
     ws = wb.active
     ws.title = "Омори корбар"
@@ -351,10 +475,52 @@ def create_worker_statistics_excel_document(worker_data, requests_list):
     return buffer
 
 
-def create_protocol_word_document(request_data, media_path=None):
-    """Create a Word document for a single protocol/request."""
+def create_protocol_word_document(request_data, attachments=(), engine='template'):
+    """Create a Word document for a single protocol/request.
+
+    `attachments` are dicts with kind, name, picture_path and info. Photos and
+    video posters go into a two-column gallery from their pre-sized JPEG
+    renditions, so no original is decoded here; other files are listed by name.
+    """
     import os
     
+    pictures = [a for a in attachments if a['picture_path'] and os.path.exists(a['picture_path'])]
+    files = [a for a in attachments if a not in pictures]
+    
+    if engine == 'template':
+        from services.docx_render import render_docx, Picture
+        
+        def caption(attachment):
+            if attachment['kind'] != 'video':
+                return ''
+            info = f" ({attachment['info']})" if attachment['info'] else ''
+            return f"Видео: {attachment['name']}{info}"
+        
+        context = dict(request_data)
+        context.update({
+            'reg_number': request_data.get('reg_number', 'Н/Д'),
+            'coordinates': request_data.get('coordinates', 'Нест'),
+            'admin_read_at': request_data.get('admin_read_at', 'Нахонда'),
+            'comment': request_data.get('comment') or 'Шарҳ нест',
+            'files': [{'name': a['name']} for a in files],
+            'generated_at': datetime.now().strftime('%d.%m.%Y %H:%M')
+        })
+        if len(pictures) == 1:
+            context['single_picture'] = Picture(pictures[0]['picture_path'], 5)
+            context['single_picture_caption'] = caption(pictures[0])
+        elif pictures:
+            context['gallery'] = [{
+                'left': Picture(left['picture_path'], 3),
+                'left_caption': caption(left),
+                'right': Picture(right['picture_path'], 3) if right else None,
+                'right_caption': caption(right) if right else ''
+            } for left, right in zip(pictures[::2], pictures[1::2] + [None])]
+        return render_docx('protocol.docx', context)
+    
+    from docx import Document
+    from docx.shared import Inches, Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    
     doc = Document()
     
     heading = doc.add_heading("ПРОТОКОЛ", 0)
@@ -404,31 +570,30 @@ def create_protocol_word_document(request_data, media_path=None):
     else:
         doc.add_paragraph("Шарҳ нест")
     
-    if media_path and os.path.exists(media_path):
-        ext = os.path.splitext(media_path)[1].lower()
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-        if ext in image_extensions:
-            doc.add_paragraph()
-            doc.add_heading("Расм", level=1)
+    if pictures:
+        doc.add_paragraph()
+        doc.add_heading("Расмҳо" if len(pictures) > 1 else "Расм", level=1)
+        columns = 2 if len(pictures) > 1 else 1
+        gallery = doc.add_table(rows=(len(pictures) + columns - 1) // columns, cols=columns)
+        for i, attachment in enumerate(pictures):
+            cell = gallery.rows[i // columns].cells[i % columns]
+            paragraph = cell.paragraphs[0]
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
             try:
-                from PIL import Image
-                img = Image.open(media_path)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                img_buffer = BytesIO()
-                img.save(img_buffer, format='JPEG', quality=90)
-                img_buffer.seek(0)
-                
-                doc.add_picture(img_buffer, width=Inches(5))
-                last_paragraph = doc.paragraphs[-1]
-                last_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                paragraph.add_run().add_picture(attachment['picture_path'], width=Inches(3 if columns == 2 else 5))
             except Exception as e:
-                doc.add_paragraph(f"Расмро илова кардан имконнопазир: {str(e)}")
-        else:
-            doc.add_paragraph()
-            doc.add_heading("Файли замима", level=1)
-            doc.add_paragraph(f"Номи файл: {os.path.basename(media_path)}")
+                paragraph.add_run(f"Расмро илова кардан имконнопазир: {str(e)}")
+            if attachment['kind'] == 'video':
+                caption = cell.add_paragraph(f"Видео: {attachment['name']}")
+                if attachment['info']:
+                    caption.add_run(f" ({attachment['info']})")
+                caption.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    if files:
+        doc.add_paragraph()
+        doc.add_heading("Файлҳои замима", level=1)
+        for attachment in files:
+            doc.add_paragraph(f"Номи файл: {attachment['name']}", style='List Bullet')
     
     if request_data.get('admin_reply'):
         doc.add_paragraph()
@@ -448,3 +613,36 @@ def create_protocol_word_document(request_data, media_path=None):
     doc.save(buffer)
     buffer.seek(0)
     return buffer
+
+
+def _csv_lines(rows):
+    """CSV text of `rows`, one line at a time, for streaming responses.
+
+    Starts with a BOM so that Excel opens the UTF-8 file with the right encoding.
+    """
+    import csv
+    from io import StringIO
+    line = StringIO()
+    writer = csv.writer(line)
+    yield '\ufeff'
+    for row in rows:
+        writer.writerow(row)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+def create_statistics_csv(stats_data):
+    """Per-topic statistics as CSV lines."""
+    rows = [("Мавзӯъ", "Шумора", "Иҷро шуд", "Дар тафтиш", "Фоиз")]
+    rows.extend((t['title'], t['count'], t['completed'], t['pending'], t['percentage'])
+                for t in stats_data.get('topic_stats', []))
+    return _csv_lines(rows)
+
+
+def create_worker_statistics_csv(requests_rows):
+    """A worker's protocols as CSV lines; `requests_rows` may be a lazy iterator."""
+    header = [("Рақами қайд", "Мавзӯъ", "Сана", "Ҳолат", "Шарҳ")]
+    rows = ((r.get('reg_number', ''), r.get('topic', ''), r.get('created_at', ''),
+             r.get('status_label', ''), r.get('comment', '')) for r in requests_rows)
+    return _csv_lines(itertools.chain(header, rows))
@@ -0,0 +1,259 @@
+import hashlib
+from flask import Request, current_app, request, jsonify, flash, redirect
+from werkzeug.datastructures import FileStorage
+from werkzeug.formparser import FormDataParser, MultiPartParser
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Upload validation while the multipart body streams in: fields are checked as
+# soon as each one is complete and a file part is rejected on its name,
+# declared type, first bytes or size, before the rest of the body is read.
+# Accepted files carry their SHA-256 (FileStorage.sha256) for content-addressed
+# storage.
+
+UPLOAD_CATEGORIES = {
+    'image': {'png', 'jpg', 'jpeg', 'gif', 'webp'},
+    'video': {'mp4', 'mov', 'avi', 'webm'},
+    'document': {'pdf', 'doc', 'docx'},
+}
+
+DECLARED_TYPES = {
+    'image': ('image/',),
+    'video': ('video/',),
+    'document': ('application/pdf', 'application/msword', 'application/vnd.openxmlformats'),
+}
+
+SNIFF_BYTES = 16
+
+
+def sniff_category(head):
+    """Category of a file from its first bytes, or None when unrecognised."""
+    if head.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')):
+        return 'image'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image'
+    if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return 'video'
+    if head.startswith(b'\x1a\x45\xdf\xa3') or (head.startswith(b'RIFF') and head[8:12] == b'AVI '):
+        return 'video'
+    if head.startswith((b'%PDF-', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', b'PK\x03\x04')):
+        return 'document'
+    return None
+
+
+def get_category(filename):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    for category, extensions in UPLOAD_CATEGORIES.items():
+        if ext in extensions and ext in current_app.config['ALLOWED_EXTENSIONS']:
+            return category
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ValidatingStream:
+    """Upload container that checks the first bytes and the size and hashes the data on every write."""
+
+    def __init__(self, stream, category, max_size):
+        self.stream = stream
+        self.category = category
+        self.max_size = max_size
+        self.size = 0
+        self.head = b''
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadRejected(
+                f'Файл аз ҳад калон аст (ҳадди аксар {self.max_size // (1024 * 1024)} MB).', 413
+            )
+        if len(self.head) < SNIFF_BYTES:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.check_head()
+        self.sha256.update(data)
+        return self.stream.write(data)
+
+    def check_head(self):
+        if sniff_category(self.head) != self.category:
+            raise UploadRejected('Мӯҳтавои файл ба формати он мувофиқат намекунад.', 415)
+
+    def finish(self):
+        # Files shorter than SNIFF_BYTES are checked once complete
+        if 0 < len(self.head) < SNIFF_BYTES:
+            self.check_head()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class UploadValidator:
+    """Per-endpoint rules. `fields` maps a field name to a check that raises
+    UploadRejected; `files` lists the file fields that may be uploaded."""
+
+    fields = {}
+    files = ()
+
+    def __init__(self):
+        self.file_count = 0
+
+    def check_field(self, name, value):
+        check = self.fields.get(name)
+        if check is not None:
+            check(value)
+
+    def open_file(self, event, stream_factory, total_content_length):
+        if event.name not in self.files:
+            raise UploadRejected('Файли номаълум.', 400)
+        if not event.filename:
+            # No file chosen: browsers still send an empty part
+            return stream_factory(total_content_length=total_content_length, content_type=None,
+                                  filename=event.filename, content_length=0)
+        self.file_count += 1
+        max_files = current_app.config['MAX_ATTACHMENTS']
+        if self.file_count > max_files:
+            raise UploadRejected(f'Ҳадди аксар {max_files} файл замима кардан мумкин аст.', 413)
+        category = get_category(event.filename)
+        if category is None:
+            raise UploadRejected('Формати файл иҷозат дода нашудааст. Танҳо расм, видео ва ҳуҷҷатҳо (PDF, DOC) иҷозат аст.', 415)
+        declared = (event.headers.get('content-type') or 'application/octet-stream').lower()
+        if declared != 'application/octet-stream' and not declared.startswith(DECLARED_TYPES[category]):
+            raise UploadRejected('Намуди файл ба формати он мувофиқат намекунад.', 415)
+        max_size = current_app.config['UPLOAD_SIZE_LIMITS'][category]
+        stream = stream_factory(total_content_length=total_content_length, content_type=declared,
+                                filename=event.filename, content_length=0)
+        return ValidatingStream(stream, category, max_size)
+
+
+def check_topic_id(value):
+    from models import Topic
+    try:
+        topic_id = int(value)
+    except ValueError:
+        raise UploadRejected('Мавзӯъро интихоб кунед.')
+    if Topic.query.get(topic_id) is None:
+        raise UploadRejected('Мавзӯъи интихобшуда ёфт нашуд.')
+
+
+class CreateRequestUpload(UploadValidator):
+    fields = {'topic_id': check_topic_id}
+    files = ('media',)
+
+
+UPLOAD_VALIDATORS = {
+    'user.create_request': CreateRequestUpload,
+}
+
+
+class ValidatingMultiPartParser(MultiPartParser):
+    def __init__(self, validator, **kwargs):
+        super().__init__(**kwargs)
+        self.validator = validator
+
+    def parse(self, stream, boundary, content_length):
+        decoder = MultipartDecoder(boundary, max_form_memory_size=self.max_form_memory_size,
+                                   max_parts=self.max_form_parts)
+        fields = []
+        files = []
+        part = container = None
+        field_size = 0
+
+        while True:
+            data = stream.read(self.buffer_size)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, container, field_size = event, [], 0
+                elif isinstance(event, File):
+                    part, field_size = event, None
+                    container = self.validator.open_file(event, self.stream_factory, content_length)
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        field_size += len(event.data)
+                        if self.max_form_memory_size is not None and field_size > self.max_form_memory_size:
+                            raise RequestEntityTooLarge()
+                        container.append(event.data)
+                    else:
+                        container.write(event.data)
+                    if not event.more_data:
+                        if isinstance(part, Field):
+                            value = b''.join(container).decode(self.get_part_charset(part.headers), 'replace')
+                            self.validator.check_field(part.name, value)
+                            fields.append((part.name, value))
+                        else:
+                            digest = None
+                            if isinstance(container, ValidatingStream):
+                                container.finish()
+                                digest = container.sha256.hexdigest()
+                                container = container.stream
+                            container.seek(0)
+                            storage = FileStorage(container, part.filename, part.name, headers=part.headers)
+                            storage.sha256 = digest
+                            files.append((part.name, storage))
+                event = decoder.next_event()
+            if not data or isinstance(event, Epilogue):
+                break
+
+        return self.cls(fields), self.cls(files)
+
+
+class UploadFormDataParser(FormDataParser):
+    def __init__(self, validator, **kwargs):
+        super().__init__(**kwargs)
+        self.validator = validator
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        boundary = options.get('boundary', '').encode('ascii')
+        if not boundary:
+            raise ValueError('Missing boundary')
+        parser = ValidatingMultiPartParser(
+            self.validator,
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls
+        )
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class UploadRequest(Request):
+    """Request whose multipart bodies are validated while they are parsed
+    for endpoints listed in UPLOAD_VALIDATORS."""
+
+    def make_form_data_parser(self):
+        validator = UPLOAD_VALIDATORS.get(self.endpoint)
+        if validator is None:
+            return super().make_form_data_parser()
+        return UploadFormDataParser(
+            validator(),
+            stream_factory=self._get_file_stream,
+            max_form_memory_size=self.max_form_memory_size,
+            max_content_length=self.max_content_length,
+            max_form_parts=self.max_form_parts,
+            cls=self.parameter_storage_class
+        )
+
+
+def upload_rejected(error):
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'error': error.message})
+        response.status_code = error.status
+    else:
+        flash(error.message, 'danger')
+        response = redirect(request.url, code=303)
+    # The rest of the body is never read, so the connection can't be reused
+    response.headers['Connection'] = 'close'
+    return response
+
+
+def init_uploads(app):
+    app.request_class = UploadRequest
+    app.register_error_handler(UploadRejected, upload_rejected)
@@ -0,0 +1,81 @@
+import time
+import threading
+from collections import OrderedDict
+from flask import current_app
+from flask_login import UserMixin
+
+
+class SessionUser(UserMixin):
+    """Read-only snapshot of a users row: what current_user needs on every request."""
+
+    def __init__(self, id, username, full_name, role, avatar):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.role = role
+        self.avatar = avatar
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+
+class UserCache:
+    """LRU of SessionUser by id. Entries expire after `ttl` seconds so changes made
+    through another worker process are picked up without explicit invalidation."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+def init_user_cache(app):
+    app.extensions['user_cache'] = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def get_session_user(user_id):
+    from extensions import db
+    from models import User
+
+    cache = current_app.extensions['user_cache']
+    user = cache.get(user_id)
+    if user is None:
+        row = db.session.query(
+            User.id, User.username, User.full_name, User.role, User.avatar
+        ).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = SessionUser(*row)
+        cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    current_app.extensions['user_cache'].invalidate(user_id)
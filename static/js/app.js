@@ -1,6 +1,9 @@
 if ('serviceWorker' in navigator) {
     window.addEventListener('load', function() {
-        navigator.serviceWorker.register('/sw.js')
+        // The asset version changes the script URL, so a new deploy installs a new app shell
+        var versionMeta = document.querySelector('meta[name="asset-version"]');
+        var swUrl = '/sw.js' + (versionMeta ? '?v=' + versionMeta.content : '');
+        navigator.serviceWorker.register(swUrl)
             .then(function(registration) {
                 console.log('ServiceWorker registration successful');
             })
@@ -35,3 +38,31 @@ document.querySelectorAll('form').forEach(function(form) {
         }
     });
 });
+
+function syncOutbox() {
+    if (typeof NazoratOutbox !== 'undefined' && document.body.dataset.outbox && navigator.onLine) {
+        NazoratOutbox.requestSync().catch(function(err) {
+            console.log('Outbox sync failed: ', err);
+        });
+    }
+}
+
+window.addEventListener('load', syncOutbox);
+window.addEventListener('online', syncOutbox);
+
+// Live updates for the admin pages over /admin/events. A worker that already serves
+// its share of streams answers 503, which EventSource does not retry by itself.
+function openEventStream(url, handlers) {
+    var source = new EventSource(url);
+    Object.keys(handlers).forEach(function(type) {
+        source.addEventListener(type, handlers[type]);
+    });
+    source.addEventListener('error', function() {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(function() {
+                openEventStream(url, handlers);
+            }, 20000 + Math.random() * 20000);
+        }
+    });
+    return source;
+}
@@ -0,0 +1,184 @@
+// Offline outbox for new protocols, shared by the pages and the service worker.
+// Submissions are kept in IndexedDB and replayed to /user/create with their
+// idempotency key, so a retry never creates a second protocol.
+var NazoratOutbox = (function() {
+    var DB_NAME = 'nazorat-outbox';
+    var STORE = 'submissions';
+    var SYNC_TAG = 'outbox-sync';
+    var replaying = null;
+    var sentHandler = null;
+
+    function openDb() {
+        return new Promise(function(resolve, reject) {
+            var req = indexedDB.open(DB_NAME, 1);
+            req.onupgradeneeded = function() {
+                req.result.createObjectStore(STORE, { keyPath: 'key' });
+            };
+            req.onsuccess = function() { resolve(req.result); };
+            req.onerror = function() { reject(req.error); };
+        });
+    }
+
+    function withStore(mode, fn) {
+        return openDb().then(function(db) {
+            return new Promise(function(resolve, reject) {
+                var tx = db.transaction(STORE, mode);
+                var result = fn(tx.objectStore(STORE));
+                tx.oncomplete = function() {
+                    db.close();
+                    resolve(result && 'result' in result ? result.result : undefined);
+                };
+                tx.onerror = function() {
+                    db.close();
+                    reject(tx.error);
+                };
+            });
+        });
+    }
+
+    function newKey() {
+        if (self.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return Date.now().toString(16) + Math.random().toString(16).slice(2);
+    }
+
+    function add(entry) {
+        entry.status = 'pending';
+        entry.created_at = entry.created_at || new Date().toISOString();
+        return withStore('readwrite', function(store) { return store.put(entry); });
+    }
+
+    function all() {
+        return withStore('readonly', function(store) { return store.getAll(); });
+    }
+
+    function remove(key) {
+        return withStore('readwrite', function(store) { return store.delete(key); });
+    }
+
+    function update(entry) {
+        return withStore('readwrite', function(store) { return store.put(entry); });
+    }
+
+    function requestSync() {
+        if (!('serviceWorker' in navigator)) return replay();
+        return navigator.serviceWorker.ready.then(function(reg) {
+            if (reg.sync) return reg.sync.register(SYNC_TAG);
+            return replay();
+        }).catch(function() {
+            return replay();
+        });
+    }
+
+    function fetchCsrfToken() {
+        return fetch('/user/csrf-token', {
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json' }
+        }).then(function(response) {
+            if (!response.ok || response.redirected) throw new Error('auth');
+            return response.json();
+        }).then(function(data) {
+            return data.csrf_token;
+        });
+    }
+
+    function send(entry, csrfToken) {
+        var body = new FormData();
+        body.append('csrf_token', csrfToken);
+        body.append('idempotency_key', entry.key);
+        Object.keys(entry.fields).forEach(function(name) {
+            if (entry.fields[name] !== null && entry.fields[name] !== undefined) {
+                body.append(name, entry.fields[name]);
+            }
+        });
+        // Entries saved before protocols could have several files carry a single `file`
+        var files = entry.files || (entry.file ? [entry.file] : []);
+        var names = entry.file_names || [entry.file_name];
+        files.forEach(function(file, i) {
+            body.append('media', file, names[i] || file.name || 'media');
+        });
+        return fetch('/user/create', {
+            method: 'POST',
+            body: body,
+            credentials: 'same-origin',
+            headers: { 'Accept': 'application/json', 'Idempotency-Key': entry.key }
+        });
+    }
+
+    function replayEntries(entries, csrfToken) {
+        var sent = 0;
+        return entries.reduce(function(chain, entry) {
+            return chain.then(function() {
+                return send(entry, csrfToken).then(function(response) {
+                    if (response.ok && !response.redirected) {
+                        sent++;
+                        return remove(entry.key);
+                    }
+                    // Rejected by validation (bad field, file type or size) or a key
+                    // already taken: retrying won't help
+                    if (response.status === 400 || response.status === 409 || response.status === 413 || response.status === 415) {
+                        return response.json().catch(function() { return {}; }).then(function(data) {
+                            entry.status = 'failed';
+                            entry.error = data.error || ('HTTP ' + response.status);
+                            return update(entry);
+                        });
+                    }
+                    // Session expired or server error: keep the entry for the next sync
+                    throw new Error('HTTP ' + response.status);
+                });
+            });
+        }, Promise.resolve()).then(function() {
+            return sent;
+        });
+    }
+
+    function notifyClients(sent) {
+        var message = { type: 'outbox-updated', sent: sent };
+        if (self.clients && self.clients.matchAll) {
+            return self.clients.matchAll().then(function(clients) {
+                clients.forEach(function(client) { client.postMessage(message); });
+            });
+        }
+        self.dispatchEvent(new CustomEvent('outbox-updated', { detail: message }));
+    }
+
+    function replay() {
+        if (replaying) return replaying;
+        replaying = all().then(function(entries) {
+            var pending = entries.filter(function(entry) { return entry.status === 'pending'; });
+            if (!pending.length) return 0;
+            return fetchCsrfToken().then(function(token) {
+                return replayEntries(pending, token);
+            });
+        }).then(function(sent) {
+            return Promise.resolve(sent && sentHandler ? sentHandler() : null).then(function() {
+                notifyClients(sent);
+                return sent;
+            });
+        }, function(err) {
+            // Some entries may have gone through before the failure
+            return Promise.resolve(sentHandler ? sentHandler() : null).then(function() {
+                notifyClients(0);
+                throw err;
+            });
+        });
+        replaying.then(clear, clear);
+        function clear() { replaying = null; }
+        return replaying;
+    }
+
+    // Called after protocols were delivered, before clients are notified
+    function onSent(handler) {
+        sentHandler = handler;
+    }
+
+    return {
+        SYNC_TAG: SYNC_TAG,
+        onSent: onSent,
+        newKey: newKey,
+        add: add,
+        all: all,
+        remove: remove,
+        requestSync: requestSync,
+        replay: replay
+    };
+})();
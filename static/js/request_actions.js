@@ -0,0 +1,110 @@
+// Admin actions on one protocol (complete, delete, reply) sent with fetch. The
+// server answers with the new state of that protocol as JSON and the page updates
+// its row in place, instead of following a redirect that rebuilds the whole list.
+// Without JavaScript, or when the request fails, the forms post and redirect as before.
+var NazoratActions = (function() {
+    var COMPLETED_HTML = '<span class="text-success" title="Иҷро шудааст" style="width: 32px; text-align: center;"><i class="bi bi-check-circle-fill fs-5"></i></span>';
+
+    function send(form) {
+        return fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { 'Accept': 'application/json' },
+            credentials: 'same-origin'
+        }).then(function(response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    function bind(form, onDone) {
+        var button = form.querySelector('button[type="submit"]');
+        var buttonHtml = button ? button.innerHTML : '';
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            send(form).then(function(data) {
+                // app.js turned the button into a spinner on submit
+                if (button) {
+                    button.disabled = false;
+                    button.innerHTML = buttonHtml;
+                }
+                onDone(data);
+            }, function() {
+                form.submit();
+            });
+        });
+    }
+
+    function findRow(id) {
+        return document.querySelector('.request-row[data-id="' + id + '"]');
+    }
+
+    function updateRow(data) {
+        var row = findRow(data.request_id);
+        if (!row) return;
+        var badge = row.querySelector('.status-badge');
+        badge.className = 'badge bg-' + data.status_class + ' status-badge';
+        badge.textContent = data.status_label;
+        row.classList.toggle('table-info', data.status === 'new');
+        if (data.status === 'completed') {
+            var form = row.querySelector('.complete-form');
+            if (form) {
+                form.outerHTML = COMPLETED_HTML;
+            }
+        }
+    }
+
+    function removeRow(id) {
+        var row = findRow(id);
+        if (!row) return;
+        row.parentNode.removeChild(row);
+        var count = document.getElementById('protocolCount');
+        if (count) {
+            count.textContent = Math.max(parseInt(count.textContent, 10) - 1, 0);
+        }
+    }
+
+    function showMessage(message, category) {
+        var main = document.querySelector('main');
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-' + category + ' alert-dismissible fade show';
+        alert.setAttribute('role', 'alert');
+        alert.textContent = message;
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        alert.appendChild(close);
+        main.insertBefore(alert, main.firstChild);
+        setTimeout(function() {
+            bootstrap.Alert.getOrCreateInstance(alert).close();
+        }, 5000);
+    }
+
+    // The complete buttons and delete modals of a protocol list
+    function bindList() {
+        document.querySelectorAll('.complete-form').forEach(function(form) {
+            bind(form, updateRow);
+        });
+        document.querySelectorAll('.delete-form').forEach(function(form) {
+            bind(form, function(data) {
+                var modal = form.closest('.modal');
+                if (modal) {
+                    bootstrap.Modal.getOrCreateInstance(modal).hide();
+                }
+                removeRow(data.request_id);
+                showMessage(data.message, 'success');
+            });
+        });
+    }
+
+    return {
+        bind: bind,
+        bindList: bindList,
+        updateRow: updateRow,
+        removeRow: removeRow,
+        showMessage: showMessage
+    };
+})();
@@ -1,5 +1,12 @@
-const CACHE_NAME = 'darkhostho-v3';
-const STATIC_ASSETS = [
+importScripts('/static/js/outbox.js');
+
+// Registered as /sw.js?v=<asset version> (see app.js), so every deploy with
+// changed assets installs a fresh app shell.
+const VERSION = new URL(location.href).searchParams.get('v') || 'dev';
+const SHELL_CACHE = 'nazorat-shell-' + VERSION;
+const RUNTIME_CACHE = 'nazorat-runtime';
+const PAGE_CACHE = 'nazorat-pages';
+const CDN_ASSETS = [
     'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
     'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/bootstrap-icons.css',
     'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
@@ -10,22 +17,27 @@ const STATIC_ASSETS = [
 self.addEventListener('install', function(event) {
     self.skipWaiting();
     event.waitUntil(
-        caches.open(CACHE_NAME)
-            .then(function(cache) {
-                return cache.addAll(STATIC_ASSETS);
-            })
-            .catch(function(err) {
-                console.log('Cache install failed:', err);
-            })
+        caches.open(SHELL_CACHE).then(function(cache) {
+            const shell = fetch('/asset-manifest.json', { cache: 'no-store' })
+                .then(function(response) { return response.json(); })
+                .then(function(manifest) { return cache.addAll(manifest.precache); });
+            const cdn = cache.addAll(CDN_ASSETS).catch(function(err) {
+                console.log('CDN precache failed:', err);
+            });
+            return Promise.all([shell, cdn]);
+        }).catch(function(err) {
+            console.log('Cache install failed:', err);
+        })
     );
 });
 
 self.addEventListener('activate', function(event) {
+    const keep = [SHELL_CACHE, RUNTIME_CACHE, PAGE_CACHE];
     event.waitUntil(
         caches.keys().then(function(cacheNames) {
             return Promise.all(
                 cacheNames.filter(function(cacheName) {
-                    return cacheName !== CACHE_NAME;
+                    return keep.indexOf(cacheName) === -1;
                 }).map(function(cacheName) {
                     return caches.delete(cacheName);
                 })
@@ -36,25 +48,92 @@ self.addEventListener('activate', function(event) {
     );
 });
 
+function clearPages() {
+    return caches.delete(PAGE_CACHE);
+}
+
+function cacheFirst(request) {
+    return caches.match(request).then(function(cached) {
+        return cached || fetch(request).then(function(response) {
+            if (response.ok) {
+                const copy = response.clone();
+                caches.open(RUNTIME_CACHE).then(function(cache) { cache.put(request, copy); });
+            }
+            return response;
+        });
+    });
+}
+
+function staleWhileRevalidate(event, cacheName, shouldStore) {
+    const request = event.request;
+    return caches.open(cacheName).then(function(cache) {
+        return cache.match(request).then(function(cached) {
+            const network = fetch(request).then(function(response) {
+                if (shouldStore(response)) {
+                    return cache.put(request, response.clone()).then(function() { return response; });
+                }
+                if (response.type === 'opaqueredirect' || response.status === 401 || response.status === 403) {
+                    // Session ended or access revoked: stop serving the cached copy
+                    return cache.delete(request).then(function() { return response; });
+                }
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(network.catch(function() {}));
+                return cached;
+            }
+            return network;
+        });
+    });
+}
+
 self.addEventListener('fetch', function(event) {
-    const url = new URL(event.request.url);
-    
+    const request = event.request;
+    const url = new URL(request.url);
+
     if (url.origin !== location.origin) {
-        event.respondWith(
-            caches.match(event.request).then(function(cached) {
-                return cached || fetch(event.request);
-            })
-        );
+        event.respondWith(cacheFirst(request));
         return;
     }
-    
-    event.respondWith(
-        fetch(event.request)
-            .then(function(response) {
-                return response;
-            })
-            .catch(function() {
-                return caches.match(event.request);
-            })
-    );
+
+    // Any write (new protocol, login, reply...) can change what the cached pages show
+    if (request.method !== 'GET') {
+        event.respondWith(clearPages().then(function() { return fetch(request); }));
+        return;
+    }
+
+    if (url.pathname === '/logout') {
+        event.respondWith(clearPages().then(function() { return fetch(request); }));
+        return;
+    }
+
+    if (url.pathname.startsWith('/static/')) {
+        // Fingerprinted (?v=hash) URLs never change; the rest revalidate in the background
+        if (url.searchParams.has('v')) {
+            event.respondWith(cacheFirst(request));
+        } else {
+            event.respondWith(staleWhileRevalidate(event, RUNTIME_CACHE, function(response) {
+                return response.ok;
+            }));
+        }
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        // Only pages the server marks with X-Page-Cache: swr are kept (user.dashboard, user.create_request)
+        event.respondWith(staleWhileRevalidate(event, PAGE_CACHE, function(response) {
+            return response.ok && response.headers.get('X-Page-Cache') === 'swr';
+        }).catch(function() {
+            return caches.match(request);
+        }));
+    }
+});
+
+// Replays from the worker bypass the fetch handler, so drop stale pages here
+NazoratOutbox.onSent(clearPages);
+
+self.addEventListener('sync', function(event) {
+    if (event.tag === NazoratOutbox.SYNC_TAG) {
+        event.waitUntil(NazoratOutbox.replay());
+    }
 });
@@ -0,0 +1,58 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The application on a temporary SQLite database and folders, shared by the whole run."""
+    folder = tmp_path_factory.mktemp('nazorat')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DATABASE_URL', f"sqlite:///{folder / 'nazorat.db'}")
+        for name in ('UPLOAD_FOLDER', 'EXPORT_FOLDER', 'PDF_CACHE_FOLDER', 'SESSION_FILE_DIR'):
+            mp.setenv(name, str(folder / name.lower()))
+        mp.setenv('MEDIA_PIPELINE_ENABLED', '0')
+        mp.setenv('RATE_LIMIT_ENABLED', '0')
+        from app import create_app
+        app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        from extensions import db
+        db.session.rollback()
+
+
+@pytest.fixture(scope='session')
+def worker(app):
+    """Id of a worker account; a topic to file protocols under exists too."""
+    from extensions import db
+    from models import User, Topic
+    with app.app_context():
+        user = User(username='worker', full_name='Корманд', role='user')
+        user.set_password('secret1')
+        db.session.add_all([user, Topic(title='Санитария')])
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def worker_client(app, worker):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'worker', 'password': 'secret1'})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
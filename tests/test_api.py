@@ -0,0 +1,84 @@
+import types
+from datetime import datetime, timedelta
+import pytest
+from extensions import db
+from models import Request, Topic, User
+from routes.api import SYNC_OVERLAP, encode_cursor, decode_cursor, parse_datetime
+
+
+@pytest.fixture(scope='module')
+def api_user(app, worker):
+    """A worker of its own, so other tests' protocols stay out of its listings."""
+    with app.app_context():
+        user = User(username='api-worker', full_name='API', role='user')
+        user.set_password('secret1')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def api_client(app, api_user):
+    client = app.test_client()
+    assert client.post('/login', data={'username': 'api-worker', 'password': 'secret1'}).status_code == 302
+    return client
+
+
+def add_requests(app, user_id, *updated_at):
+    with app.app_context():
+        topic_id = Topic.query.first().id
+        rows = [Request(user_id=user_id, topic_id=topic_id, updated_at=value, created_at=value) for value in updated_at]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def sync(client, **args):
+    response = client.get('/api/v1/requests', query_string=args)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_cursor_round_trip():
+    req = types.SimpleNamespace(updated_at=datetime(2026, 10, 19, 8, 30, 15, 123456), id=42)
+    cursor = encode_cursor(req)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (req.updated_at, 42)
+
+
+def test_bad_cursor_is_refused(api_client):
+    response = api_client.get('/api/v1/requests', query_string={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+def test_pages_follow_updated_at_and_id(app, api_user, api_client):
+    start = datetime.utcnow() - timedelta(days=1)
+    # Equal timestamps are ordered by id, also across a page boundary
+    ids = add_requests(app, api_user, start, start, start, start + timedelta(seconds=1), start + timedelta(seconds=2))
+
+    seen = []
+    page = sync(api_client, limit=2)
+    while True:
+        seen += [item['id'] for item in page['items']]
+        if not page['next_cursor']:
+            break
+        page = sync(api_client, limit=2, cursor=page['next_cursor'])
+    assert seen[-len(ids):] == ids
+    assert len(seen) == len(set(seen)) == page['total']
+
+
+def test_sync_token_overlaps_the_previous_sync(app, api_user, api_client):
+    first = sync(api_client)
+    token = parse_datetime(first['sync_token'])
+    assert datetime.utcnow() - token == pytest.approx(SYNC_OVERLAP, abs=timedelta(seconds=5))
+
+    # Committed after that sync, but stamped before it finished, and long before it
+    late, old = add_requests(app, api_user,
+                             datetime.utcnow() - SYNC_OVERLAP / 2,
+                             datetime.utcnow() - SYNC_OVERLAP * 2)
+
+    delta = sync(api_client, updated_since=first['sync_token'])
+    ids = [item['id'] for item in delta['items']]
+    assert late in ids
+    assert old not in ids
+    assert delta['total'] == first['total'] + 2
@@ -0,0 +1,96 @@
+import io
+import os
+import uuid
+from extensions import db
+from models import MediaFile, Request, Topic
+from services.media import acquire_media, release_media, remove_unreferenced_media, get_media_path
+
+
+def ref_count(filename):
+    row = db.session.get(MediaFile, filename)
+    return row.ref_count if row else None
+
+
+def store(filename):
+    with open(get_media_path(filename), 'wb') as f:
+        f.write(b'%PDF-1.7\n')
+
+
+def test_acquire_counts_references(app_context):
+    filename = f'{uuid.uuid4().hex}.pdf'
+    acquire_media(filename)
+    acquire_media(filename)
+    db.session.commit()
+    assert ref_count(filename) == 2
+
+
+def test_release_reports_files_without_references(app_context):
+    filename = f'{uuid.uuid4().hex}.pdf'
+    acquire_media(filename)
+    acquire_media(filename)
+    db.session.commit()
+
+    assert release_media(filename) == []
+    db.session.commit()
+    assert ref_count(filename) == 1
+
+    assert release_media(filename, None) == [filename]
+    db.session.commit()
+    assert ref_count(filename) is None
+
+
+def test_release_is_undone_with_its_transaction(app_context):
+    filename = f'{uuid.uuid4().hex}.pdf'
+    acquire_media(filename)
+    db.session.commit()
+    release_media(filename)
+    db.session.rollback()
+    assert ref_count(filename) == 1
+
+
+def test_referenced_files_are_not_removed(app_context):
+    filename = f'{uuid.uuid4().hex}.pdf'
+    store(filename)
+    acquire_media(filename)
+    db.session.commit()
+
+    remove_unreferenced_media(filename)
+    assert os.path.exists(get_media_path(filename))
+
+    released = release_media(filename)
+    db.session.commit()
+    remove_unreferenced_media(*released)
+    assert not os.path.exists(get_media_path(filename))
+    assert ref_count(filename) is None
+
+
+def test_protocols_share_identical_uploads(app, worker_client, admin_client):
+    # Requests run without an outer app context, which would share `g` between the clients
+    content = b'%PDF-1.7\n' + uuid.uuid4().bytes
+    with app.app_context():
+        topic_id = str(Topic.query.first().id)
+    ids = []
+    for _ in range(2):
+        response = worker_client.post('/user/create', headers={'Accept': 'application/json'}, data={
+            'topic_id': topic_id,
+            'media': (io.BytesIO(content), 'scan.pdf'),
+        })
+        assert response.status_code == 200
+        ids.append(response.json['id'])
+    with app.app_context():
+        filenames = {db.session.get(Request, id).attachments[0].filename for id in ids}
+        assert len(filenames) == 1
+        filename = filenames.pop()
+        path = get_media_path(filename)
+        assert ref_count(filename) == 2
+
+    admin_client.post(f'/admin/requests/{ids[0]}/delete')
+    with app.app_context():
+        assert ref_count(filename) == 1
+    assert os.path.exists(path)
+
+    admin_client.post(f'/admin/requests/{ids[1]}/delete')
+    with app.app_context():
+        assert ref_count(filename) is None
+    assert not os.path.exists(path)
+    assert not [name for name in os.listdir(app.config['UPLOAD_FOLDER']) if name.startswith('.upload-')]
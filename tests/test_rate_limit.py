@@ -0,0 +1,80 @@
+import types
+import uuid
+import pytest
+from services import rate_limit
+from services.rate_limit import MemoryBucketStore, DatabaseBucketStore
+
+CAPACITY = 3
+RATE = 0.1  # tokens per second: 6 per minute
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Stands in for both time.monotonic (memory store) and time.time (database store)."""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'time', types.SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(params=['memory', 'database'])
+def store(request):
+    if request.param == 'memory':
+        return MemoryBucketStore()
+    request.getfixturevalue('app_context')
+    return DatabaseBucketStore()
+
+
+@pytest.fixture
+def key():
+    return f'test:{uuid.uuid4().hex}'
+
+
+def drain(store, key):
+    for _ in range(CAPACITY):
+        assert store.consume(key, CAPACITY, RATE) == (True, 0)
+
+
+def test_full_bucket_allows_capacity_then_refuses(clock, store, key):
+    drain(store, key)
+    allowed, retry_after = store.consume(key, CAPACITY, RATE)
+    assert not allowed
+    assert retry_after == pytest.approx(1 / RATE)
+
+
+def test_bucket_refills_at_its_rate(clock, store, key):
+    drain(store, key)
+    clock[0] += 4
+    allowed, retry_after = store.consume(key, CAPACITY, RATE)
+    assert not allowed
+    assert retry_after == pytest.approx(6)
+    clock[0] += 6
+    assert store.consume(key, CAPACITY, RATE)[0]
+    assert not store.consume(key, CAPACITY, RATE)[0]
+
+
+def test_refill_stops_at_capacity(clock, store, key):
+    drain(store, key)
+    clock[0] += 3600
+    drain(store, key)
+    assert not store.consume(key, CAPACITY, RATE)[0]
+
+
+def test_refund_gives_a_token_back(clock, store, key):
+    drain(store, key)
+    store.refund(key, CAPACITY)
+    assert store.consume(key, CAPACITY, RATE)[0]
+    assert not store.consume(key, CAPACITY, RATE)[0]
+
+
+def test_refund_stops_at_capacity(clock, store, key):
+    assert store.consume(key, CAPACITY, RATE)[0]
+    store.refund(key, CAPACITY)
+    store.refund(key, CAPACITY)
+    drain(store, key)
+    assert not store.consume(key, CAPACITY, RATE)[0]
+
+
+def test_refund_of_unknown_bucket_is_ignored(clock, store, key):
+    store.refund(key, CAPACITY)
+    drain(store, key)
+    assert not store.consume(key, CAPACITY, RATE)[0]
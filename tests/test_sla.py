@@ -0,0 +1,78 @@
+import math
+import random
+from datetime import datetime, timedelta
+import pytest
+from extensions import db
+from models import Request, Topic
+from services.sla import LatencySketch, PERCENTILES, _compute_sla
+
+
+def percentile_cont(values, q):
+    """PostgreSQL's percentile_cont(): linear interpolation between the nearest ranks."""
+    values = sorted(values)
+    rank = q * (len(values) - 1)
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def sketch_of(values):
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize('values', [
+    # Read times around an hour, with a long tail
+    [random.Random(1).lognormvariate(math.log(3600), 1.5) for _ in range(20000)],
+    # Evenly spread from a minute to a month on a log scale
+    [math.exp(random.Random(2).uniform(math.log(60), math.log(30 * 86400))) for _ in range(5000)],
+    # Few protocols: the percentiles fall between far-apart values
+    [300, 900, 4000, 86400, 172800],
+], ids=['lognormal', 'log-uniform', 'sparse'])
+def test_sketch_matches_percentile_cont(values):
+    sketch = sketch_of(values)
+    assert sketch.total == len(values)
+    for q in PERCENTILES:
+        exact = percentile_cont(values, q)
+        if len(values) > 100:
+            assert sketch.percentile(q) == pytest.approx(exact, rel=0.02)
+        else:
+            # Nearest rank instead of interpolation, within the bucket width
+            assert min(abs(sketch.percentile(q) / value - 1) for value in values) <= 0.01
+
+
+def test_sketch_memory_is_bounded_by_the_spread():
+    rng = random.Random(3)
+    sketch = sketch_of(rng.uniform(60, 30 * 86400) for _ in range(100000))
+    assert len(sketch.counts) <= math.log(30 * 86400 / 60, LatencySketch.GROWTH) + 2
+
+
+def test_sketch_edge_cases():
+    assert LatencySketch().percentile(0.5) is None
+    assert sketch_of([0, 0.4, 0.9]).percentile(0.99) == 0.0
+
+
+def test_streaming_aggregate_matches_percentile_cont(app, app_context, worker):
+    rng = random.Random(4)
+    topic = Topic(title='SLA')
+    db.session.add(topic)
+    db.session.flush()
+    start = datetime(2020, 3, 2, 6)
+    read_seconds = []
+    for i in range(500):
+        created_at = start + timedelta(minutes=i)
+        read = rng.lognormvariate(math.log(1800), 1.2)
+        read_seconds.append(read)
+        db.session.add(Request(user_id=worker, topic_id=topic.id, created_at=created_at,
+                               admin_read_at=created_at + timedelta(seconds=read)))
+    # Unread protocols count for neither percentile
+    db.session.add(Request(user_id=worker, topic_id=topic.id, created_at=start))
+    db.session.commit()
+
+    sla = _compute_sla('2020-03-01', '2020-03-31', 'UTC', 60)
+    row = next(row for row in sla['topics'] if row['title'] == 'SLA')
+    assert row['read']['count'] == 500
+    assert row['reply']['count'] == 0
+    for q in PERCENTILES:
+        assert row['read'][f'p{round(q * 100)}'] == pytest.approx(percentile_cont(read_seconds, q), rel=0.02)
@@ -0,0 +1,90 @@
+import hashlib
+import io
+import pytest
+from services.uploads import ValidatingStream, UploadRejected, SNIFF_BYTES, sniff_category
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01'
+PDF = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n1 0 obj\n'
+
+
+@pytest.mark.parametrize('head, category', [
+    (JPEG, 'image'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR', 'image'),
+    (b'RIFF\x10\x00\x00\x00WEBPVP8 ', 'image'),
+    (b'\x00\x00\x00\x20ftypisom\x00\x00\x02\x00', 'video'),
+    (b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81', 'video'),
+    (PDF, 'document'),
+    (b'PK\x03\x04\x14\x00\x06\x00\x08\x00\x00\x00!\x00', 'document'),
+    (b'<html><body>hello</body></html>', None),
+])
+def test_sniff_category(head, category):
+    assert sniff_category(head[:SNIFF_BYTES]) == category
+
+
+def test_accepts_matching_content_and_hashes_it():
+    data = JPEG + b'\x00' * 5000
+    stream = ValidatingStream(io.BytesIO(), 'image', max_size=10000)
+    # Small chunks: the head is collected across writes
+    for start in range(0, len(data), 7):
+        stream.write(data[start:start + 7])
+    stream.finish()
+    assert stream.size == len(data)
+    assert stream.stream.getvalue() == data
+    assert stream.sha256.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_rejects_content_of_another_category():
+    stream = ValidatingStream(io.BytesIO(), 'image', max_size=10000)
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(PDF + b'\x00' * 100)
+    assert excinfo.value.status == 415
+
+
+def test_rejects_once_the_limit_is_passed():
+    stream = ValidatingStream(io.BytesIO(), 'image', max_size=1024)
+    stream.write(JPEG + b'\x00' * (1024 - len(JPEG)))
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b'\x00')
+    assert excinfo.value.status == 413
+    # Nothing past the limit reached the container
+    assert len(stream.stream.getvalue()) == 1024
+
+
+def test_checks_short_files_when_complete():
+    stream = ValidatingStream(io.BytesIO(), 'document', max_size=1024)
+    stream.write(b'%PDF-')
+    stream.finish()
+
+    stream = ValidatingStream(io.BytesIO(), 'document', max_size=1024)
+    stream.write(b'hello')
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.finish()
+    assert excinfo.value.status == 415
+
+
+def test_empty_file_is_not_sniffed():
+    stream = ValidatingStream(io.BytesIO(), 'image', max_size=1024)
+    stream.finish()
+    assert stream.size == 0
+
+
+def post_protocol(app, client, filename, data):
+    from models import Topic
+    with app.app_context():
+        topic_id = str(Topic.query.first().id)
+    return client.post('/user/create', headers={'Accept': 'application/json'}, data={
+        'topic_id': topic_id,
+        'media': (io.BytesIO(data), filename),
+    })
+
+
+def test_create_request_refuses_disguised_file(app, worker_client):
+    response = post_protocol(app, worker_client, 'photo.jpg', PDF + b'\x00' * 100)
+    assert response.status_code == 415
+    assert response.json['success'] is False
+
+
+def test_create_request_refuses_oversized_file(app, worker_client):
+    limit = app.config['UPLOAD_SIZE_LIMITS']['document']
+    response = post_protocol(app, worker_client, 'scan.pdf', PDF + b'\x00' * limit)
+    assert response.status_code == 413